@@ -9,6 +9,20 @@ AUTHORS ::
 """
 from json import JSONEncoder
 from copy import copy
+try:
+    from .francy_index import cached, AdjacencyIndex
+    from .francy_hierarchy import hierarchy, hasse_diagram
+    from .francy_sage import graph_view
+    from .francy_sampling import sample_nodes, induced_edges, SAMPLING_STRATEGIES
+    from .francy_labels import labels as default_labels, truncate, SHORT_LABEL_LENGTH
+    from .francy_ids import IdMap
+except:
+    from francy_index import cached, AdjacencyIndex # for doctesting
+    from francy_hierarchy import hierarchy, hasse_diagram
+    from francy_sage import graph_view
+    from francy_sampling import sample_nodes, induced_edges, SAMPLING_STRATEGIES
+    from francy_labels import labels as default_labels, truncate, SHORT_LABEL_LENGTH
+    from francy_ids import IdMap
 FRANCY_NODE_TYPES = ['circle', 'diamond', 'square']
 
 
@@ -72,7 +86,8 @@ class GraphEdge(fdict):
             ('color', ''),
             ('invisible', None),
             ('length', None),
-            ('target', None)
+            ('target', None),
+            ('count', None)
         ], **kwargs)
 
 
@@ -178,20 +193,27 @@ class FrancyOutput:
         d = copy(self.__dict__)
         del d['counter']
         del d['encoder']
-        for k in ['obj', 'conjugate', 'node_options', 'link_options', 'is_method']:
+        for k in [k for k in d if k.startswith('_')]:
+            # Private (kernel-side) attributes
+            del d[k]
+        for k in ['obj', 'conjugate', 'node_options', 'link_options', 'aggregate_options',
+                  'is_method', 'memoize']:
             if k in d:
                 # A math value or a function
                 del d[k]
-        for k in ['canvas', 'graph', 'callback']:
+        for k in ['canvas', 'graph', 'callback', 'timeline']:
             if k in d and d[k] and not isinstance(d[k], dict):
                 d[k] = d[k].to_dict()
         for k in ['menus', 'messages']:
             if k in d:
                 if not isinstance(d[k], dict):
                     raise TypeError(d[k])
-                mm = d[k]
-                for fid, m in mm.items():
-                    mm[fid] = m.to_dict()
+                mm = {}  # Do not alter the object's own children
+                for fid, m in d[k].items():
+                    if isinstance(m, dict):
+                        mm[fid] = m
+                    else:
+                        mm[fid] = m.to_dict()
                 d[k] = mm
         return d
 
@@ -262,8 +284,14 @@ class FrancyAdapter(FrancyOutput):
             for msg in kws['messages']:
                 self.canvas.add_message(msg)
             del kws['messages']
+        timeline = None
+        if 'timeline' in kws:
+            timeline = kws['timeline']
+            del kws['timeline']
         if obj:
             self.canvas.set_graph(obj, **kws)
+            if timeline:
+                self.canvas.set_timeline(timeline)
         d = super(FrancyAdapter, self).to_dict()
         return d
 
@@ -292,6 +320,37 @@ class FrancyAdapter(FrancyOutput):
         """
         return self.encoder.encode(self.to_dict(obj, **kws))
 
+    def canvas_json(self, nodes=None, links=None):
+        r"""
+        JSON serialization of the current canvas, as it is now,
+        without computing it again.
+
+        Input:
+
+        * nodes -- a list of node identifiers: only these nodes are serialized (default: all)
+        * links -- a list of link identifiers: only these links are serialized (default: all)
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> a = FrancyAdapter()
+        >>> _ = a.to_json(path_graph(5), base_id='mycanvas', focus=0)
+        >>> len(a.canvas.graph.nodes)
+        2
+        >>> _ = a.canvas.graph.expand(1)
+        >>> a.canvas_json().count('"title": "2"')
+        1
+        >>> a.canvas_json(['mycanvas_node3'], []).count('"source"')
+        0
+        """
+        d = super(FrancyAdapter, self).to_dict()
+        graph = self.canvas.graph
+        if nodes is not None:
+            d['canvas']['graph']['nodes'] = dict((ident, graph.nodes[ident]) for ident in nodes)
+        if links is not None:
+            d['canvas']['graph']['links'] = dict((ident, graph.links[ident]) for ident in links)
+        return self.encoder.encode(d)
+
 
 class FrancyCanvas(FrancyOutput):
     r"""
@@ -319,8 +378,10 @@ class FrancyCanvas(FrancyOutput):
         self.zoomToFit = zoomToFit
         self.texTypesetting = texTypesetting
         self.graph = None
+        self.timeline = None
         self.menus = {}
         self.messages = {}
+        self._spatial = None  # Spatial index over the graph nodes, built on request
 
     def set_graph(self, graph, **kws):
         r"""
@@ -345,8 +406,80 @@ class FrancyCanvas(FrancyOutput):
         >>> FC.set_graph(G, node_options=node_options)
         >>> FC.to_json()
         '{"id": "mycanvas", "title": "My Canvas", "width": 800.0, "height": 100.0, "zoomToFit": true, "texTypesetting": false, "graph": {"id": "mycanvas_graph2", "simulation": true, "collapsed": true, "drag": false, "showNeighbours": false, "nodes": {"mycanvas_node3": {"id": "mycanvas_node3", "x": 0, "y": 0, "type": "square", "size": 10, "title": "1", "color": "", "highlight": true, "layer": 3, "parent": "", "menus": {"mycanvas_menu4": {"id": "mycanvas_menu4", "title": "cardinality", "callback": {"id": "mycanvas_callback4", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node4": {"id": "mycanvas_node4", "x": 0, "y": 0, "type": "square", "size": 10, "title": "2", "color": "", "highlight": true, "layer": 4, "parent": "", "menus": {"mycanvas_menu5": {"id": "mycanvas_menu5", "title": "cardinality", "callback": {"id": "mycanvas_callback5", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node5": {"id": "mycanvas_node5", "x": 0, "y": 0, "type": "square", "size": 10, "title": "3", "color": "", "highlight": true, "layer": 5, "parent": "", "menus": {"mycanvas_menu6": {"id": "mycanvas_menu6", "title": "cardinality", "callback": {"id": "mycanvas_callback6", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node6": {"id": "mycanvas_node6", "x": 0, "y": 0, "type": "square", "size": 10, "title": "4", "color": "", "highlight": true, "layer": 6, "parent": "", "menus": {"mycanvas_menu7": {"id": "mycanvas_menu7", "title": "cardinality", "callback": {"id": "mycanvas_callback7", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}}, "links": {"mycanvas_edge7": {"source": "mycanvas_node3", "weight": 1, "color": "", "target": "mycanvas_node4", "id": "mycanvas_edge7"}, "mycanvas_edge8": {"source": "mycanvas_node4", "weight": 1, "color": "", "target": "mycanvas_node5", "id": "mycanvas_edge8"}, "mycanvas_edge9": {"source": "mycanvas_node5", "weight": 1, "color": "", "target": "mycanvas_node6", "id": "mycanvas_edge9"}}, "type": "undirected"}, "menus": {}, "messages": {}}'
+
+        When the graph is sampled, the canvas tells what was left out:
+
+        >>> from networkx import path_graph
+        >>> FC = FrancyCanvas(base_id='mycanvas')
+        >>> FC.set_graph(path_graph(100), sample='uniform', max_nodes=10, seed=0)
+        >>> [m.text for m in FC.messages.values()]
+        ['Showing a sample (uniform): 90 nodes and 98 edges were left out.']
         """
         self.graph = FrancyGraph(graph, self.id, self.counter, **kws)
+        self._spatial = None
+        if self.graph.dropped:
+            self.add_message("Showing a sample (%s): %d nodes and %d edges were left out." % (
+                self.graph._sample, self.graph.dropped['nodes'], self.graph.dropped['edges']),
+                'warning', 'Sample')
+
+    def spatial(self):
+        r"""
+        The spatial index over the graph nodes (see `francy_spatial`),
+        built on first use, and kept up to date when nodes are added.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> FC = FrancyCanvas(base_id='mycanvas')
+        >>> FC.set_graph(path_graph(10), positions=dict((n, (n, 0)) for n in range(10)), focus=0, radius=2)
+        >>> sorted(FC.spatial().window(0, 0, 5, 5))
+        ['mycanvas_node3', 'mycanvas_node4', 'mycanvas_node5']
+        >>> _ = FC.graph.expand('mycanvas_node5')
+        >>> sorted(FC.spatial().window(0, 0, 5, 5))
+        ['mycanvas_node3', 'mycanvas_node4', 'mycanvas_node5', 'mycanvas_node8']
+        """
+        try:
+            from .francy_spatial import SpatialIndex
+        except:
+            from francy_spatial import SpatialIndex # for doctesting
+        if self._spatial is None or self._spatial.graph is not self.graph:
+            self._spatial = SpatialIndex(self.graph)
+        elif len(self._spatial) != len(self.graph.nodes):
+            # Index the nodes added since
+            indexed = set(self._spatial.window(*self._spatial.bounds))
+            new = [ident for ident in self.graph.nodes if ident not in indexed]
+            if not self._spatial.update(new):
+                self._spatial = SpatialIndex(self.graph)
+        return self._spatial
+
+    def set_timeline(self, steps):
+        r"""
+        Input:
+
+        * steps -- a list of step changes, as accepted by FrancyTimeline.add_step
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> FC = FrancyCanvas(base_id='mycanvas')
+        >>> FC.set_graph(Graph([(1, 2), (2, 3)]))
+        >>> FC.set_timeline([{'nodes': {1: {'color': 'red'}}}, {'remove_links': [(2, 3)]}])
+        >>> FC.to_dict()['timeline']
+        {'id': 'mycanvas_timeline2', 'steps': [{'nodes': {'mycanvas_node3': {'color': 'red'}}}, {'removeLinks': ['mycanvas_edge7']}]}
+        """
+        if not self.graph:
+            raise ValueError("A timeline needs a graph to start from.")
+        try:
+            from .francy_timeline import FrancyTimeline
+        except:
+            from francy_timeline import FrancyTimeline # for doctesting
+        self.timeline = FrancyTimeline(self.graph, steps, self.id, self.counter)
+
+    def to_dict(self):
+        res = super(FrancyCanvas, self).to_dict()
+        if res['timeline'] is None:
+            del res['timeline']
+        return res
 
     def add_menu(self, menu):
         r"""
@@ -370,10 +503,23 @@ class FrancyCanvas(FrancyOutput):
         * text -- a string
         * title -- a string
         * msgType -- message type
+
+        Output:
+
+        The FrancyMessage object.
+
+        Test:
+
+        >>> FC = FrancyCanvas(base_id='mycanvas')
+        >>> FC.add_message("There are 8 levels in this Group.").to_json()
+        '{"id": "mycanvas_message3", "type": "default", "title": "", "text": "There are 8 levels in this Group."}'
+        >>> list(FC.messages)
+        ['mycanvas_message3']
         """
         self.counter += 1
-        fid = francy_id(self.id, 'message', self.counter)
-        self.messages[fid] = FrancyMessage(text=text, title=title, msgType=msgType)
+        msg = FrancyMessage(self.id, self.counter, text=text, title=title, msgType=msgType)
+        self.messages[msg.id] = msg
+        return msg
 
 
 class FrancyCallback(FrancyOutput):
@@ -390,7 +536,8 @@ class FrancyCallback(FrancyOutput):
     >>> c.to_json()
     '{"id": "mycanvas_callback2", "funcname": "cardinality", "trigger": "click", "knownArgs": ["<object>", "{1,2,3}"], "requiredArgs": {}}'
     """
-    def __init__(self, canvas_id=None, counter=0, funcname=None, is_method=False, trigger="click", knownArgs=[], requiredArgs={}):
+    def __init__(self, canvas_id=None, counter=0, funcname=None, is_method=False, trigger="click", knownArgs=[], requiredArgs={},
+                 memoize=False):
         r"""
         Input:
 
@@ -402,6 +549,7 @@ class FrancyCallback(FrancyOutput):
         * trigger -- a string
         * knownArgs -- a list of strings
         * requiredArgs -- a dict
+        * memoize -- a boolean: whether the results, without side effects, can be reused
         """
         super(FrancyCallback, self).__init__(canvas_id, 'callback', counter)
         self.funcname = funcname
@@ -409,6 +557,7 @@ class FrancyCallback(FrancyOutput):
         self.trigger = trigger
         self.knownArgs = knownArgs
         self.requiredArgs = requiredArgs
+        self.memoize = memoize
 
 
 class FrancyMenu(FrancyOutput):
@@ -483,9 +632,10 @@ class FrancyMenu(FrancyOutput):
             required_args = data['required_args']
         else:
             required_args = {}
+        memoize = data.get('memoize', False)
         return cls(canvas_id, counter, title=title, callback=FrancyCallback(
             canvas_id, counter, funcname=funcname, is_method=is_method, knownArgs=known_args,
-            requiredArgs=required_args)
+            requiredArgs=required_args, memoize=memoize)
         )
 
 
@@ -505,10 +655,56 @@ class FrancyGraph(FrancyOutput):
     def __init__(self, obj, canvas_id=None, counter=0, graphType='undirected',
                  simulation=True, collapsed=True, drag=False, showNeighbours=False,
                  nodeType='circle', nodeSize=10, color="", highlight=True, weight=1,
-                 node_options=None, link_options=None):
+                 node_options=None, link_options=None, focus=None, radius=1, max_nodes=None,
+                 multiedges='separate', aggregate_options=None, transitive_reduction=False,
+                 sample=None, max_edges=None, seed=None, labels=None, lazy_labels=False,
+                 stable_ids=False, node_key=None, id_map=None, node_table=None, node_styles=None,
+                 link_styles=None, link_batch_options=None, positions=None):
+        r"""
+        Input:
+
+        * obj -- a graph object (a networkx graph, or a Sage graph or poset)
+        * canvas_id -- a string
+        * counter -- an integer
+        * multiedges -- for multigraphs: 'separate' (one link per edge)
+          or 'aggregate' (one link per pair of nodes, with the edge count as weight)
+        * aggregate_options -- a function of (source, target, list of edge data dicts),
+          returning a dictionary of options for an aggregated link
+        * focus -- a node: only display its neighbourhood
+        * radius -- an integer: the size of that neighbourhood
+        * max_nodes -- an integer: the maximum number of displayed (or added) nodes
+        * transitive_reduction -- a boolean: for an order relation (an acyclic directed graph),
+          only display the cover relations (the Hasse diagram)
+        * sample -- a sampling strategy, for graphs with more than `max_nodes` nodes
+          or `max_edges` edges: 'uniform', 'random_walk', 'forest_fire' or 'top_degree'
+        * max_edges -- an integer: the maximum number of displayed edges, when sampling
+        * seed -- a seed, for reproducible samples
+        * labels -- a label cache, for node titles (by default, the one of the kernel)
+        * lazy_labels -- a boolean: node titles are first sent shortened
+          (to SHORT_LABEL_LENGTH characters), and full titles are only sent on request,
+          for the nodes that are shown or hovered; this needs a frontend sending
+          'labels' requests (see `FrancyWidget.labels`), which the stock Francy frontend does not
+        * stable_ids -- a boolean: node and link identifiers are derived from the node objects,
+          instead of being numbered
+        * node_key -- a function of the node object, returning the key its identifier
+          is derived from (implies `stable_ids`); distinct nodes must have distinct keys
+        * id_map -- an IdMap object, keeping stable identifiers across renderings (implies `stable_ids`)
+        * node_table -- a table of node attributes: a pandas DataFrame indexed by the nodes,
+          or a dictionary column name -> dictionary node -> value
+        * node_styles -- a dictionary node option -> column name or NodeStyle object
+          (see `francy_styles`), computing node options from the table;
+          `node_options` come on top of them
+        * link_styles -- a dictionary link option -> edge attribute name or NodeStyle object,
+          computing link options from the edge data of the graph
+        * link_batch_options -- a function of the list of edges and the list of their data,
+          returning a dictionary link option -> list of values, for all links at once;
+          `link_options` come on top of them
+        * positions -- node coordinates: a dictionary node -> (x, y),
+          or a function of the graph returning one (such as a networkx layout)
+        """
         super(FrancyGraph, self).__init__(canvas_id, 'graph', counter)
         self.canvas_id = canvas_id
-        self.obj = obj
+        self.obj = graph_view(obj)  # Sage graphs and posets are read directly
         self.graphType = graphType
         if graphType == "tree":
             self.nodeLayer = 0
@@ -528,6 +724,35 @@ class FrancyGraph(FrancyOutput):
         self.weight = int(weight)  # Default value for the links
         self.node_options = node_options  # A function of the node, returning a dictionary
         self.link_options = link_options  # A function of the link, returning a dictionary
+        if multiedges not in ['separate', 'aggregate']:
+            raise ValueError("Multiple edges must be 'separate' or 'aggregate'")
+        self.multiedges = multiedges
+        self.aggregate_options = aggregate_options
+        self.transitive_reduction = transitive_reduction
+        self._focus = focus
+        self._radius = int(radius)
+        self._max_nodes = max_nodes
+        if sample is not None:
+            if sample not in SAMPLING_STRATEGIES:
+                raise ValueError("Sampling strategy must be one of: %s" % ', '.join(SAMPLING_STRATEGIES))
+            if not max_nodes and not max_edges:
+                raise ValueError("Sampling needs a node or edge budget")
+        self._sample = sample
+        self._max_edges = max_edges
+        self._seed = seed
+        self.dropped = None  # What sampling left out
+        self._labels = labels or default_labels
+        self._lazy_labels = lazy_labels
+        if id_map is None and (stable_ids or node_key):
+            id_map = IdMap(node_key)
+        self._id_map = id_map
+        self._node_table = node_table
+        self._node_styles = node_styles
+        self._link_styles = link_styles
+        self._link_batch_options = link_batch_options
+        self._positions = positions
+        if id_map is not None and not canvas_id:
+            self.canvas_id = francy_id(None, 'canvas')  # One base for all identifiers
         self.compute()
 
     def compute(self):
@@ -551,6 +776,14 @@ class FrancyGraph(FrancyOutput):
         >>> g.compute()
         >>> g.to_json()
         '{"id": "mycanvas_graph1", "simulation": true, "collapsed": true, "drag": false, "showNeighbours": false, "nodes": {"mycanvas_node2": {"id": "mycanvas_node2", "x": 0, "y": 0, "type": "diamond", "size": 10, "title": "1", "color": "", "highlight": true, "layer": 2, "parent": "", "menus": {"mycanvas_menu3": {"id": "mycanvas_menu3", "title": "cardinality", "callback": {"id": "mycanvas_callback3", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node3": {"id": "mycanvas_node3", "x": 0, "y": 0, "type": "diamond", "size": 10, "title": "2", "color": "", "highlight": true, "layer": 3, "parent": "", "menus": {"mycanvas_menu4": {"id": "mycanvas_menu4", "title": "cardinality", "callback": {"id": "mycanvas_callback4", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node4": {"id": "mycanvas_node4", "x": 0, "y": 0, "type": "diamond", "size": 10, "title": "3", "color": "", "highlight": true, "layer": 4, "parent": "", "menus": {"mycanvas_menu5": {"id": "mycanvas_menu5", "title": "cardinality", "callback": {"id": "mycanvas_callback5", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node5": {"id": "mycanvas_node5", "x": 0, "y": 0, "type": "diamond", "size": 10, "title": "4", "color": "", "highlight": true, "layer": 5, "parent": "", "menus": {"mycanvas_menu6": {"id": "mycanvas_menu6", "title": "cardinality", "callback": {"id": "mycanvas_callback6", "funcname": "cardinality", "trigger": "click", "knownArgs": [], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}}, "links": {"mycanvas_edge6": {"source": "mycanvas_node2", "weight": 1, "color": "", "target": "mycanvas_node3", "id": "mycanvas_edge6"}, "mycanvas_edge7": {"source": "mycanvas_node3", "weight": 1, "color": "", "target": "mycanvas_node4", "id": "mycanvas_edge7"}, "mycanvas_edge8": {"source": "mycanvas_node4", "weight": 1, "color": "", "target": "mycanvas_node5", "id": "mycanvas_edge8"}}, "type": "undirected"}'
+
+        Links can be styled from the edge data:
+
+        >>> from francy_styles import ColorScale
+        >>> G = Graph([(1, 2, {'weight': 1}), (2, 3, {'weight': 4})])
+        >>> FG = FrancyGraph(G, 'mycanvas', link_styles={'weight': 'weight', 'color': ColorScale('weight', ['#000000', '#ffffff'])})
+        >>> [(link['weight'], link['color']) for link in FG.links.values()]
+        [(1, '#000000'), (4, '#ffffff')]
         """
         counter = self.counter
         if not self.graphType:
@@ -559,100 +792,521 @@ class FrancyGraph(FrancyOutput):
             else:
                 self.graphType = "undirected"
         self.nodes = {}
-        global FRANCY_NODE_TYPES
         # Keep track of node identifiers
-        match = {}
-        for n in self.obj.nodes():
+        self._ids = {}
+        self._objs = {}  # The node index: node identifier -> math object
+        self._callbacks = {}  # (node identifier, function name) -> FrancyCallback
+        self._titles = {}  # Lazy labels: node identifier -> full title, not sent yet
+        self._query = None  # Attribute indexes, built on the first query
+        multi = self.obj.is_multigraph()
+        self.dropped = None
+        if self._focus is None and self.over_budget():
+            # Only a sample of the nodes, and of the edges between them
+            if self._max_nodes:
+                nodes = sample_nodes(self.obj, self._sample, self._max_nodes, self._seed)
+            else:
+                nodes = list(self.obj.nodes())
+            edges = induced_edges(self.obj, nodes, self._max_edges,
+                                  keys=multi and self.multiedges == 'separate')
+            self.dropped = {'nodes': len(self.obj) - len(nodes),
+                            'edges': self.obj.size() - len(edges)}
+        elif self._focus is None:
+            nodes = self.obj.nodes()
+            if self.transitive_reduction:
+                index = self.adjacency()
+                edges = ((n, m) for n in nodes for m in index.succ[n])
+            elif multi and self.multiedges == 'separate':
+                edges = self.obj.edges(keys=True)
+            else:
+                edges = self.obj.edges()
+        else:
+            # Only the neighbourhood of the focus node
+            index = self.adjacency()
+            nodes = index.ball(self._focus, self._radius, self._max_nodes)
+            edges = index.links(nodes, {}, keys=multi and self.multiedges == 'separate')
+        if multi and self.multiedges == 'aggregate':
+            edges = self.parallel_edges(edges)
+        link_rows = None
+        self._link_scales = None
+        if self._link_styles or self._link_batch_options:
+            # Options for all links at once, from the edge data
+            try:
+                from .francy_styles import bounded_styles, style_links
+            except:
+                from francy_styles import bounded_styles, style_links # for doctesting
+            if self._focus is None and not self.dropped and not self.transitive_reduction \
+               and not (multi and self.multiedges == 'aggregate'):
+                # Read in bulk
+                if multi and self.multiedges == 'separate':
+                    triples = list(self.obj.edges(keys=True, data=True))
+                else:
+                    triples = list(self.obj.edges(data=True))
+                edges = [e[:-1] for e in triples]
+                data = [e[-1] for e in triples]
+            else:
+                edges = list(edges)
+                data = [self.edge_data(e) for e in edges]
+            if self._link_styles:
+                # Same scales for the links added on expansion
+                self._link_scales = bounded_styles(self._link_styles, data)
+            link_rows = style_links([e[:3] for e in edges], data,
+                                    self._link_scales, self._link_batch_options)
+        if callable(self._positions):
+            self._positions = self._positions(self.obj)  # A layout, computed once
+        self._styles = None
+        if self._node_styles:
+            # Options for all nodes at once, from the attribute table
+            try:
+                from .francy_styles import style_table
+            except:
+                from francy_styles import style_table # for doctesting
+            self._styles = style_table(self._node_table, self._node_styles, self.obj.nodes())
+        if self.graphType in ['tree', 'directed']:
+            # Layers from ranks, parents from a spanning forest
+            self._hierarchy = hierarchy(self.obj)
+        else:
+            self._hierarchy = None
+        for n in nodes:
             counter += 1
-            ident = francy_id(self.canvas_id, 'node', counter)
-            match[n] = ident
-            # Calculate node options
-            options = {'title': '', 'parent': ''}
-            menus = None
-            messages = None
-            # Node parent (for trees only)
-            if self.graphType == 'tree' and hasattr(n, 'parent') and n.parent():
-                options['parent'] = n.parent()
-            # Other options
-            if self.nodeType:
-                options['type'] = self.nodeType  # Initialization from graph value
-            if self.nodeSize:
-                options['size'] = self.nodeSize  # Initialization from graph value
-            if self.nodeLayer:
-                options['layer'] = self.nodeLayer  # Initialization from graph value
-            for parm in ['color', 'highlight', 'conjugate']:
-                if hasattr(self, parm):
-                    options[parm] = getattr(self, parm)  # Initialization from graph values
-            if self.node_options:
-                node_specifics = self.node_options(n)
-                for optname in ['layer', 'conjugate']:  # Typecasting (for Sage Integers ..)
-                    if optname in node_specifics:
-                        node_specifics[optname] = int(node_specifics[optname])
-                for optname in ['title']:
-                    if optname in node_specifics:
-                        node_specifics[optname] = str(node_specifics[optname])
-                if 'type' in node_specifics:
-                    if node_specifics['type'] not in FRANCY_NODE_TYPES:
-                        raise TypeError(
-                            "Node type must be one of: %s" % ', '.join(FRANCY_NODE_TYPES))
-                if 'modal_menus' in node_specifics:
-                    menus = {}
-                    for m in node_specifics['modal_menus']:
-                        men = FrancyMenu.from_dict(self.canvas_id, counter, data=m)
-                        menus[men.id] = men.to_dict()
-                    options['menus'] = menus
-                    del node_specifics['modal_menus']
-                options.update(node_specifics)
-            if 'title' not in options or not options['title']:
-                options['title'] = str(n)
-            if 'layer' not in options or options['layer'] is None:
-                options['layer'] = int(counter)  # TODO remplacer par un compteur de nœuds
-            for children_list_name in ['menus', 'messages', 'callbacks']:
-                if children_list_name not in options:
-                    options[children_list_name] = {}
-            self.nodes[ident] = GraphNode(
-                id=ident,
-                **options)
+            self.add_node(n, counter)
+        self.set_parents(nodes)
         # Links
         self.links = {}
-        for (src, tgt) in self.obj.edges():
+        for i, e in enumerate(edges):
             counter += 1
+            self.add_link(e[0], e[1], counter, *e[2:], options=link_rows and link_rows[i])
+        self._last_counter = counter
+
+    def add_node(self, n, counter):
+        r"""
+        Build a graph node.
+
+        Input:
+
+        * n -- a math object
+        * counter -- an integer, for the node identifier
+
+        Output:
+
+        The node identifier.
+        """
+        if self._id_map is not None:
+            ident = self._id_map.node_id(self.canvas_id, n, self._objs)
+        else:
+            ident = francy_id(self.canvas_id, 'node', counter)
+        self._ids[n] = ident
+        self._objs[ident] = n
+        # Calculate node options
+        options = {'title': '', 'parent': ''}
+        menus = None
+        messages = None
+        # Other options
+        if self.nodeType:
+            options['type'] = self.nodeType  # Initialization from graph value
+        if self.nodeSize:
+            options['size'] = self.nodeSize  # Initialization from graph value
+        if self.nodeLayer:
+            options['layer'] = self.nodeLayer  # Initialization from graph value
+        for parm in ['color', 'highlight', 'conjugate']:
+            if hasattr(self, parm):
+                options[parm] = getattr(self, parm)  # Initialization from graph values
+        if self._positions and n in self._positions:
+            options['x'], options['y'] = [float(c) for c in self._positions[n]]
+        if self._styles and n in self._styles[0]:
+            row = self._styles[0][n]
+            for optname, values in self._styles[1].items():
+                if values[row] is not None:
+                    options[optname] = values[row]  # From the attribute table
+        if self.node_options:
+            node_specifics = self.node_options(n)
+            for optname in ['layer', 'conjugate']:  # Typecasting (for Sage Integers ..)
+                if optname in node_specifics:
+                    node_specifics[optname] = int(node_specifics[optname])
+            title = node_specifics.pop('title', '')
+            if 'type' in node_specifics:
+                if node_specifics['type'] not in FRANCY_NODE_TYPES:
+                    raise TypeError(
+                        "Node type must be one of: %s" % ', '.join(FRANCY_NODE_TYPES))
+            if 'modal_menus' in node_specifics:
+                menus = {}
+                for m in node_specifics['modal_menus']:
+                    men = FrancyMenu.from_dict(self.canvas_id, counter, data=m)
+                    self._callbacks[(ident, men.callback.funcname)] = men.callback
+                    menus[men.id] = men.to_dict()
+                options['menus'] = menus
+                del node_specifics['modal_menus']
+            options.update(node_specifics)
+        else:
+            title = ''
+        if isinstance(title, str) and not title:
+            title = n
+        options['title'] = self._labels.label(title)
+        if self._lazy_labels and len(options['title']) > SHORT_LABEL_LENGTH:
+            # The full title, on request
+            self._titles[ident] = options['title']
+            options['title'] = truncate(options['title'], SHORT_LABEL_LENGTH)
+        if 'layer' not in options or options['layer'] is None:
+            if self._hierarchy and n in self._hierarchy[0]:
+                options['layer'] = self._hierarchy[0][n]
+            else:
+                options['layer'] = int(counter)
+        for children_list_name in ['menus', 'messages', 'callbacks']:
+            if children_list_name not in options:
+                options[children_list_name] = {}
+        self.nodes[ident] = GraphNode(
+            id=ident,
+            **options)
+        return ident
+
+    def add_link(self, src, tgt, counter, key=None, parallel=None, options=None):
+        r"""
+        Build a graph link.
+
+        Input:
+
+        * src -- a math object, already a graph node
+        * tgt -- a math object, already a graph node
+        * counter -- an integer, for the link identifier
+        * key -- the edge key, for multigraphs
+        * parallel -- a list of edge data dicts, for an aggregated link
+        * options -- a dictionary of link options, computed from the edge data
+
+        Output:
+
+        The link identifier.
+        """
+        link_options = options
+        match = self._ids
+        if self._id_map is not None:
+            ident = self._id_map.link_id(self.canvas_id, match[src], match[tgt], key,
+                                         self.obj.is_directed())
+        else:
             ident = francy_id(self.canvas_id, 'edge', counter)
-            # Calculate node options
-            options = {}
-            for parm in ['color', 'weight']:
-                if hasattr(self, parm):
-                    options[parm] = getattr(self, parm)
-            if self.link_options:
-                options.update(self.link_options(n))
-            self.links[ident] = GraphEdge(
-                id=ident,
-                source=match[src],
-                target=match[tgt],
-                **options
-            )
-            if self.graphType == 'tree':
-                tgtNode = self.nodes[match[tgt]]
-                if (not hasattr(tgtNode, 'parent') or not getattr(tgtNode, 'parent')):
-                    self.nodes[match[tgt]]['parent'] = self.nodes[match[src]]['id']
+        # Calculate link options
+        options = {}
+        for parm in ['color', 'weight']:
+            if hasattr(self, parm):
+                options[parm] = getattr(self, parm)
+        if parallel is not None:
+            options['count'] = len(parallel)
+            options['weight'] = len(parallel)
+            if self.aggregate_options:
+                options.update(self.aggregate_options(src, tgt, parallel))
+        if link_options:
+            options.update(link_options)
+        if self.link_options:
+            if key is None:
+                options.update(self.link_options((src, tgt)))
+            else:
+                options.update(self.link_options((src, tgt, key)))
+        self.links[ident] = GraphEdge(
+            id=ident,
+            source=match[src],
+            target=match[tgt],
+            **options
+        )
+        return ident
+
+    def label(self, ident):
+        r"""
+        The full title of a node, sent on request with lazy labels.
+
+        Input:
+
+        * ident -- a node identifier
+
+        Output:
+
+        The node title.
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> from francy_labels import LabelCache
+        >>> L = LabelCache(max_length=18)
+        >>> def node_options(n):
+        ...   return {'title': "Subgroup number %d of S4" % n}
+        >>> FG = FrancyGraph(Graph([(1, 2)]), 'mycanvas', node_options=node_options, labels=L, lazy_labels=True)
+        >>> [node['title'] for node in FG.nodes.values()], L.cache_info()['misses']
+        (['Subgroup ...', 'Subgroup ...'], 2)
+        >>> FG.label('mycanvas_node3')
+        'Subgroup number...'
+        >>> [node['title'] for node in FG.nodes.values()]
+        ['Subgroup ...', 'Subgroup number...']
+        """
+        node = self.nodes[ident]
+        if ident in self._titles:
+            node['title'] = self._titles.pop(ident)
+        return node['title']
+
+    def edge_data(self, e):
+        r"""
+        The data of an edge, as in `obj.edges(data=True)`.
+        For an aggregated link, numeric values are summed,
+        other values are taken from the first edge.
+
+        Input:
+
+        * e -- a (source, target) pair, a (source, target, key) triple,
+          or a (source, target, None, list of edge data dicts) tuple
+
+        Test:
+
+        >>> from networkx import MultiGraph, DiGraph
+        >>> G = MultiGraph([(1, 2, {'weight': 2, 'color': 'red'}), (1, 2, {'weight': 3})])
+        >>> FG = FrancyGraph(G, 'mycanvas')
+        >>> FG.edge_data((1, 2, 1)), FG.edge_data((1, 2, None, list(G[1][2].values())))
+        ({'weight': 3}, {'weight': 5, 'color': 'red'})
+        >>> FG = FrancyGraph(DiGraph([(1, 2, {'length': 4})]), 'mycanvas')
+        >>> FG.edge_data((1, 2))
+        {'length': 4}
         """
-        if self.graphType == "tree":
-            # specify node parents
-            for (src, tgt) in self.obj.edges:
-                tgtNode = self.nodes[match[tgt]]
-                if not hasattr(tgtNode, 'parent'):
-                    # NB because our GraphNodes here do no act as actual graph node
-                    # but only graph node JSON representation,
-                    # we can change them although they are supposedly immutable.
-                    self.nodes[match[tgt]]['parent'] = self.nodes[match[src]]['id']
+        if len(e) > 3 and e[3] is not None:
+            res = {}
+            for data in e[3]:
+                for k, v in data.items():
+                    if k not in res:
+                        res[k] = v
+                    elif isinstance(v, (int, float)) and isinstance(res[k], (int, float)):
+                        res[k] += v
+            return res
+        adjacency = self.obj[e[0]][e[1]]
+        if len(e) > 2 and e[2] is not None:
+            return adjacency[e[2]]
+        if self.obj.is_multigraph():
+            return next(iter(adjacency.values()))
+        return adjacency
+
+    def set_parents(self, nodes):
+        r"""
+        Node parents (for trees only), from the graph hierarchy.
+        A node parent is set only when that parent is displayed too.
+
+        Input:
+
+        * nodes -- a list of math objects, already graph nodes
+
+        Test:
+
+        >>> from networkx import balanced_tree
+        >>> FG = FrancyGraph(balanced_tree(2, 2), 'mycanvas', graphType='tree')
+        >>> [(node['title'], node['layer'], node['parent']) for node in FG.nodes.values()]
+        [('0', 0, ''), ('1', 1, 'mycanvas_node2'), ('2', 1, 'mycanvas_node2'), ('3', 2, 'mycanvas_node3'), ('4', 2, 'mycanvas_node3'), ('5', 2, 'mycanvas_node4'), ('6', 2, 'mycanvas_node4')]
         """
+        if self.graphType != 'tree' or not self._hierarchy:
+            return
+        parents = self._hierarchy[1]
+        for n in nodes:
+            node = self.nodes[self._ids[n]]
+            if not node['parent'] and parents.get(n) in self._ids:
+                # NB because our GraphNodes here do no act as actual graph node
+                # but only graph node JSON representation,
+                # we can change them although they are supposedly immutable.
+                node['parent'] = self._ids[parents[n]]
+
+    def parallel_edges(self, edges):
+        r"""
+        Merge the parallel edges of a multigraph, in one pass.
+
+        Input:
+
+        * edges -- an iterable of (source, target) pairs
+
+        Output:
+
+        An iterator over (source, target, None, list of edge data dicts),
+        once for every pair of adjacent nodes.
+
+        Test:
+
+        >>> from networkx import MultiGraph
+        >>> G = MultiGraph([(1, 2), (2, 1), (1, 2), (2, 3)])
+        >>> G.add_edge(2, 3, weight=5)
+        1
+        >>> FG = FrancyGraph(G, 'mycanvas')
+        >>> list(FG.parallel_edges(G.edges()))
+        [(1, 2, None, [{}, {}, {}]), (2, 3, None, [{}, {'weight': 5}])]
+        >>> def aggregate_options(src, tgt, parallel):
+        ...   return {'length': sum(d.get('weight', 1) for d in parallel)}
+        >>> FG = FrancyGraph(G, 'mycanvas', multiedges='aggregate', aggregate_options=aggregate_options)
+        >>> list(FG.links.values())
+        [{'source': 'mycanvas_node2', 'weight': 3, 'color': '', 'length': 3, 'target': 'mycanvas_node3', 'count': 3, 'id': 'mycanvas_edge5'}, {'source': 'mycanvas_node3', 'weight': 2, 'color': '', 'length': 6, 'target': 'mycanvas_node4', 'count': 2, 'id': 'mycanvas_edge6'}]
+        """
+        directed = self.obj.is_directed()
+        seen = set()  # Node pairs already merged
+        for e in edges:
+            src, tgt = e[0], e[1]
+            if (src, tgt) in seen or (not directed and (tgt, src) in seen):
+                continue
+            seen.add((src, tgt))
+            yield (src, tgt, None, list(self.obj[src][tgt].values()))
+
+    def over_budget(self):
+        r"""
+        Whether the graph is to be sampled: it exceeds the node or edge budget.
+
+        Test:
+
+        >>> from networkx import barabasi_albert_graph
+        >>> G = barabasi_albert_graph(1000, 3, seed=1)
+        >>> FG = FrancyGraph(G, 'mycanvas', sample='forest_fire', max_nodes=40, max_edges=60, seed=1)
+        >>> FG.over_budget(), len(FG.nodes), len(FG.links) <= 60
+        (True, 40, True)
+        >>> FG.dropped['nodes']
+        960
+        >>> FG2 = FrancyGraph(G, 'mycanvas', sample='forest_fire', max_nodes=40, max_edges=60, seed=1)
+        >>> FG2.to_json() == FG.to_json()
+        True
+        >>> FrancyGraph(G, 'mycanvas', sample='uniform', max_nodes=2000).over_budget()
+        False
+        """
+        if not self._sample:
+            return False
+        if self._max_nodes and len(self.obj) > self._max_nodes:
+            return True
+        return bool(self._max_edges) and self.obj.size() > self._max_edges
+
+    def adjacency(self):
+        r"""
+        The adjacency index of the graph, built once per graph.
+        With `transitive_reduction`, only the cover relations are indexed.
+
+        Test:
+
+        >>> from networkx import path_graph, DiGraph
+        >>> G = path_graph(4)
+        >>> FrancyGraph(G).adjacency() is FrancyGraph(G).adjacency()
+        True
+        >>> G = DiGraph([(a, b) for a in range(1, 9) for b in range(1, 9) if a != b and b % a == 0])
+        >>> FG = FrancyGraph(G, 'mycanvas', graphType='directed', transitive_reduction=True)
+        >>> len(G.edges()), len(FG.links)
+        (12, 8)
+        >>> FG.adjacency().succ[2]
+        [4, 6]
+
+        The parallel edges of a multigraph keep their keys around a focus node:
+
+        >>> from networkx import MultiGraph
+        >>> M = MultiGraph([(0, 1), (0, 1), (1, 2), (2, 3)])
+        >>> len(FrancyGraph(M, 'mycanvas', stable_ids=True, focus=0, radius=2).links)
+        3
+        >>> FrancyGraph(G, 'mycanvas', graphType='directed', focus=8, transitive_reduction=True).nodes
+        {'mycanvas_node2': {'id': 'mycanvas_node2', 'x': 0, 'y': 0, 'type': 'circle', 'size': 10, 'title': '8', 'color': '', 'highlight': True, 'layer': 3, 'parent': '', 'menus': {}, 'messages': {}, 'callbacks': {}}, 'mycanvas_node3': {'id': 'mycanvas_node3', 'x': 0, 'y': 0, 'type': 'circle', 'size': 10, 'title': '4', 'color': '', 'highlight': True, 'layer': 2, 'parent': '', 'menus': {}, 'messages': {}, 'callbacks': {}}}
+        """
+        if self.transitive_reduction:
+            return hasse_diagram(self.obj)
+        return cached(self.obj, 'adjacency', AdjacencyIndex)
+
+    def expand(self, n):
+        r"""
+        Add the neighbours of a displayed node that are not displayed yet,
+        with their links to the displayed nodes.
+        At most `max_nodes` new nodes are added at once.
+
+        Input:
+
+        * n -- a math object, or a node identifier
+
+        Output:
+
+        A dictionary with the new 'nodes' and 'links'.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> FG = FrancyGraph(path_graph(10), 'mycanvas', focus=0, radius=2)
+        >>> sorted(FG.nodes), list(FG.links)
+        (['mycanvas_node2', 'mycanvas_node3', 'mycanvas_node4'], ['mycanvas_edge5', 'mycanvas_edge6'])
+        >>> delta = FG.expand('mycanvas_node4')
+        >>> [node['title'] for node in delta['nodes'].values()]
+        ['3']
+        >>> delta['links']
+        {'mycanvas_edge8': {'source': 'mycanvas_node7', 'weight': 1, 'color': '', 'target': 'mycanvas_node4', 'id': 'mycanvas_edge8'}}
+        >>> FG.expand(3)['nodes']['mycanvas_node9']['title']
+        '4'
+        >>> FG.expand(3)
+        {'nodes': {}, 'links': {}}
+        >>> len(FG.nodes), len(FG.links)
+        (5, 4)
+
+        New links are styled with the scales of the links already displayed:
+
+        >>> from networkx import Graph
+        >>> from francy_styles import ColorScale
+        >>> G = Graph([(0, 1, {'w': 1}), (1, 2, {'w': 3}), (2, 3, {'w': 2})])
+        >>> FG = FrancyGraph(G, 'mycanvas', focus=0, radius=2,
+        ...                  link_styles={'weight': 'w', 'color': ColorScale('w', ['#000000', '#ffffff'])})
+        >>> [(link['weight'], link['color']) for link in FG.expand(2)['links'].values()]
+        [(2, '#808080')]
+        """
+        if n not in self._ids:
+            n = self._objs[n]
+        index = self.adjacency()
+        new = []
+        for m in index.neighbours(n):
+            if m not in self._ids and m not in new:
+                new.append(m)
+                if self._max_nodes and len(new) >= self._max_nodes:
+                    break
+        multi = self.obj.is_multigraph()
+        edges = list(index.links(new, self._ids, keys=multi and self.multiedges == 'separate'))
+        if multi and self.multiedges == 'aggregate':
+            edges = list(self.parallel_edges(edges))
+        counter = self._last_counter
+        delta = {'nodes': {}, 'links': {}}
+        for m in new:
+            counter += 1
+            ident = self.add_node(m, counter)
+            delta['nodes'][ident] = self.nodes[ident]
+        self.set_parents(new)
+        link_rows = None
+        if edges and (self._link_scales or self._link_batch_options):
+            # Styled as the links of the first computation
+            try:
+                from .francy_styles import style_links
+            except:
+                from francy_styles import style_links # for doctesting
+            link_rows = style_links([e[:3] for e in edges], [self.edge_data(e) for e in edges],
+                                    self._link_scales, self._link_batch_options)
+        for i, e in enumerate(edges):
+            counter += 1
+            ident = self.add_link(e[0], e[1], counter, *e[2:], options=link_rows and link_rows[i])
+            delta['links'][ident] = self.links[ident]
+        self._last_counter = counter
+        self._query = None  # Indexes are built again
+        return delta
+
+    def query(self):
+        r"""
+        Queries over the nodes and links, with indexes built once
+        (see `francy_query`).
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> FG = FrancyGraph(path_graph(5), 'mycanvas', focus=0, radius=1)
+        >>> FG.query().nodes(('title', '>=', '1'))
+        ['mycanvas_node3']
+        >>> _ = FG.expand(1)
+        >>> FG.query().nodes(('title', '>=', '1'))
+        ['mycanvas_node3', 'mycanvas_node5']
+        """
+        if self._query is None:
+            try:
+                from .francy_query import GraphQuery
+            except:
+                from francy_query import GraphQuery # for doctesting
+            self._query = GraphQuery(self)
+        return self._query
+
     def to_dict(self):
         res = super(FrancyGraph, self).to_dict()
         if 'graphType' in res:
             res['type'] = res['graphType']
             del res['graphType']
         for optname in [
-                'nodeType', 'nodeLayer', 'nodeSize', 'color', 'highlight', 'weight', 'canvas_id']:
+                'nodeType', 'nodeLayer', 'nodeSize', 'color', 'highlight', 'weight', 'canvas_id',
+                'multiedges', 'transitive_reduction', 'dropped']:
             if optname in res:
                 del res[optname]
         return res
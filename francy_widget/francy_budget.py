@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+r"""
+Payload size budgets, with degraded rendering.
+
+The size of a Francy payload is estimated before it is serialized,
+from the numbers of nodes and edges, and from the cost of a small sample
+of them, rendered with the same options. When the estimate exceeds
+the budget, the rendering is degraded, step by step:
+
+* menus -- node menus are dropped
+* simulation -- the force simulation is switched off
+* coarsen -- parallel edges of multigraphs are aggregated
+* sample -- only a sample of the graph is displayed
+
+When the allowed steps are not enough, rendering is refused.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+try:
+    from .francy_adapter import FrancyGraph, francy_id
+    from .francy_hierarchy import hasse_diagram
+    from .francy_index import cached, AdjacencyIndex
+    from .francy_sage import graph_view
+    from .francy_sampling import sample_nodes, induced_edges
+except:
+    from francy_adapter import FrancyGraph, francy_id # for doctesting
+    from francy_hierarchy import hasse_diagram
+    from francy_index import cached, AdjacencyIndex
+    from francy_sage import graph_view
+    from francy_sampling import sample_nodes, induced_edges
+DEGRADE_STEPS = ['menus', 'simulation', 'coarsen', 'sample']
+DEGRADE_MESSAGES = {
+    'menus': "node menus were dropped",
+    'simulation': "the simulation was switched off",
+    'coarsen': "parallel edges were aggregated",
+    'sample': "only a sample is shown"}
+CANVAS_OPTIONS = ['title', 'width', 'height', 'zoomToFit', 'texTypesetting', 'base_id',
+                  'menus', 'messages', 'timeline']
+VIEW_OPTIONS = ['focus', 'radius', 'sample', 'max_nodes', 'max_edges', 'seed']
+CANVAS_OVERHEAD = 600  # Bytes of the canvas and graph headers
+SIMULATION_MAX_NODES = 1000  # Above that, over budget, the force simulation is switched off
+
+
+def view_size(obj, focus=None, radius=1, sample=None, max_nodes=None, max_edges=None, seed=None,
+              multiedges='separate', transitive_reduction=False, **kws):
+    r"""
+    The numbers of nodes and links of the view to be displayed:
+    the whole graph, the neighbourhood of a focus node, or a sample
+    (see `FrancyGraph`).
+
+    Input:
+
+    * obj -- a graph object
+    * focus, radius, sample, max_nodes, max_edges, seed, multiedges,
+      transitive_reduction -- graph options
+    * kws -- other graph options (ignored)
+
+    Output:
+
+    A (nodes, links) tuple.
+
+    Test:
+
+    >>> from networkx import barabasi_albert_graph, path_graph, MultiGraph
+    >>> view_size(path_graph(100)), view_size(path_graph(100), focus=50, radius=3)
+    ((100, 99), (7, 6))
+    >>> G = barabasi_albert_graph(1000, 3, seed=1)
+    >>> view_size(G, sample='uniform', max_edges=50)
+    (1000, 50)
+    >>> view_size(MultiGraph([(0, 1), (0, 1), (1, 2)]), multiedges='aggregate')
+    (3, 2)
+    """
+    obj = graph_view(obj)
+    multi = obj.is_multigraph()
+
+    def count(edges):
+        if multi and multiedges == 'aggregate':
+            directed = obj.is_directed()
+            return len(set(e[:2] if directed else (min(e[:2], key=repr), max(e[:2], key=repr))
+                           for e in edges))
+        return len(edges)
+    if focus is not None:
+        index = hasse_diagram(obj) if transitive_reduction else cached(obj, 'adjacency', AdjacencyIndex)
+        nodes = index.ball(focus, int(radius), max_nodes)
+        return len(nodes), count(list(index.links(nodes, {})))
+    if sample and ((max_nodes and len(obj) > max_nodes) or (max_edges and obj.size() > max_edges)):
+        nodes = sample_nodes(obj, sample, max_nodes, seed) if max_nodes else list(obj.nodes())
+        return len(nodes), count(induced_edges(obj, nodes, max_edges, keys=multi))
+    if transitive_reduction:
+        return len(obj), sum(len(succ) for succ in hasse_diagram(obj).succ.values())
+    if multi and multiedges == 'aggregate':
+        return len(obj), count(list(obj.edges()))
+    return len(obj), obj.size()
+
+
+def estimate_payload(obj, sample_size=30, sample_seed=0, **kws):
+    r"""
+    Estimate the size of a payload, before rendering it.
+    The numbers of nodes and links are those of the view (see `view_size`).
+
+    Input:
+
+    * obj -- a graph object
+    * sample_size -- an integer, the number of nodes rendered for the estimate
+    * sample_seed -- a seed, for choosing the sample
+    * kws -- graph options (node_options, graphType ..)
+
+    Output:
+
+    A dictionary with the numbers of 'nodes' and 'links', and the estimated 'bytes'.
+
+    Test:
+
+    >>> from networkx import barabasi_albert_graph, balanced_tree
+    >>> from francy_adapter import FrancyAdapter
+    >>> def node_options(n):
+    ...   return {'modal_menus': [{'title': 'degree', 'funcname': 'degree'}] * (n % 3)}
+    >>> for G, kws in [(barabasi_albert_graph(2000, 2, seed=1), {}),
+    ...                (barabasi_albert_graph(3000, 3, seed=2), {'node_options': node_options}),
+    ...                (balanced_tree(3, 6), {'graphType': 'tree'}),
+    ...                (balanced_tree(3, 6), {'graphType': 'tree', 'stable_ids': True}),
+    ...                (balanced_tree(3, 6), {'focus': 0, 'radius': 4})]:
+    ...     e = estimate_payload(G, **kws)
+    ...     actual = len(FrancyAdapter().to_json(G, **kws))
+    ...     print(e['nodes'], e['links'], abs(e['bytes'] - actual) < 0.05 * actual)
+    2000 3996 True
+    3000 8991 True
+    1093 1092 True
+    1093 1092 True
+    121 120 True
+    """
+    obj = graph_view(obj)
+    base_id = kws.get('base_id') or '0' * 32  # Like a generated canvas id
+    nodes, links = view_size(obj, **kws)
+    kws = dict((k, v) for k, v in kws.items() if k not in CANVAS_OPTIONS + VIEW_OPTIONS)
+    res = {'nodes': nodes, 'links': links, 'bytes': CANVAS_OVERHEAD}
+    # Nodes from a uniform sample; links from a random walk, that meets enough of them
+    for strategy, items, count, ids in [('uniform', 'nodes', nodes, 3), ('random_walk', 'links', links, 4)]:
+        if not count:
+            continue
+        G = FrancyGraph(obj, base_id, sample=strategy, max_nodes=sample_size,
+                        max_edges=sample_size, seed=sample_seed, **kws)
+        sample = getattr(G, items)
+        if not sample:
+            continue
+        encode = G.encoder.encode
+        # Identifiers are longer in the full graph: count their extra digits
+        digits = len(str(nodes + links)) - len(str(G._last_counter))
+        if G._id_map is not None:
+            digits = 0  # Stable identifiers all have the same length
+        cost = sum(len(encode(k)) + len(encode(v)) + 2 for k, v in sample.items())
+        if items == 'nodes' and G.graphType == 'tree' and G._hierarchy:
+            # Parents are mostly left out of the sample: count their identifiers
+            parents = G._hierarchy[1]
+            missing = sum(1 for ident, node in sample.items()
+                          if not node['parent'] and G._objs[ident] in parents)
+            cost += missing * len(next(iter(sample)) if G._id_map is not None
+                                  else francy_id(base_id, 'node', G._last_counter))
+        res['bytes'] += count * (cost / float(len(sample)) + ids * digits)
+    res['bytes'] = int(res['bytes'])
+    return res
+
+
+def _without_menus(node_options):
+    def options(n):
+        res = dict(node_options(n))
+        res.pop('modal_menus', None)
+        return res
+    return options
+
+
+def degrade(obj, payload_budget=None, node_budget=None, link_budget=None, steps=DEGRADE_STEPS, **kws):
+    r"""
+    Adapt rendering options to some budgets.
+
+    Input:
+
+    * obj -- a graph object
+    * payload_budget -- an integer, the payload size budget, in bytes
+    * node_budget -- an integer, the node budget
+    * link_budget -- an integer, the link budget
+    * steps -- the allowed degradation steps, in order
+    * kws -- rendering options; the caps of a sample or of a focus view
+      (`max_nodes`, `max_edges`) are kept when they are lower than the budgets
+
+    Output:
+
+    A (options, estimate, applied steps) tuple.
+
+    Test:
+
+    >>> from networkx import barabasi_albert_graph
+    >>> G = barabasi_albert_graph(5000, 3, seed=1)
+    >>> def node_options(n):
+    ...   return {'modal_menus': [{'title': 'degree', 'funcname': 'degree'}]}
+    >>> kws, e, applied = degrade(G, payload_budget=5500000, node_options=node_options)
+    >>> applied, e['bytes'] < 5500000
+    (['menus'], True)
+    >>> kws, e, applied = degrade(G, payload_budget=500000, node_options=node_options)
+    >>> applied, kws['sample'], kws['max_nodes'], e['bytes'] < 500000
+    (['menus', 'simulation', 'sample'], 'forest_fire', 461, True)
+    >>> from francy_adapter import FrancyAdapter
+    >>> len(FrancyAdapter().to_json(G, **kws)) < 500000
+    True
+    >>> kws, e, applied = degrade(G, link_budget=1000, steps=['menus'])
+    Traceback (most recent call last):
+    ...
+    ValueError: The graph has 5000 nodes and 14991 links (about 4.9 MB), over budget (1000 links); try a sample
+
+    Within the budgets, large graphs keep their simulation:
+
+    >>> from networkx import path_graph
+    >>> degrade(path_graph(1500), payload_budget=50000000)[2]
+    []
+
+    The view asked for is estimated, and its caps are kept:
+
+    >>> degrade(G, node_budget=2000, focus=0, radius=1)[2]
+    []
+    >>> kws, e, applied = degrade(G, node_budget=2000, sample='uniform', max_edges=50)
+    >>> applied, kws['max_nodes'], kws['max_edges']
+    (['simulation', 'sample'], 2000, 20)
+    """
+    kws = dict(kws)
+    applied = []
+
+    def over(e):
+        return ((payload_budget and e['bytes'] > payload_budget)
+                or (node_budget and e['nodes'] > node_budget)
+                or (link_budget and e['links'] > link_budget))
+    e = estimate_payload(obj, **kws)
+    if not over(e):
+        return kws, e, applied
+    if 'menus' in steps and over(e) and kws.get('node_options'):
+        kws['node_options'] = _without_menus(kws['node_options'])
+        applied.append('menus')
+        e = estimate_payload(obj, **kws)
+    if 'simulation' in steps and over(e) and e['nodes'] > SIMULATION_MAX_NODES \
+       and kws.get('simulation', True):
+        kws['simulation'] = False
+        applied.append('simulation')
+    if 'coarsen' in steps and over(e) and graph_view(obj).is_multigraph():
+        kws['multiedges'] = 'aggregate'
+        applied.append('coarsen')
+        e = estimate_payload(obj, **kws)
+    if 'sample' in steps and over(e):
+        # Shrink in proportion, with a margin
+        ratio = 1.0
+        if payload_budget:
+            ratio = min(ratio, 0.9 * payload_budget / e['bytes'])
+        if node_budget:
+            ratio = min(ratio, float(node_budget) / e['nodes'])
+        if link_budget:
+            ratio = min(ratio, float(link_budget) / max(e['links'], 1))
+        max_nodes = max(1, int(e['nodes'] * ratio))
+        max_edges = max(1, int(e['links'] * ratio))
+        kws.setdefault('sample', 'forest_fire')
+        kws.setdefault('seed', 0)  # Same sample on each rendering
+        # Within the caps asked for
+        kws['max_nodes'] = min(kws.get('max_nodes') or max_nodes, max_nodes)
+        kws['max_edges'] = min(kws.get('max_edges') or max_edges, max_edges)
+        applied.append('sample')
+        e = {'nodes': kws['max_nodes'], 'links': kws['max_edges'],
+             'bytes': int(e['bytes'] * max(ratio, float(kws['max_nodes']) / max(e['nodes'], 1)))}
+    if over(e):
+        budgets = []
+        if payload_budget:
+            budgets.append("%.1f MB" % (payload_budget / 1e6))
+        if node_budget:
+            budgets.append("%d nodes" % node_budget)
+        if link_budget:
+            budgets.append("%d links" % link_budget)
+        if 'sample' in applied:
+            raise ValueError("A sample of %d nodes and %d links (about %.1f MB) is still over budget (%s)" % (
+                e['nodes'], e['links'], e['bytes'] / 1e6, ', '.join(budgets)))
+        raise ValueError("The graph has %d nodes and %d links (about %.1f MB), over budget (%s); try a sample" % (
+            e['nodes'], e['links'], e['bytes'] / 1e6, ', '.join(budgets)))
+    return kws, e, applied
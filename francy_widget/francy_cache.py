@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+r"""
+A persistent, content-addressed cache of Francy JSON payloads.
+
+Payloads are kept as files in a cache directory, named after a key
+computed from a canonical hash of the graph, the rendering options
+and the package version. They survive kernel restarts, and can be
+shared by several kernels: files are written under a temporary name,
+then renamed, so that readers never see a partial payload.
+The oldest entries are evicted when the cache grows beyond its size limit.
+Payloads are read whole, as strings, since they are sent to the frontend
+as such: memory-mapped reads would not save a copy, and were dropped.
+A payload read from the cache gets a canvas identifier of its own.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import hashlib
+import os
+import tempfile
+try:
+    from .francy_export import options_digest
+    from .francy_sage import graph_view
+except:
+    from francy_export import options_digest # for doctesting
+    from francy_sage import graph_view
+
+
+def francy_version():
+    r"""
+    The version of this package.
+    """
+    try:
+        from importlib.metadata import version
+        return version('francy-widget')
+    except Exception:
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'VERSION')
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read().strip()
+        return 'unknown'
+
+
+def graph_hash(obj):
+    r"""
+    A canonical hash of a graph, that is the same in every session.
+    Nodes are known by their representations; node and edge data are included.
+    The order of nodes and edges is taken into account, as it gives the Francy ids.
+
+    Test:
+
+    >>> from networkx import Graph
+    >>> graph_hash(Graph([(1, 2), (2, 3)])) == graph_hash(Graph([(1, 2), (2, 3)]))
+    True
+    >>> graph_hash(Graph([(1, 2), (2, 3)])) == graph_hash(Graph([(3, 2), (2, 1)]))
+    False
+    >>> G = Graph([(1, 2)])
+    >>> h = graph_hash(G)
+    >>> G.nodes[1]['color'] = 'red'
+    >>> graph_hash(G) == h
+    False
+    """
+    obj = graph_view(obj)
+
+    def data(d):
+        return repr(sorted((repr(k), repr(v)) for k, v in d.items()))
+    try:
+        nodes = obj.nodes(data=True)
+    except TypeError:  # No node data
+        nodes = ((n, {}) for n in obj.nodes())
+    try:
+        edges = obj.edges(data=True)
+    except TypeError:
+        edges = ((src, tgt, {}) for src, tgt in obj.edges())
+    h = hashlib.sha1()
+    h.update(('directed' if obj.is_directed() else 'undirected').encode('utf-8'))
+    for n, d in nodes:
+        h.update(("\0n%r%s" % (n, data(d))).encode('utf-8'))
+    for src, tgt, d in edges:
+        h.update(("\0e%r>%r%s" % (src, tgt, data(d))).encode('utf-8'))
+    return h.hexdigest()
+
+
+def default_cache_dir():
+    r"""
+    The default cache directory: $FRANCY_CACHE_DIR,
+    or francy-widget in the user cache directory.
+    """
+    if os.environ.get('FRANCY_CACHE_DIR'):
+        return os.environ['FRANCY_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'francy-widget')
+
+
+class PayloadCache:
+    r"""
+    A directory of Francy JSON payloads, by key.
+
+    Examples:
+
+    >>> import tempfile
+    >>> from networkx import path_graph
+    >>> C = PayloadCache(tempfile.mkdtemp(), max_size=1000)
+    >>> key = C.key(path_graph(3), title='Path')
+    >>> key == C.key(path_graph(3), title='Path'), key == C.key(path_graph(3), title='Other')
+    (True, False)
+    >>> C.get(key) is None
+    True
+    >>> C.put(key, '{"canvas": "..."}')
+    >>> C.get(key)
+    '{"canvas": "..."}'
+    >>> for i in range(100):
+    ...     C.put(C.key(path_graph(i)), 'x' * 100)
+    >>> C.size() <= 1000, len(C)
+    (True, 10)
+    >>> C.clear()
+    >>> len(C)
+    0
+    """
+    def __init__(self, directory=None, max_size=512 << 20):
+        r"""
+        Input:
+
+        * directory -- a path (default: see `default_cache_dir`)
+        * max_size -- an integer, the maximum size of the cache in bytes
+        """
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.max_size = int(max_size)
+        self.version = francy_version()
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # Created meanwhile, by another kernel
+                if not os.path.isdir(directory):
+                    raise
+
+    def key(self, obj, **kws):
+        r"""
+        The cache key of a graph, rendered with some options.
+
+        Input:
+
+        * obj -- a graph object
+        * kws -- the rendering options
+
+        A ValueError is raised when some option has no stable identity
+        (see `francy_export.canonical`): such renderings are not cached.
+        """
+        h = hashlib.sha1()
+        for s in [graph_hash(obj), options_digest('json', kws), self.version]:
+            h.update(s.encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        r"""
+        The cached payload for a key, or None.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read().decode('utf-8')
+            os.utime(path, None)  # Recently used
+        except (IOError, OSError):  # Missing, or evicted meanwhile
+            return None
+        return payload
+
+    def put(self, key, payload):
+        r"""
+        Store a payload, then evict the oldest entries if the cache is too large.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload.encode('utf-8'))
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def entries(self):
+        r"""
+        The cache entries, as (modification time, size, path) tuples.
+        """
+        res = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            res.append((st.st_mtime, st.st_size, path))
+        return res
+
+    def __len__(self):
+        return len(self.entries())
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        r"""
+        Remove the least recently used entries, until the cache fits in its size limit.
+        """
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # Removed meanwhile, by another kernel
+                pass
+            total -= size
+
+    def clear(self):
+        r"""
+        Remove all entries.
+        """
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
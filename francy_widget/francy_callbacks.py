@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+r"""
+Callbacks triggered from the Francy frontend.
+
+Node menus send back a function name, a node identifier
+and some arguments, where "<object>" stands for the node math object.
+The dispatcher resolves them through the node index of the displayed graph:
+only the callbacks declared in the node menus, or the functions of an explicit
+namespace, can be called. The results of callbacks without side effects
+can be memoized, on request. Callbacks can run on a pool of worker threads
+or processes, with timeouts and cancellation.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import sys
+from collections import OrderedDict
+from threading import Lock, Timer, current_thread
+OBJECT_ARG = "<object>"
+EXECUTORS = ['thread', 'process']
+FINISHED_TASKS = 256  # Finished tasks kept, for their status
+POLL_INTERVAL = 0.05  # Seconds between checks that a queued callback has started
+
+
+def running_loop():
+    r"""
+    The event loop running in the current thread (in a notebook, the kernel loop), or None.
+
+    Test:
+
+    >>> running_loop() is None
+    True
+    """
+    try:
+        import asyncio
+        return asyncio.get_running_loop()
+    except (ImportError, AttributeError, RuntimeError):
+        return None
+
+
+class CallbackDispatcher:
+    r"""
+    Resolve and run callbacks, with a bounded LRU cache of the results
+    of the callbacks to be memoized.
+
+    Examples:
+
+    >>> from networkx import Graph
+    >>> from francy_adapter import FrancyGraph
+    >>> def node_options(n):
+    ...   return {'modal_menus': [{'title': 'bits', 'funcname': 'bit_length', 'is_method': True,
+    ...                            'memoize': True}]}
+    >>> FG = FrancyGraph(Graph([(1, 200)]), 'mycanvas', node_options=node_options)
+    >>> D = CallbackDispatcher(namespace={'square': lambda x: x * x}, cache_size=2, memoize=['square'])
+    >>> D.attach(FG)
+    >>> D.dispatch('mycanvas_node3', 'bit_length')
+    8
+    >>> D.dispatch('mycanvas_node3', 'square', ['<object>'])
+    40000
+    >>> D.dispatch('mycanvas_node3', 'bit_length')
+    8
+    >>> D.cache_info()
+    {'hits': 1, 'misses': 2, 'size': 2}
+    >>> D.dispatch('mycanvas_node3', 'cube')
+    Traceback (most recent call last):
+    ...
+    KeyError: 'Unknown callback function: cube'
+
+    Methods of the node objects are only called when declared in the node menus:
+
+    >>> D.dispatch('mycanvas_node2', 'to_bytes', ['<object>', 1, 'big'])
+    Traceback (most recent call last):
+    ...
+    KeyError: 'Unknown callback function: to_bytes'
+    """
+    def __init__(self, namespace=None, cache_size=128, executor=None, max_workers=None,
+                 timeout=None, memoize=()):
+        r"""
+        Input:
+
+        * namespace -- a dictionary of functions, by name, that can be called on any node;
+          by default, none: only the callbacks declared in the node menus can be called,
+          and their functions are found in the `__main__` module
+        * cache_size -- an integer, the maximum number of memoized results
+        * memoize -- the names of the namespace functions whose results are memoized;
+          callbacks declared in node menus are memoized with their 'memoize' entry
+        * executor -- None (run submitted callbacks at once), 'thread' or 'process'
+        * max_workers -- an integer, the size of the worker pool
+        * timeout -- a number of seconds, the default timeout for submitted callbacks
+        """
+        self.namespace = namespace
+        self.cache_size = int(cache_size)
+        if executor is not None and executor not in EXECUTORS:
+            raise ValueError("Executor must be one of: %s" % ', '.join(EXECUTORS))
+        self.executor = executor
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memoize = set(memoize)
+        self.graph = None
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()  # (funcname, object, args) -> result, oldest first
+        self._lock = Lock()
+        self._pool = None
+        self._tasks = {}  # task identifier -> task dictionary, while running
+        self._finished = OrderedDict()  # task identifier -> status, oldest first
+        self._task_counter = 0
+
+    def attach(self, graph):
+        r"""
+        Resolve node identifiers against this graph from now on.
+        The graph index is maintained by the graph itself, as nodes are added.
+
+        Input:
+
+        * graph -- a FrancyGraph object
+        """
+        self.graph = graph
+
+    def resolve(self, node, funcname):
+        r"""
+        Find the math object and the function for a callback, in constant time.
+
+        Input:
+
+        * node -- a node identifier
+        * funcname -- a string
+
+        Output:
+
+        A (object, function, is_method, memoize) tuple.
+        """
+        if self.graph is None or node not in self.graph._objs:
+            raise KeyError("Unknown node: %s" % node)
+        obj = self.graph._objs[node]
+        callback = self.graph._callbacks.get((node, funcname))
+        if callback is None:
+            # Not declared for this node: only from an explicit namespace
+            if self.namespace is None or funcname not in self.namespace:
+                raise KeyError("Unknown callback function: %s" % funcname)
+            return obj, self.namespace[funcname], False, funcname in self.memoize
+        if callback.is_method:
+            if not hasattr(obj, funcname):
+                raise KeyError("Unknown callback method: %s" % funcname)
+            return obj, getattr(obj, funcname), True, callback.memoize
+        namespace = self.namespace
+        if namespace is None:
+            namespace = sys.modules['__main__'].__dict__
+        if funcname not in namespace:
+            raise KeyError("Unknown callback function: %s" % funcname)
+        return obj, namespace[funcname], False, callback.memoize
+
+    def dispatch(self, node, funcname, knownArgs=[], requiredArgs={}):
+        r"""
+        Run a callback for some node, or return its memoized result.
+
+        Input:
+
+        * node -- a node identifier
+        * funcname -- a string
+        * knownArgs -- a list of arguments, where "<object>" stands for the node object
+        * requiredArgs -- a dictionary of keyword arguments (or of Francy required args,
+          having a 'value')
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> from francy_adapter import FrancyGraph
+        >>> D = CallbackDispatcher(namespace={'add': lambda x, y=0: x + int(y)})
+        >>> D.attach(FrancyGraph(Graph([(1, 2)]), 'mycanvas'))
+        >>> D.dispatch('mycanvas_node2', 'add')
+        1
+        >>> D.dispatch('mycanvas_node2', 'add', requiredArgs={'y': {'title': 'y', 'value': '41'}})
+        42
+        """
+        key, func, args, kws = self._prepare(node, funcname, knownArgs, requiredArgs)
+        found, result = self._lookup(key)
+        if found:
+            return result
+        result = func(*args, **kws)
+        self._memoize(key, result)
+        return result
+
+    def _prepare(self, node, funcname, knownArgs, requiredArgs):
+        r"""
+        Resolve a callback into a memoization key, a function and its arguments.
+        """
+        obj, func, is_method, memoize = self.resolve(node, funcname)
+        args = [a for a in knownArgs if a != OBJECT_ARG]
+        kws = {}
+        for k, v in requiredArgs.items():
+            if isinstance(v, dict) and 'value' in v:
+                v = v['value']
+            kws[k] = v
+        key = None
+        if memoize:
+            key = (funcname, obj, tuple(args), tuple(sorted(kws.items())))
+            try:
+                hash(key)
+            except TypeError:  # Cannot be memoized
+                key = None
+        if not is_method:
+            if OBJECT_ARG in knownArgs:
+                args = [obj if a == OBJECT_ARG else a for a in knownArgs]
+            else:
+                args = [obj] + args
+        return key, func, args, kws
+
+    def _lookup(self, key):
+        if key is None:  # Not memoized
+            return False, None
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                result = self._results.pop(key)
+                self._results[key] = result
+                return True, result
+            self.misses += 1
+            return False, None
+
+    def _memoize(self, key, result):
+        if key is None or self.cache_size <= 0:
+            return
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def pool(self):
+        r"""
+        The worker pool, created on first use.
+        """
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+            if self.executor == 'process':
+                self._pool = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(self.max_workers)
+        return self._pool
+
+    def submit(self, node, funcname, knownArgs=[], requiredArgs={}, timeout=None, notify=None):
+        r"""
+        Run a callback on the worker pool (or at once, when there is no executor).
+
+        The task status goes from 'running' to one of:
+        'done', 'error', 'timeout' or 'cancelled'.
+        Each change is reported to `notify`, on the thread that submitted the task
+        when it runs an event loop (the kernel thread, in a notebook).
+        The timeout counts from the start of the callback, not from its submission.
+        A callback already running in a thread cannot be interrupted:
+        after a timeout or a cancellation, its result is discarded.
+
+        Input:
+
+        * node -- a node identifier
+        * funcname -- a string
+        * knownArgs -- a list of arguments, where "<object>" stands for the node object
+        * requiredArgs -- a dictionary of keyword arguments
+        * timeout -- a number of seconds (default: the dispatcher timeout)
+        * notify -- a function of the task dictionary
+
+        Output:
+
+        A task identifier.
+
+        Test:
+
+        >>> import time
+        >>> from networkx import Graph
+        >>> from francy_adapter import FrancyGraph
+        >>> D = CallbackDispatcher(namespace={'slow': lambda x, t: time.sleep(float(t)) or x},
+        ...                        executor='thread', max_workers=2)
+        >>> D.attach(FrancyGraph(Graph([(1, 2)]), 'mycanvas'))
+        >>> log = []
+        >>> def notify(task):
+        ...   log.append((task['id'], task['status'], task.get('result')))
+        >>> t1 = D.submit('mycanvas_node2', 'slow', ['<object>', '0.01'], notify=notify)
+        >>> t2 = D.submit('mycanvas_node3', 'slow', ['<object>', '1'], timeout=0.1, notify=notify)
+        >>> time.sleep(0.5)
+        >>> sorted(log)
+        [(1, 'done', 1), (1, 'running', None), (2, 'running', None), (2, 'timeout', None)]
+        >>> D.status(t1)['result']
+        1
+        >>> t3 = D.submit('mycanvas_node3', 'slow', ['<object>', '1'], notify=notify)
+        >>> D.cancel(t3)
+        True
+        >>> log[-1]
+        (3, 'cancelled', None)
+
+        Waiting in the queue does not count in the timeout:
+
+        >>> D = CallbackDispatcher(namespace={'slow': lambda x, t: time.sleep(float(t)) or x},
+        ...                        executor='thread', max_workers=1)
+        >>> D.attach(FrancyGraph(Graph([(1, 2)]), 'mycanvas'))
+        >>> t1 = D.submit('mycanvas_node2', 'slow', ['<object>', '0.5'])
+        >>> t2 = D.submit('mycanvas_node3', 'slow', ['<object>', '0.01'], timeout=0.3)
+        >>> time.sleep(1)
+        >>> D.status(t2)['status']
+        'done'
+
+        Under an event loop, the status changes are reported on its thread:
+
+        >>> import asyncio, threading
+        >>> threads = []
+        >>> async def main():
+        ...     D.submit('mycanvas_node2', 'slow', ['<object>', '0.02'],
+        ...              notify=lambda task: threads.append(threading.current_thread()))
+        ...     await asyncio.sleep(0.3)
+        >>> asyncio.run(main())
+        >>> len(threads), set(threads) == set([threading.current_thread()])
+        (2, True)
+
+        Finished tasks only keep their status:
+
+        >>> D._tasks
+        {}
+        """
+        key, func, args, kws = self._prepare(node, funcname, knownArgs, requiredArgs)
+        with self._lock:
+            self._task_counter += 1
+            task = {'id': self._task_counter, 'node': node, 'funcname': funcname,
+                    'status': 'running', 'notify': notify,
+                    'thread': current_thread(), 'loop': running_loop()}
+            self._tasks[task['id']] = task
+        found, result = self._lookup(key)
+        if found:
+            self._finish(task, 'done', result, notify)
+            return task['id']
+        if self.executor is None:
+            try:
+                result = func(*args, **kws)
+            except Exception as e:
+                self._finish(task, 'error', e, notify)
+            else:
+                self._memoize(key, result)
+                self._finish(task, 'done', result, notify)
+            return task['id']
+        if notify:
+            self._notify(task, notify)
+        future = self.pool().submit(func, *args, **kws)
+        task['future'] = future
+        if timeout is None:
+            timeout = self.timeout
+        if timeout:
+            self._arm(task, timeout, notify)
+
+        def done(f):
+            if f.cancelled():
+                return
+            e = f.exception()
+            if e is not None:
+                self._finish(task, 'error', e, notify)
+            else:
+                self._memoize(key, f.result())
+                self._finish(task, 'done', f.result(), notify)
+        future.add_done_callback(done)
+        return task['id']
+
+    def _finish(self, task, status, value, notify):
+        r"""
+        Set the final status of a task, unless it is already final.
+        """
+        with self._lock:
+            if task['status'] != 'running':
+                return
+            task['status'] = status
+            if status == 'done':
+                task['result'] = value
+            elif status == 'error':
+                task['error'] = value
+            if 'timer' in task:
+                task['timer'].cancel()
+            # Only the status is kept, for a while
+            self._tasks.pop(task['id'], None)
+            self._finished[task['id']] = self._status(task)
+            while len(self._finished) > FINISHED_TASKS:
+                self._finished.popitem(last=False)
+        if notify:
+            self._notify(task, notify)
+
+    def _notify(self, task, notify):
+        r"""
+        Report the status of a task on the thread that submitted it,
+        through its event loop, if any.
+        """
+        status = self._status(task)
+        loop = task['loop']
+        if loop is None or current_thread() is task['thread'] or loop.is_closed():
+            notify(status)
+        else:
+            loop.call_soon_threadsafe(notify, status)
+
+    def _arm(self, task, timeout, notify):
+        r"""
+        Start the timeout of a task once it is running; until then, check again.
+        """
+        future = task['future']
+        with self._lock:
+            if task['status'] != 'running':
+                return
+            if future.running() or future.done():
+                timer = Timer(timeout, self._expire, (task, notify))
+            else:  # Still queued
+                timer = Timer(POLL_INTERVAL, self._arm, (task, timeout, notify))
+            timer.daemon = True
+            task['timer'] = timer
+            timer.start()
+
+    def _expire(self, task, notify):
+        if 'future' in task:
+            task['future'].cancel()
+        self._finish(task, 'timeout', None, notify)
+
+    def cancel(self, task_id):
+        r"""
+        Cancel a submitted callback.
+
+        Output:
+
+        True if the task was still running.
+        """
+        task = self._tasks.get(task_id)
+        if task is None or task['status'] != 'running':
+            return False
+        if 'future' in task:
+            task['future'].cancel()
+        self._finish(task, 'cancelled', None, task['notify'])
+        return True
+
+    def status(self, task_id):
+        r"""
+        The current status of a submitted callback.
+
+        Output:
+
+        A dictionary, with the 'status' and, when available, the 'result' or 'error'.
+        The statuses of the last FINISHED_TASKS finished callbacks are kept.
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return dict(self._finished[task_id])
+            return self._status(task)
+
+    def _status(self, task):
+        return dict((k, v) for k, v in task.items()
+                    if k not in ['future', 'timer', 'notify', 'thread', 'loop'])
+
+    def shutdown(self, wait=False):
+        r"""
+        Stop the worker pool.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait)
+            self._pool = None
+
+    def cache_info(self):
+        r"""
+        Cache statistics.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results)}
+
+    def clear(self):
+        r"""
+        Forget all memoized results.
+        """
+        self._results.clear()
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+r"""
+Headless export of graphs to Francy JSON, or HTML, files.
+
+Graphs are read from files (GraphML, edge lists, pickled networkx graphs),
+rendered on a pool of worker processes, and written to an output
+directory: each canvas is computed in full, then encoded by chunks.
+A manifest in the output directory keeps a digest of each input file
+and of the export options, so that graphs whose inputs have not changed
+are skipped. Inputs with the same file name get distinct output names.
+
+HTML files hold the canvas data, and draw it with the Francy Javascript
+library (the `Francy` global of the francy-js bundle, such as
+`francy.bundle.js`). The bundle is inlined with the `--script` option;
+otherwise, it must be loaded by the page, or the file only holds the data.
+
+From the command line ::
+
+    $ francy-export graphs/*.graphml -o reports --format html --jobs 8
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import OrderedDict
+try:
+    from .francy_adapter import FrancyAdapter
+except:
+    from francy_adapter import FrancyAdapter # for doctesting
+EXPORT_FORMATS = ['json', 'html']
+MANIFEST = '.francy-manifest.json'
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+</head>
+<body>
+<div id="%(canvas_id)s" class="francy"></div>
+<script type="application/vnd.francy+json" data-canvas="%(canvas_id)s">
+"""
+HTML_END = """
+</script>
+%(script)s<script>
+(function () {
+  var id = %(canvas_id_js)s;
+  var data = document.querySelector('script[data-canvas="' + id + '"]');
+  if (typeof Francy === 'undefined') {
+    document.getElementById(id).textContent = "The Francy Javascript library is not loaded.";
+    return;
+  }
+  new Francy({appendTo: '[id="' + id + '"]', callbackHandler: function () {}})
+    .load(JSON.parse(data.textContent)).render();
+})();
+</script>
+</body>
+</html>
+"""
+
+
+def read_graph(path):
+    r"""
+    Read a graph from a file, according to its extension:
+    .graphml, .edgelist (or .edges, .txt), or .pickle (or .pkl, .gpickle).
+
+    Test:
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'path.edgelist')
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write("1 2\n2 3\n")
+    >>> list(read_graph(path).edges())
+    [('1', '2'), ('2', '3')]
+    >>> read_graph('graph.dot')
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown graph file format: graph.dot
+    """
+    import networkx
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.graphml':
+        return networkx.read_graphml(path)
+    if ext in ['.edgelist', '.edges', '.txt']:
+        return networkx.read_edgelist(path)
+    if ext in ['.pickle', '.pkl', '.gpickle']:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    raise ValueError("Unknown graph file format: %s" % path)
+
+
+def file_digest(path, blocksize=1 << 16):
+    r"""
+    SHA-1 digest of a file, read by blocks.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(blocksize)
+        while block:
+            h.update(block)
+            block = f.read(blocksize)
+    return h.hexdigest()
+
+
+def canonical(v, seen=None):
+    r"""
+    A canonical form of an option value, made of lists, strings and numbers,
+    that is the same in every session. Containers are tagged with their types,
+    and dictionaries and sets are sorted. Functions are known by their code,
+    their defaults and their closure values; Francy objects (menus, messages)
+    and tables by their contents. A ValueError is raised for values without
+    a stable identity (such as objects with a default representation).
+
+    Test:
+
+    >>> canonical({(0, 1): 'a', (0, 0): [1.5, None]})
+    ['dict', [[['tuple', [0, 0]], ['list', [1.5, None]]], [['tuple', [0, 1]], 'a']]]
+    >>> canonical(lambda n: {'color': 'red'}) == canonical(lambda n: {'color': 'red'})
+    True
+    >>> canonical(lambda n: {'color': 'red'}) == canonical(lambda n: {'color': 'blue'})
+    False
+    >>> def scaled(k):
+    ...     return lambda n: {'size': k * n}
+    >>> canonical(scaled(2)) == canonical(scaled(3))
+    False
+    >>> canonical(object())
+    Traceback (most recent call last):
+    ...
+    ValueError: No stable identity for <object>
+    """
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if seen is None:
+        seen = set()
+    if id(v) in seen:
+        return ['cycle']
+    seen = seen | set([id(v)])
+    if isinstance(v, dict):
+        items = [[canonical(k, seen), canonical(x, seen)] for k, x in v.items()]
+        return ['dict', sorted(items, key=lambda item: json.dumps(item[0]))]
+    if isinstance(v, (list, tuple)):
+        return [type(v).__name__, [canonical(x, seen) for x in v]]
+    if isinstance(v, (set, frozenset)):
+        return ['set', sorted((canonical(x, seen) for x in v), key=json.dumps)]
+    if isinstance(v, bytes):
+        return ['bytes', v.hex()]
+    if hasattr(v, 'co_code'):  # A code object
+        return ['code', v.co_code.hex(), list(v.co_names),
+                [canonical(c, seen) for c in v.co_consts]]
+    if hasattr(v, '__code__'):  # A Python function
+        closure = [cell.cell_contents for cell in (v.__closure__ or ())]
+        return ['function', getattr(v, '__module__', None), getattr(v, '__qualname__', None),
+                canonical(v.__code__, seen), canonical(v.__defaults__, seen),
+                canonical(v.__kwdefaults__, seen), canonical(closure, seen)]
+    if hasattr(v, '__func__') and hasattr(v, '__self__'):  # A bound method
+        return ['method', canonical(v.__func__, seen), canonical(v.__self__, seen)]
+    if hasattr(v, 'func') and hasattr(v, 'keywords'):  # A partial function
+        return ['partial', canonical(v.func, seen), canonical(v.args, seen),
+                canonical(v.keywords, seen)]
+    if isinstance(v, type) or callable(v) and hasattr(v, '__qualname__'):
+        # Classes, and builtin functions
+        return ['name', getattr(v, '__module__', None), v.__qualname__]
+    if hasattr(v, 'to_dict'):
+        return [type(v).__name__, canonical(v.to_dict(), seen)]
+    if hasattr(v, 'tolist'):  # Arrays
+        return [type(v).__name__, canonical(v.tolist(), seen)]
+    r = repr(v)
+    if ' at 0x' in r or r.startswith('<'):
+        raise ValueError("No stable identity for <%s>" % type(v).__name__)
+    return [type(v).__name__, r]
+
+
+def options_digest(fmt, kws):
+    r"""
+    Digest of the export options (see `canonical`).
+    A ValueError is raised when some option has no stable identity.
+
+    Test:
+
+    >>> options_digest('json', {'graphType': 'directed'}) == options_digest('json', {'graphType': 'directed'})
+    True
+    >>> options_digest('json', {}) == options_digest('html', {})
+    False
+    >>> options_digest('json', {'positions': {(0, 1): (0, 1)}}) == options_digest('json', {'positions': {(0, 1): (1, 0)}})
+    False
+    """
+    s = json.dumps([fmt, canonical(kws)])
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+
+def write_graph(obj, out, fmt='json', script=None, **kws):
+    r"""
+    Render a graph, and write it to a file. The canvas is computed in full,
+    then encoded and written by chunks.
+    The file is written under a temporary name, then renamed.
+
+    Input:
+
+    * obj -- a graph object
+    * out -- a file path
+    * fmt -- 'json' or 'html'
+    * script -- a path to the Francy Javascript bundle, inlined in HTML output
+      (otherwise, the page must load it to draw the graph)
+    * kws -- options for the Francy adapter (title, base_id, graphType ..)
+
+    Test:
+
+    >>> import os, tempfile
+    >>> from networkx import path_graph
+    >>> out = os.path.join(tempfile.mkdtemp(), 'path.html')
+    >>> write_graph(path_graph(3), out, 'html', title='A </script> path', base_id='path')
+    >>> html = open(out).read()
+    >>> '"title": "A <\\/script> path"' in html, html.count('"type": "circle"')
+    (True, 3)
+    >>> 'new Francy({appendTo: \'[id="\' + id + \'"]\'' in html, 'var id = "path";' in html
+    (True, True)
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Format must be one of: %s" % ', '.join(EXPORT_FORMATS))
+    adapter = FrancyAdapter()
+    d = adapter.to_dict(obj, **kws)
+    tmp = out + '.tmp'
+    with open(tmp, 'w') as f:
+        if fmt == 'html':
+            f.write(HTML_TEMPLATE % {'title': d['canvas']['title'].replace('<', '&lt;'),
+                                     'canvas_id': d['canvas']['id']})
+            for chunk in adapter.encoder.iterencode(d):
+                f.write(chunk.replace('</', '<\\/'))  # Do not close the script element
+            if script:
+                with open(script) as js:
+                    script = '<script>\n%s\n</script>\n' % js.read()
+            f.write(HTML_END % {'script': script or '',
+                                'canvas_id_js': json.dumps(d['canvas']['id']).replace('</', '<\\/')})
+        else:
+            for chunk in adapter.encoder.iterencode(d):
+                f.write(chunk)
+    os.replace(tmp, out)
+
+
+def output_names(paths, fmt):
+    r"""
+    The output file names of some input paths: their base names, with the format
+    extension. Inputs with the same base name get a suffix, from a digest of their path.
+
+    Test:
+
+    >>> output_names(['a/g.graphml', 'b/g.graphml', 'c/h.edgelist'], 'json')
+    ['g-ed14edde.json', 'g-71681310.json', 'h.json']
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    counts = {}
+    for stem in stems:
+        counts[stem] = counts.get(stem, 0) + 1
+    res = []
+    for path, stem in zip(paths, stems):
+        if counts[stem] > 1:
+            digest = hashlib.sha1(os.path.normpath(path).encode('utf-8')).hexdigest()[:8]
+            stem = "%s-%s" % (stem, digest)
+        res.append(stem + '.' + fmt)
+    return res
+
+
+def _export_one(path, out, fmt, script, kws):
+    r"""
+    Export one graph file (in a worker process).
+
+    Output:
+
+    A (path, output path, error) tuple.
+    """
+    try:
+        kws = dict(kws)
+        if 'base_id' not in kws:
+            kws['base_id'] = os.path.splitext(os.path.basename(path))[0]
+        write_graph(read_graph(path), out, fmt, script, **kws)
+    except Exception as e:
+        return path, out, repr(e)
+    return path, out, None
+
+
+def export_graphs(paths, outdir, fmt='json', jobs=None, force=False, script=None, **kws):
+    r"""
+    Export graph files to an output directory, in parallel.
+
+    Input:
+
+    * paths -- a list of graph file paths
+    * outdir -- the output directory path
+    * fmt -- 'json' or 'html'
+    * jobs -- an integer, the number of worker processes (default: the number of CPUs);
+      1 exports in the current process
+    * force -- a boolean: also export unchanged graphs
+    * script -- a path to the Francy Javascript bundle, inlined in HTML output
+    * kws -- options for the Francy adapter; functions (like `node_options`)
+      must be defined at module level, so that workers can load them
+
+    Output:
+
+    A dictionary with the 'written' and 'skipped' output paths,
+    and the 'failed' inputs, with their errors.
+
+    Test:
+
+    >>> import os, tempfile
+    >>> from networkx import write_graphml, path_graph, cycle_graph
+    >>> indir, outdir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    >>> paths = [os.path.join(indir, 'path.graphml'), os.path.join(indir, 'cycle.graphml')]
+    >>> write_graphml(path_graph(3), paths[0])
+    >>> write_graphml(cycle_graph(4), paths[1])
+    >>> res = export_graphs(paths, outdir, jobs=2)
+    >>> sorted(os.path.basename(p) for p in res['written']), res['skipped']
+    (['cycle.json', 'path.json'], [])
+    >>> open(os.path.join(outdir, 'path.json')).read()[:72]
+    '{"version": "1.1.3", "mime": "application/vnd.francy+json", "canvas": {"'
+    >>> write_graphml(path_graph(4), paths[0])
+    >>> res = export_graphs(paths + [os.path.join(indir, 'missing.graphml')], outdir, jobs=1)
+    >>> [os.path.basename(p) for p in res['written'] + res['skipped']], list(res['failed'].values())
+    (['path.json', 'cycle.json'], ["FileNotFoundError(2, 'No such file or directory')"])
+    >>> other = os.path.join(tempfile.mkdtemp(), 'path.graphml')
+    >>> write_graphml(cycle_graph(5), other)
+    >>> res = export_graphs([paths[0], other], outdir, jobs=1)
+    >>> len(set(res['written'])), export_graphs([paths[0], other], outdir, jobs=1)['written']
+    (2, [])
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Format must be one of: %s" % ', '.join(EXPORT_FORMATS))
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    manifest_path = os.path.join(outdir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    try:
+        options = options_digest(fmt, kws)
+    except ValueError:  # Always exported again
+        options = None
+    res = {'written': [], 'skipped': [], 'failed': {}}
+    todo = []
+    digests = {}
+    paths = list(OrderedDict.fromkeys(paths))  # Each input once
+    for path, name in zip(paths, output_names(paths, fmt)):
+        out = os.path.join(outdir, name)
+        try:
+            digests[path] = options and file_digest(path) + options
+        except (IOError, OSError) as e:
+            res['failed'][path] = repr(e)
+            continue
+        if not force and digests[path] and manifest.get(out) == digests[path] \
+           and os.path.exists(out):
+            res['skipped'].append(out)
+            continue
+        todo.append((path, out))
+
+    def done(path, out, error):
+        if error:
+            res['failed'][path] = error
+        else:
+            res['written'].append(out)
+            if digests[path]:
+                manifest[out] = digests[path]
+            else:
+                manifest.pop(out, None)
+
+    if jobs == 1 or len(todo) < 2:
+        for path, out in todo:
+            done(*_export_one(path, out, fmt, script, kws))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(_export_one, path, out, fmt, script, kws) for path, out in todo]
+            for future in as_completed(futures):
+                done(*future.result())
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return res
+
+
+def main(argv=None):
+    r"""
+    Command line entry point.
+
+    Test:
+
+    >>> import os, tempfile
+    >>> from networkx import write_edgelist, star_graph
+    >>> indir, outdir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    >>> write_edgelist(star_graph(3), os.path.join(indir, 'star.edgelist'))
+    >>> main([os.path.join(indir, 'star.edgelist'), '-o', outdir, '--format', 'html', '--graph-type', 'directed'])
+    1 written, 0 skipped, 0 failed
+    0
+    >>> main([os.path.join(indir, 'star.edgelist'), '-o', outdir, '--format', 'html', '--graph-type', 'directed'])
+    0 written, 1 skipped, 0 failed
+    0
+    """
+    parser = argparse.ArgumentParser(
+        prog='francy-export', description="Export graph files to Francy JSON, or HTML, files.")
+    parser.add_argument('inputs', nargs='+', help="graph files (.graphml, .edgelist, .pickle)")
+    parser.add_argument('-o', '--output', default='.', help="output directory")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='json')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--force', action='store_true', help="also export unchanged graphs")
+    parser.add_argument('--script', default=None,
+                        help="Francy Javascript bundle, to inline in HTML output "
+                        "(otherwise, the page must load it)")
+    parser.add_argument('--graph-type', default='undirected',
+                        choices=['undirected', 'directed', 'tree'])
+    parser.add_argument('--title', default=None)
+    args = parser.parse_args(argv)
+    kws = {'graphType': args.graph_type}
+    if args.title:
+        kws['title'] = args.title
+    res = export_graphs(args.inputs, args.output, args.format, args.jobs, args.force,
+                        args.script, **kws)
+    for path, error in sorted(res['failed'].items()):
+        sys.stderr.write("%s: %s\n" % (path, error))
+    print("%d written, %d skipped, %d failed" % (
+        len(res['written']), len(res['skipped']), len(res['failed'])))
+    if res['failed']:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+r"""
+Layers and parents for trees, DAGs and posets.
+
+Layers are ranks: the length of the longest path from a minimal element
+(for directed graphs), or the depth in a breadth-first search
+(for undirected trees). Parents make a spanning forest.
+Everything is computed in linear time, and cached for each graph.
+
+For order relations, the transitive reduction (or Hasse diagram)
+keeps only the cover relations.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+try:
+    from .francy_index import cached, AdjacencyIndex
+except:
+    from francy_index import cached, AdjacencyIndex # for doctesting
+
+
+def layering(index):
+    r"""
+    Layers and parents of all nodes, in O(V+E).
+
+    Input:
+
+    * index -- an AdjacencyIndex object
+
+    Output:
+
+    A pair of dictionaries: node -> layer, and node -> parent node
+    (minimal elements and roots have no parent).
+
+    Test:
+
+    >>> from networkx import DiGraph, balanced_tree
+    >>> layers, parents = layering(AdjacencyIndex(DiGraph([(0, 1), (1, 3), (0, 2), (2, 3), (0, 3)])))
+    >>> layers
+    {0: 0, 1: 1, 3: 2, 2: 1}
+    >>> parents
+    {1: 0, 2: 0, 3: 1}
+    >>> layers, parents = layering(AdjacencyIndex(balanced_tree(2, 2)))
+    >>> layers
+    {0: 0, 1: 1, 2: 1, 3: 2, 4: 2, 5: 2, 6: 2}
+    >>> parents[5]
+    2
+
+    With cycles, the remaining nodes are layered breadth-first:
+
+    >>> layers, parents = layering(AdjacencyIndex(DiGraph([(0, 1), (1, 2), (2, 1), (2, 3)])))
+    >>> layers
+    {0: 0, 1: 1, 2: 2, 3: 3}
+    """
+    succ, pred = index.succ, index.pred
+    layers = {}
+    parents = {}
+    if not index.directed:
+        for root in succ:
+            if root in layers:
+                continue
+            layers[root] = 0
+            queue = [root]
+            i = 0
+            while i < len(queue):
+                n = queue[i]
+                i += 1
+                for m in succ[n]:
+                    if m not in layers:
+                        layers[m] = layers[n] + 1
+                        parents[m] = n
+                        queue.append(m)
+        return layers, parents
+    # Topological order (Kahn), keeping the longest path to each node
+    indegree = dict((n, len(pred[n])) for n in succ)
+    queue = [n for n in succ if indegree[n] == 0]  # Minimal elements
+    for n in queue:
+        layers[n] = 0
+    i = 0
+    while i < len(queue):
+        n = queue[i]
+        i += 1
+        for m in succ[n]:
+            if m not in layers or layers[m] < layers[n] + 1:
+                layers[m] = layers[n] + 1
+                parents[m] = n
+            indegree[m] -= 1
+            if indegree[m] == 0:
+                queue.append(m)
+    if len(queue) < len(succ):
+        # Cycles: the remaining nodes are layered breadth-first
+        done = set(queue)
+        for root in succ:
+            if root in done:
+                continue
+            done.add(root)
+            if root not in layers:
+                layers[root] = 0
+            bfs = [root]
+            i = 0
+            while i < len(bfs):
+                n = bfs[i]
+                i += 1
+                for m in succ[n]:
+                    if m not in done:
+                        done.add(m)
+                        if m not in layers or layers[m] < layers[n] + 1:
+                            layers[m] = layers[n] + 1
+                            parents[m] = n
+                        bfs.append(m)
+    return dict((n, layers[n]) for n in succ), parents
+
+
+def hierarchy(obj):
+    r"""
+    Layers and parents of the nodes of a graph, computed once per graph.
+    Graphs knowing their own layering (as Sage posets do) are asked for it.
+
+    Test:
+
+    >>> from networkx import DiGraph
+    >>> G = DiGraph([('1', 'G'), ('G', 'SG1'), ('G', 'SG2')])
+    >>> hierarchy(G)
+    ({'1': 0, 'G': 1, 'SG1': 2, 'SG2': 2}, {'G': '1', 'SG1': 'G', 'SG2': 'G'})
+    >>> hierarchy(G) is hierarchy(G)
+    True
+    """
+    if hasattr(obj, 'layering'):
+        return cached(obj, 'hierarchy', lambda g: g.layering())
+    return cached(obj, 'hierarchy', lambda g: layering(cached(g, 'adjacency', AdjacencyIndex)))
+
+
+def transitive_reduction(index):
+    r"""
+    Cover relations of an acyclic directed graph (its Hasse diagram).
+
+    Nodes are visited in reverse topological order, keeping the set of
+    nodes reachable from each node as a bitset. A successor is a cover
+    unless it is reachable through a closer successor.
+
+    Input:
+
+    * index -- an AdjacencyIndex object, for an acyclic directed graph
+
+    Output:
+
+    An AdjacencyIndex object, for the cover relations.
+
+    Test:
+
+    >>> from networkx import DiGraph
+    >>> G = DiGraph([(a, b) for a in range(1, 13) for b in range(1, 13) if a != b and b % a == 0])
+    >>> G.number_of_edges()
+    23
+    >>> H = transitive_reduction(AdjacencyIndex(G))
+    >>> sum(len(s) for s in H.succ.values())
+    14
+    >>> H.succ[2], H.pred[12]
+    ([4, 6, 10], [4, 6])
+    >>> transitive_reduction(AdjacencyIndex(DiGraph([(1, 2), (2, 1)])))
+    Traceback (most recent call last):
+    ...
+    ValueError: Transitive reduction needs an acyclic directed graph
+    """
+    if not index.directed:
+        raise ValueError("Transitive reduction needs an acyclic directed graph")
+    succ, pred = index.succ, index.pred
+    indegree = dict((n, len(pred[n])) for n in succ)
+    order = [n for n in succ if indegree[n] == 0]
+    i = 0
+    while i < len(order):
+        for m in succ[order[i]]:
+            indegree[m] -= 1
+            if indegree[m] == 0:
+                order.append(m)
+        i += 1
+    if len(order) < len(succ):
+        raise ValueError("Transitive reduction needs an acyclic directed graph")
+    order.reverse()
+    pos = dict((n, i) for i, n in enumerate(order))  # Successors come first
+    reach = {}  # node -> bitset of the nodes reachable from it
+    covers = {}
+    for n in order:
+        r = 0
+        found = set()
+        # Closest successors (in topological order) first
+        for m in sorted(set(succ[n]), key=pos.get, reverse=True):
+            bit = 1 << pos[m]
+            if not r & bit:
+                found.add(m)
+                r |= reach[m] | bit
+        reach[n] = r
+        covers[n] = found
+    res = {}
+    for n in succ:  # Keep the original order
+        res[n] = []
+        for m in succ[n]:
+            if m in covers[n]:
+                res[n].append(m)
+                covers[n].discard(m)
+    return AdjacencyIndex.from_succ(res)
+
+
+def hasse_diagram(obj):
+    r"""
+    The transitive reduction of a graph, computed once per graph.
+
+    Test:
+
+    >>> from networkx import DiGraph
+    >>> G = DiGraph([(1, 2), (2, 3), (1, 3)])
+    >>> hasse_diagram(G).succ
+    {1: [2], 2: [3], 3: []}
+    >>> hasse_diagram(G) is hasse_diagram(G)
+    True
+    """
+    return cached(obj, 'hasse_diagram',
+                  lambda g: transitive_reduction(cached(g, 'adjacency', AdjacencyIndex)))
@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+r"""
+History snapshots of computed Francy graphs, with structural sharing.
+
+Each snapshot holds the node and link records of a graph in persistent maps
+(hash array mapped tries): a new snapshot copies only the paths to the records
+that changed, and shares everything else with the previous one, so that memory
+grows with the size of each change. Two snapshots are compared by walking
+their tries together, skipping shared subtrees, in time proportional to
+their difference; restoring a snapshot only sends that difference.
+
+Records are compared by identity: they are to be replaced when they change,
+not changed in place.
+
+Examples:
+
+>>> from networkx import path_graph
+>>> from francy_adapter import FrancyGraph
+>>> FG = FrancyGraph(path_graph(10), 'c', focus=0, radius=1)
+>>> H = History()
+>>> H.record(FG, label='render')
+>>> delta = FG.expand(1)
+>>> H.record(FG, label='expand', nodes=delta['nodes'], links=delta['links'])
+>>> [s.label for s in H.snapshots], H.current
+(['render', 'expand'], 1)
+>>> diff = H.restore(FG, 0)
+>>> diff['remove_nodes'], diff['remove_links'], sorted(FG.nodes)
+(['c_node5'], ['c_edge6'], ['c_node2', 'c_node3'])
+>>> sorted(H.restore(FG, 1)['nodes']), len(FG.nodes), FG.expand(2)['nodes'].keys()
+(['c_node5'], 3, dict_keys(['c_node7']))
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+def popcount(n):
+    return bin(n).count('1')
+
+
+class _Leaf(object):
+    __slots__ = ('hash', 'key', 'value')
+
+    def __init__(self, h, key, value):
+        self.hash = h
+        self.key = key
+        self.value = value
+
+
+class _Bucket(object):
+    r"""
+    Leaves whose keys have the same hash.
+    """
+    __slots__ = ('hash', 'leaves')
+
+    def __init__(self, h, leaves):
+        self.hash = h
+        self.leaves = leaves
+
+
+class _Node(object):
+    r"""
+    A trie node: a bitmap of the occupied slots, and their entries, in order.
+    """
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+EMPTY = _Node(0, ())
+
+
+def _hash(key):
+    return hash(key) & 0xFFFFFFFF
+
+
+def _assoc(node, shift, leaf):
+    r"""
+    The node, with a leaf set; the node itself when nothing changes.
+
+    Output:
+
+    A (node, added) tuple.
+    """
+    bit = 1 << ((leaf.hash >> shift) & MASK)
+    i = popcount(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit, node.entries[:i] + (leaf,) + node.entries[i:]), True
+    old = node.entries[i]
+    if isinstance(old, _Node):
+        new, added = _assoc(old, shift + BITS, leaf)
+    elif isinstance(old, _Leaf) and old.key == leaf.key:
+        if old.value is leaf.value:
+            return node, False
+        new, added = leaf, False
+    elif old.hash == leaf.hash:
+        leaves = tuple(l for l in getattr(old, 'leaves', (old,)) if l.key != leaf.key)
+        added = len(leaves) == len(getattr(old, 'leaves', (old,)))
+        new = _Bucket(leaf.hash, leaves + (leaf,))
+    else:
+        # Both go one level down
+        sub = _Node(1 << ((old.hash >> (shift + BITS)) & MASK), (old,))
+        new, added = _assoc(sub, shift + BITS, leaf)
+    if new is old:
+        return node, False
+    return _Node(node.bitmap, node.entries[:i] + (new,) + node.entries[i + 1:]), added
+
+
+def _dissoc(node, shift, h, key):
+    r"""
+    The node, without a key: a node, a single remaining leaf or bucket, or None.
+
+    Output:
+
+    A (node, removed) tuple.
+    """
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit:
+        return node, False
+    i = popcount(node.bitmap & (bit - 1))
+    old = node.entries[i]
+    if isinstance(old, _Node):
+        new, removed = _dissoc(old, shift + BITS, h, key)
+        if not removed:
+            return node, False
+    elif isinstance(old, _Leaf):
+        if old.key != key:
+            return node, False
+        new = None
+    else:
+        leaves = tuple(l for l in old.leaves if l.key != key)
+        if len(leaves) == len(old.leaves):
+            return node, False
+        new = leaves[0] if len(leaves) == 1 else _Bucket(h, leaves)
+    if new is not None:
+        return _Node(node.bitmap, node.entries[:i] + (new,) + node.entries[i + 1:]), True
+    entries = node.entries[:i] + node.entries[i + 1:]
+    if not entries:
+        return None, True
+    if len(entries) == 1 and not isinstance(entries[0], _Node):
+        return entries[0], True  # Collapsed into the parent
+    return _Node(node.bitmap & ~bit, entries), True
+
+
+def _build(leaves, shift):
+    r"""
+    A node holding leaves, in one pass.
+    """
+    slots = {}
+    for leaf in leaves:
+        slots.setdefault((leaf.hash >> shift) & MASK, []).append(leaf)
+    bitmap = 0
+    entries = []
+    for j in sorted(slots):
+        bitmap |= 1 << j
+        group = slots[j]
+        if len(group) == 1:
+            entries.append(group[0])
+        elif shift + BITS >= 32:  # All hash bits are equal
+            entries.append(_Bucket(group[0].hash, tuple(group)))
+        else:
+            entries.append(_build(group, shift + BITS))
+    return _Node(bitmap, tuple(entries))
+
+
+def _items(entry):
+    if entry is None:
+        return
+    if isinstance(entry, _Node):
+        for e in entry.entries:
+            for item in _items(e):
+                yield item
+    elif isinstance(entry, _Leaf):
+        yield entry.key, entry.value
+    else:
+        for l in entry.leaves:
+            yield l.key, l.value
+
+
+def _diff(a, b, res):
+    if a is b:
+        return  # Shared
+    if isinstance(a, _Node) and isinstance(b, _Node):
+        bitmap = a.bitmap | b.bitmap
+        for j in range(WIDTH):
+            bit = 1 << j
+            if bitmap & bit:
+                ea = a.entries[popcount(a.bitmap & (bit - 1))] if a.bitmap & bit else None
+                eb = b.entries[popcount(b.bitmap & (bit - 1))] if b.bitmap & bit else None
+                _diff(ea, eb, res)
+        return
+    da, db = dict(_items(a)), dict(_items(b))
+    for k, v in da.items():
+        if db.get(k) is not v:
+            res.append((k, v, db.get(k)))
+    for k, v in db.items():
+        if k not in da:
+            res.append((k, None, v))
+
+
+class PersistentMap(object):
+    r"""
+    An immutable map: setting or deleting a key gives a new map,
+    sharing all unchanged parts with the old one.
+
+    Test:
+
+    >>> m1 = PersistentMap.from_items((i, str(i)) for i in range(1000))
+    >>> m2 = m1.set(7, 'seven').delete(8)
+    >>> len(m1), len(m2), m1[7], m2[7], 8 in m2
+    (1000, 999, '7', 'seven', False)
+    >>> sorted(m1.diff(m2))
+    [(7, '7', 'seven'), (8, '8', None)]
+    >>> shared = [e for e in m2._root.entries if any(e is f for f in m1._root.entries)]
+    >>> len(m1._root.entries), len(shared)
+    (32, 30)
+    >>> m2.set(7, m2[7]) is m2, m2.delete(8) is m2
+    (True, True)
+    >>> m3 = m2.set(8, m1[8]).set(7, m1[7])
+    >>> m3.diff(m1), sorted(m3) == sorted(m1)
+    ([], True)
+    """
+    def __init__(self, root=EMPTY, size=0):
+        self._root = root
+        self._size = size
+
+    @classmethod
+    def from_items(cls, items):
+        r"""
+        A map, from (key, value) pairs, built in one pass.
+        """
+        leaves = dict((k, _Leaf(_hash(k), k, v)) for k, v in items)
+        if not leaves:
+            return cls()
+        return cls(_build(leaves.values(), 0), len(leaves))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for k, v in _items(self._root):
+            yield k
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __getitem__(self, key):
+        res = self.get(key, self)
+        if res is self:
+            raise KeyError(key)
+        return res
+
+    def items(self):
+        return _items(self._root)
+
+    def get(self, key, default=None):
+        h = _hash(key)
+        node, shift = self._root, 0
+        while True:
+            bit = 1 << ((h >> shift) & MASK)
+            if not node.bitmap & bit:
+                return default
+            e = node.entries[popcount(node.bitmap & (bit - 1))]
+            if isinstance(e, _Node):
+                node, shift = e, shift + BITS
+            elif isinstance(e, _Leaf):
+                return e.value if e.key == key else default
+            else:
+                for l in e.leaves:
+                    if l.key == key:
+                        return l.value
+                return default
+
+    def set(self, key, value):
+        r"""
+        The map, with a key set (the map itself, when the value is the same object).
+        """
+        root, added = _assoc(self._root, 0, _Leaf(_hash(key), key, value))
+        if root is self._root:
+            return self
+        return PersistentMap(root, self._size + added)
+
+    def delete(self, key):
+        r"""
+        The map, without a key (the map itself, when the key is absent).
+        """
+        h = _hash(key)
+        root, removed = _dissoc(self._root, 0, h, key)
+        if not removed:
+            return self
+        if root is None:
+            root = EMPTY
+        elif not isinstance(root, _Node):
+            root = _Node(1 << (root.hash & MASK), (root,))
+        return PersistentMap(root, self._size - 1)
+
+    def diff(self, other):
+        r"""
+        The differences with another map, as (key, value, other value) triples,
+        None standing for a missing value. Shared subtrees are skipped.
+        """
+        res = []
+        _diff(self._root, other._root, res)
+        return res
+
+
+class Snapshot(object):
+    r"""
+    A state of a graph: its node and link records, and its visible nodes.
+    """
+    __slots__ = ('label', 'nodes', 'links', 'visible')
+
+    def __init__(self, label, nodes, links, visible):
+        r"""
+        Input:
+
+        * label -- a string
+        * nodes -- a PersistentMap node identifier -> node record
+        * links -- a PersistentMap link identifier -> link record
+        * visible -- a frozenset of node identifiers, or None for all nodes
+        """
+        self.label = label
+        self.nodes = nodes
+        self.links = links
+        self.visible = visible
+
+
+class History(object):
+    r"""
+    Successive snapshots of a computed FrancyGraph, with a current one.
+    Recording after a restore drops the snapshots that followed it.
+
+    Test:
+
+    >>> from networkx import path_graph
+    >>> from francy_adapter import FrancyGraph, GraphNode
+    >>> FG = FrancyGraph(path_graph(1000), 'c')
+    >>> H = History(max_snapshots=3)
+    >>> H.record(FG, label='render')
+    >>> FG.nodes['c_node3'] = GraphNode(**dict(FG.nodes['c_node3'], color='red'))
+    >>> H.record(FG, ['c_node3', 'c_node4'], visible=['c_node3', 'c_node4'], label='recolor')
+    >>> diff = H.diff(1, 0)
+    >>> list(diff['nodes']), len(diff['show']), diff['hide'], diff['remove_nodes']
+    (['c_node3'], 998, [], [])
+    >>> H.restore(FG, 0)['nodes']['c_node3']['color']
+    ''
+    >>> H.record(FG, label='again')
+    >>> H.record(FG, label='and again')
+    >>> H.record(FG, label='once more')
+    >>> [s.label for s in H.snapshots]
+    ['again', 'and again', 'once more']
+
+    The math objects of the nodes that no snapshot holds any more are released:
+
+    >>> H = History(max_snapshots=2)
+    >>> H.record(FG, label='render')
+    >>> del FG.nodes['c_node3'], FG.nodes['c_node4']
+    >>> H.record(FG, ['c_node3', 'c_node4'], label='remove')
+    >>> len(H.objs)
+    1000
+    >>> H.record(FG, label='again')
+    >>> len(H.objs), 'c_node3' in H.objs
+    (998, False)
+    """
+    def __init__(self, max_snapshots=None):
+        r"""
+        Input:
+
+        * max_snapshots -- the maximum number of snapshots kept (default: no limit)
+        """
+        self.max_snapshots = max_snapshots
+        self.snapshots = []
+        self.current = None  # Index of the displayed snapshot
+        self.objs = {}  # Node identifier -> math object, for all snapshots
+        self.refs = {}  # Node identifier -> number of runs of snapshots holding it
+        self.last_counter = 0
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def record(self, graph, nodes=None, links=None, visible=None, label=''):
+        r"""
+        Record the state of a graph, as a new current snapshot.
+
+        Input:
+
+        * graph -- a computed FrancyGraph object
+        * nodes -- the identifiers of the nodes changed since the current snapshot,
+          when known (default: all records are compared)
+        * links -- the identifiers of the links changed since the current snapshot,
+          when known (default: all records are compared)
+        * visible -- the visible node identifiers (default: all nodes)
+        * label -- a string
+        """
+        if self.current is None:
+            last = Snapshot('', PersistentMap(), PersistentMap(), None)
+            nodes = links = None
+        else:
+            last = self.snapshots[self.current]
+            while len(self.snapshots) > self.current + 1:
+                dropped = self.snapshots.pop()
+                self._release(self._added(self.snapshots[-1].nodes, dropped.nodes))
+        snap = Snapshot(label, self._sync(last.nodes, graph.nodes, nodes),
+                        self._sync(last.links, graph.links, links),
+                        None if visible is None else frozenset(visible))
+        for ident in (graph.nodes if nodes is None else nodes):
+            if ident in graph._objs:
+                self.objs[ident] = graph._objs[ident]
+        for ident in self._added(last.nodes, snap.nodes):
+            self.refs[ident] = self.refs.get(ident, 0) + 1
+        self.last_counter = max(self.last_counter, graph._last_counter)
+        self.snapshots.append(snap)
+        if self.max_snapshots and len(self.snapshots) > self.max_snapshots:
+            dropped = self.snapshots.pop(0)
+            self._release(self._added(self.snapshots[0].nodes, dropped.nodes))
+        self.current = len(self.snapshots) - 1
+
+    def _added(self, before, after):
+        r"""
+        The identifiers of the nodes in a node map, that are not in the former one.
+        Consecutive snapshots holding a node make a run, that starts where it is added.
+        """
+        return [ident for ident, old, new in before.diff(after) if old is None]
+
+    def _release(self, idents):
+        r"""
+        Forget runs of snapshots that only a dropped snapshot held,
+        and the math objects of the nodes left in no snapshot.
+        """
+        for ident in idents:
+            n = self.refs.get(ident, 0) - 1
+            if n > 0:
+                self.refs[ident] = n
+            else:
+                self.refs.pop(ident, None)
+                self.objs.pop(ident, None)
+
+    def _sync(self, m, records, changed):
+        if changed is None:
+            if not len(m):
+                return PersistentMap.from_items(records.items())
+            # Changed records only, found by lookups
+            changed = [k for k, v in records.items() if m.get(k) is not v]
+            kept = len(records) - sum(1 for k in changed if k not in m)
+            if kept < len(m):
+                changed.extend(k for k in m if k not in records)
+        for k in changed:
+            v = records.get(k)
+            m = m.delete(k) if v is None else m.set(k, v)
+        return m
+
+    def diff(self, i, j):
+        r"""
+        The changes from a snapshot to another one.
+
+        Output:
+
+        A dictionary with the added or changed 'nodes' and 'links' (identifier -> record),
+        the identifiers to remove ('remove_nodes', 'remove_links'),
+        and the identifiers of the nodes to 'show' and to 'hide'.
+        """
+        a, b = self.snapshots[i], self.snapshots[j]
+        res = {'nodes': {}, 'links': {}, 'remove_nodes': [], 'remove_links': []}
+        for kind in ['nodes', 'links']:
+            for ident, old, new in getattr(a, kind).diff(getattr(b, kind)):
+                if new is None:
+                    res['remove_' + kind].append(ident)
+                else:
+                    res[kind][ident] = new
+            res['remove_' + kind].sort()
+        res['show'], res['hide'] = [], []
+        if a.visible is not None or b.visible is not None:
+            va = set(a.nodes) if a.visible is None else a.visible
+            vb = set(b.nodes) if b.visible is None else b.visible
+            res['show'] = sorted(k for k in vb - va if k in a.nodes)
+            res['hide'] = sorted(k for k in set(b.nodes) - vb if k in va or k not in a.nodes)
+        return res
+
+    def restore(self, graph, i):
+        r"""
+        Bring a graph to a snapshot, from the current one, which it is in.
+
+        Output:
+
+        The changes (see `diff`).
+        """
+        diff = self.diff(self.current, i)
+        for ident in diff['remove_links']:
+            del graph.links[ident]
+        for ident in diff['remove_nodes']:
+            del graph.nodes[ident]
+            graph._ids.pop(self.objs[ident], None)
+        for ident, node in diff['nodes'].items():
+            graph.nodes[ident] = node
+            graph._ids[self.objs[ident]] = ident
+            graph._objs[ident] = self.objs[ident]
+        graph.links.update(diff['links'])
+        graph._query = None
+        self.current = i
+        return diff
+
+    def reapply(self, graph):
+        r"""
+        Bring a graph computed again to the current snapshot.
+        """
+        snap = self.snapshots[self.current]
+        for ident in graph.nodes:
+            graph._ids.pop(graph._objs[ident], None)
+        graph.nodes = dict(snap.nodes.items())
+        graph.links = dict(snap.links.items())
+        for ident in graph.nodes:
+            graph._ids[self.objs[ident]] = ident
+            graph._objs[ident] = self.objs[ident]
+        graph._last_counter = max(graph._last_counter, self.last_counter)
+        graph._query = None
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+r"""
+Stable node and link identifiers, derived from the node objects.
+
+By default, identifiers are numbered in the order of the graph nodes,
+from the adapter counter: rendering a graph again, after a small change,
+renumbers everything. With stable identifiers, a node identifier is
+a digest of the node object (or of a key computed from it), and a link
+identifier a digest of its ends. An identifier map, kept across renderings
+of a canvas, remembers them: unchanged nodes and links keep their identifiers,
+so that the frontend can keep their positions, and payloads can be compared.
+
+Examples:
+
+>>> from networkx import path_graph
+>>> from francy_adapter import FrancyGraph
+>>> ids = IdMap()
+>>> FG = FrancyGraph(path_graph(3), 'mycanvas', id_map=ids)
+>>> sorted(FG.nodes)
+['mycanvas_node356a192b7913', 'mycanvas_nodeb6589fc6ab0d', 'mycanvas_nodeda4b9237bacc']
+>>> G = path_graph(4)
+>>> G.remove_node(0)
+>>> FG2 = FrancyGraph(G, 'mycanvas', counter=42, id_map=ids)
+>>> [FG2._ids[n] == FG._ids[n] for n in [1, 2]]
+[True, True]
+>>> len(set(FG.links) & set(FG2.links))  # the link between 1 and 2
+1
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import hashlib
+from threading import Lock
+DIGEST_SIZE = 12  # Hexadecimal digits
+
+
+def digest(key, size=DIGEST_SIZE):
+    r"""
+    A short, deterministic digest of an object, from its representation.
+
+    Input:
+
+    * key -- an object with a deterministic representation
+    * size -- an integer, the number of hexadecimal digits
+
+    Test:
+
+    >>> digest(1), digest('1'), digest(1, 4)
+    ('356a192b7913', 'e521e5442d0d', '356a')
+    """
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:size]
+
+
+class IdMap:
+    r"""
+    A persistent map from node objects (and links) to stable identifiers.
+    When two keys have the same digest, the later one gets a suffix.
+
+    Test:
+
+    >>> ids = IdMap(node_key=lambda n: n[0])
+    >>> objs = {}
+    >>> ids.node_id('c', ('a', 1), objs)
+    'c_node850d88779338'
+    >>> ids.node_id('c', ('a', 2), objs)
+    Traceback (most recent call last):
+    ...
+    ValueError: Nodes ('a', 1) and ('a', 2) have the same key: 'a'
+    >>> ids.link_id('c', 'c_node1', 'c_node0', directed=False) == ids.link_id('c', 'c_node0', 'c_node1')
+    True
+    >>> ids = IdMap(digest_size=1)
+    >>> ids.node_id('c', 0), ids.node_id('c', 10), ids.node_id('c', 0)
+    ('c_nodeb', 'c_nodeb_1', 'c_nodeb')
+    >>> len(ids)
+    2
+    """
+    def __init__(self, node_key=None, digest_size=DIGEST_SIZE):
+        r"""
+        Input:
+
+        * node_key -- a function of the node object, returning a hashable key
+          with a deterministic representation (by default, the node object itself)
+        * digest_size -- an integer, the number of hexadecimal digits of the digests
+        """
+        self.node_key = node_key
+        self.digest_size = digest_size
+        self._nodes = {}  # key -> identifier suffix
+        self._links = {}  # (source suffix, target suffix, key) -> identifier suffix
+        self._used = set()  # Suffixes already given
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __repr__(self):
+        return "IdMap(node_key=%s)" % (self.node_key and "%s.%s" % (
+            getattr(self.node_key, '__module__', ''), getattr(self.node_key, '__name__', '')))
+
+    def _suffix(self, index, key, prefix):
+        res = index.get(key)
+        if res is not None:
+            return res
+        with self._lock:
+            res = prefix + digest(key, self.digest_size)
+            base, i = res, 0
+            while res in self._used:
+                i += 1
+                res = "%s_%d" % (base, i)
+            self._used.add(res)
+            index[key] = res
+        return res
+
+    def node_id(self, base_id, n, objs=None):
+        r"""
+        The identifier of a node.
+
+        Input:
+
+        * base_id -- the canvas identifier
+        * n -- a node object
+        * objs -- the node index of a graph (node identifier -> node object),
+          where the node is recorded: a ValueError is raised when another node
+          of the graph has the same key
+        """
+        key = self.node_key(n) if self.node_key else n
+        res = "%s_%s" % (base_id, self._suffix(self._nodes, key, 'node'))
+        if objs is not None:
+            if res in objs and objs[res] != n:
+                raise ValueError("Nodes %r and %r have the same key: %r" % (objs[res], n, key))
+            objs[res] = n
+        return res
+
+    def link_id(self, base_id, src, tgt, key=None, directed=True):
+        r"""
+        The identifier of a link.
+
+        Input:
+
+        * base_id -- the canvas identifier
+        * src -- the source node identifier
+        * tgt -- the target node identifier
+        * key -- the edge key, for multigraphs
+        * directed -- a boolean: for undirected links, both ends play the same role
+        """
+        # Without the canvas prefix, so that the map does not depend on it
+        src, tgt = src[len(base_id) + 1:], tgt[len(base_id) + 1:]
+        if not directed and tgt < src:
+            src, tgt = tgt, src
+        return "%s_%s" % (base_id, self._suffix(self._links, (src, tgt, key), 'edge'))
+
+    def clear(self):
+        r"""
+        Forget all identifiers.
+        """
+        with self._lock:
+            self._nodes.clear()
+            self._links.clear()
+            self._used.clear()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+r"""
+Indexes over graph objects, computed once per graph.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+from weakref import WeakKeyDictionary
+_GRAPH_CACHE = WeakKeyDictionary()
+
+
+def cached(obj, name, builder):
+    r"""
+    Compute `builder(obj)` once per graph, and keep it as long as the graph lives.
+
+    Values are not kept up to date with in-place changes of the graph:
+    call `clear_cache` after them (the widget does so on each rendering).
+    A change of the numbers of nodes or edges is caught, but no other.
+    Values for a view (see `francy_sage`) are kept with the viewed object.
+
+    Input:
+
+    * obj -- a graph object
+    * name -- a string, naming the value
+    * builder -- a function of the graph
+
+    Test:
+
+    >>> from networkx import Graph
+    >>> G = Graph([(1, 2)])
+    >>> cached(G, 'edges', lambda g: list(g.edges()))
+    [(1, 2)]
+    >>> G.add_edge(2, 3)
+    >>> cached(G, 'edges', lambda g: list(g.edges()))
+    [(1, 2), (2, 3)]
+    >>> cached(G, 'edges', lambda g: 'Not computed again') is cached(G, 'edges', list)
+    True
+    >>> G.remove_edge(2, 3)
+    >>> G.add_edge(1, 3)
+    >>> cached(G, 'edges', lambda g: list(g.edges()))  # Stale
+    [(1, 2), (2, 3)]
+    >>> clear_cache(G)
+    >>> cached(G, 'edges', lambda g: list(g.edges()))
+    [(1, 2), (1, 3)]
+    """
+    signature = (len(obj), obj.size())
+    try:
+        entry = _GRAPH_CACHE.setdefault(getattr(obj, '_view_of', obj), {})
+    except TypeError:  # Not hashable, or not weakly referenceable
+        return builder(obj)
+    if name not in entry or entry[name][0] != signature:
+        entry[name] = (signature, builder(obj))
+    return entry[name][1]
+
+
+def clear_cache(obj=None):
+    r"""
+    Forget the values computed for a graph (or for all graphs).
+
+    Test:
+
+    >>> from networkx import Graph
+    >>> G = Graph([(1, 2)])
+    >>> cached(G, 'name', lambda g: 'first')
+    'first'
+    >>> clear_cache(G)
+    >>> cached(G, 'name', lambda g: 'second')
+    'second'
+    """
+    if obj is None:
+        _GRAPH_CACHE.clear()
+    else:
+        _GRAPH_CACHE.pop(getattr(obj, '_view_of', obj), None)
+
+
+class AdjacencyIndex:
+    r"""
+    Successors and predecessors of every node, built in one pass over the edges.
+
+    Examples:
+
+    >>> from networkx import DiGraph, path_graph
+    >>> A = AdjacencyIndex(path_graph(6))
+    >>> A.ball(0, 2)
+    [0, 1, 2]
+    >>> A.ball(3, 5, max_nodes=4)
+    [3, 2, 4, 1]
+    >>> list(A.links([3, 2], {1: 'shown'}))
+    [(2, 1), (2, 3)]
+    >>> A = AdjacencyIndex(DiGraph([(1, 2), (3, 2), (2, 4)]))
+    >>> list(A.neighbours(2))
+    [4, 1, 3]
+    >>> list(A.links([2], {1: 'shown', 4: 'shown'}))
+    [(2, 4), (1, 2)]
+
+    Parallel edges of multigraphs are told apart by their keys:
+
+    >>> from networkx import MultiGraph
+    >>> A = AdjacencyIndex(MultiGraph([(0, 1), (0, 1), (1, 2)]))
+    >>> list(A.links([0, 1], {}, keys=True))
+    [(1, 0, 0), (1, 0, 1)]
+    """
+    def __init__(self, obj):
+        r"""
+        Input:
+
+        * obj -- a graph object
+        """
+        self.directed = obj.is_directed()
+        self.keys = None  # Multigraphs: (source, target) -> edge keys
+        self.succ = {}
+        for n in obj.nodes():
+            self.succ[n] = []
+        if self.directed:
+            self.pred = dict((n, []) for n in self.succ)
+        else:
+            self.pred = self.succ
+        if obj.is_multigraph():
+            self.keys = {}
+            edges = obj.edges(keys=True)
+        else:
+            edges = obj.edges()
+        for e in edges:
+            src, tgt = e[0], e[1]
+            self.succ[src].append(tgt)
+            if self.directed or src != tgt:
+                self.pred[tgt].append(src)
+            if self.keys is not None:
+                self.keys.setdefault((src, tgt), []).append(e[2])
+                if not self.directed and src != tgt:
+                    self.keys.setdefault((tgt, src), []).append(e[2])
+
+    @classmethod
+    def from_succ(cls, succ):
+        r"""
+        Build the index of a directed graph from its successor lists.
+
+        Input:
+
+        * succ -- a dictionary node -> list of successors
+
+        Test:
+
+        >>> A = AdjacencyIndex.from_succ({1: [2, 3], 2: [3], 3: []})
+        >>> A.pred
+        {1: [], 2: [1], 3: [1, 2]}
+        """
+        index = cls.__new__(cls)
+        index.directed = True
+        index.keys = None
+        index.succ = succ
+        index.pred = dict((n, []) for n in succ)
+        for n in succ:
+            for m in succ[n]:
+                index.pred[m].append(n)
+        return index
+
+    def neighbours(self, n):
+        r"""
+        Iterate over the neighbours of a node, whatever the edge directions.
+        """
+        for m in self.succ[n]:
+            yield m
+        if self.directed:
+            for m in self.pred[n]:
+                yield m
+
+    def ball(self, center, radius=1, max_nodes=None):
+        r"""
+        Nodes at distance at most `radius` from `center`, in breadth-first order.
+
+        Input:
+
+        * center -- a node
+        * radius -- an integer
+        * max_nodes -- an integer: stop once that many nodes are found
+        """
+        if center not in self.succ:
+            raise KeyError("Unknown node: %s" % str(center))
+        found = {center: 0}
+        res = [center]
+        i = 0
+        while i < len(res) and (not max_nodes or len(res) < max_nodes):
+            n = res[i]
+            i += 1
+            if found[n] >= radius:
+                break
+            for m in self.neighbours(n):
+                if m not in found:
+                    found[m] = found[n] + 1
+                    res.append(m)
+                    if max_nodes and len(res) >= max_nodes:
+                        break
+        return res
+
+    def links(self, new, shown, keys=False):
+        r"""
+        Iterate over the edges joining some new node to another new or shown node,
+        each of them once.
+
+        Input:
+
+        * new -- a list of nodes
+        * shown -- a container of nodes (not including the new ones)
+        * keys -- a boolean: for multigraphs, give (source, target, key) triples
+        """
+        if keys and self.keys is not None:
+            pairs = set()  # Parallel edges are listed once per edge
+            for e in self.links(new, shown):
+                if e not in pairs:
+                    pairs.add(e)
+                    for k in self.keys[e]:
+                        yield e + (k,)
+            return
+        seen = set()
+        for n in new:
+            seen.add(n)
+            for m in self.succ[n]:
+                if m in shown or m in seen:
+                    yield (n, m)
+            if self.directed:
+                for m in self.pred[n]:
+                    if m in shown or (m in seen and m != n):
+                        yield (m, n)
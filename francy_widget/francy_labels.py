@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+r"""
+Node labels, computed once per object.
+
+Representations of math objects (group elements, subgroups ..)
+can be costly. Labels are kept in a bounded cache, shared by all
+graphs and widgets of the kernel, so that the same objects
+are not represented again across renderings. Long labels can be
+truncated, or abbreviated by a custom function.
+
+With lazy labels, the titles first sent to the frontend are shortened,
+and full labels are only sent when the frontend asks for them.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+from collections import OrderedDict
+from threading import Lock
+SHORT_LABEL_LENGTH = 12  # Titles first sent, with lazy labels
+
+
+def truncate(label, max_length):
+    r"""
+    Truncate a label to at most `max_length` characters.
+
+    Test:
+
+    >>> truncate('Subgroup number 3', 8), truncate('3', 8)
+    ('Subgr...', '3')
+    """
+    if max_length and len(label) > max_length:
+        return label[:max(max_length - 3, 1)] + '...'
+    return label
+
+
+class LabelCache:
+    r"""
+    A bounded cache of labels, by object, in least recently used order.
+
+    Examples:
+
+    >>> calls = []
+    >>> class Costly:
+    ...   def __init__(self, n):
+    ...     self.n = n
+    ...   def __str__(self):
+    ...     calls.append(self.n)
+    ...     return "Element number %d of a big group" % self.n
+    >>> elements = [Costly(i) for i in range(3)]
+    >>> L = LabelCache(maxsize=2, max_length=12)
+    >>> [L.label(e) for e in elements + elements[1:]]
+    ['Element n...', 'Element n...', 'Element n...', 'Element n...', 'Element n...']
+    >>> calls
+    [0, 1, 2]
+    >>> L.label(elements[0]), calls
+    ('Element n...', [0, 1, 2, 0])
+    >>> L.cache_info()
+    {'hits': 2, 'misses': 4, 'size': 2}
+    >>> LabelCache(abbreviate=lambda s: s.replace('Element number ', '#')).label(elements[2])
+    '#2 of a big group'
+    >>> L.label(1), L.label(1.0), L.label([1, 2])
+    ('1', '1.0', '[1, 2]')
+    >>> L
+    LabelCache(maxsize=2, max_length=12, abbreviate=None)
+    """
+    def __init__(self, maxsize=4096, max_length=None, abbreviate=None):
+        r"""
+        Input:
+
+        * maxsize -- an integer, the maximum number of cached labels
+        * max_length -- an integer: longer labels are truncated
+        * abbreviate -- a function, applied to each label
+        """
+        self.maxsize = int(maxsize)
+        self.max_length = max_length
+        self.abbreviate = abbreviate
+        self.hits = 0
+        self.misses = 0
+        self._labels = OrderedDict()  # (type, object) -> label, oldest first
+        self._lock = Lock()
+
+    def __repr__(self):
+        abbreviate = self.abbreviate
+        if abbreviate is not None:
+            abbreviate = "%s.%s" % (getattr(abbreviate, '__module__', ''),
+                                    getattr(abbreviate, '__name__', repr(abbreviate)))
+        return "LabelCache(maxsize=%d, max_length=%r, abbreviate=%s)" % (
+            self.maxsize, self.max_length, abbreviate)
+
+    def label(self, obj):
+        r"""
+        The label of an object.
+        """
+        if isinstance(obj, str) and not self.max_length and not self.abbreviate:
+            return obj
+        key = (type(obj), obj)  # Equal objects of other types get their own labels
+        try:
+            with self._lock:
+                if key in self._labels:
+                    self.hits += 1
+                    res = self._labels.pop(key)
+                    self._labels[key] = res
+                    return res
+        except TypeError:  # Not hashable
+            return self.make_label(obj)
+        res = self.make_label(obj)
+        with self._lock:
+            self.misses += 1
+            self._labels[key] = res
+            while len(self._labels) > self.maxsize:
+                self._labels.popitem(last=False)
+        return res
+
+    def make_label(self, obj):
+        r"""
+        Compute the label of an object.
+        """
+        res = str(obj)
+        if self.abbreviate:
+            res = self.abbreviate(res)
+        return truncate(res, self.max_length)
+
+    def cache_info(self):
+        r"""
+        Cache statistics.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._labels)}
+
+    def clear(self):
+        r"""
+        Forget all labels.
+        """
+        with self._lock:
+            self._labels.clear()
+
+
+labels = LabelCache()  # The kernel-wide label cache
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+r"""
+Queries over computed Francy graphs.
+
+Nodes and links are selected by conditions, as (attribute, operator, value)
+triples. An attribute is:
+
+* a node field ('layer', 'color', 'type', 'size', 'title' ..),
+  or a link field ('weight', 'color', 'source', 'target' ..)
+* otherwise, for nodes, a name in the node data of the graph (networkx node attributes)
+* a function of the math object (of the source and target objects, for links)
+
+Operators are '==', '!=', '<', '<=', '>', '>=' and 'in'.
+
+An index is built once per named attribute, on first use: values are then
+looked up, or ranges bisected, in time proportional to the size of the result.
+Functions are evaluated again at each query, since equal functions
+cannot be told apart.
+Selections give filtered payloads, or visibility deltas for the frontend.
+
+Examples:
+
+>>> from networkx import DiGraph
+>>> from francy_adapter import FrancyGraph
+>>> G = DiGraph([('Noether', 'Hermann'), ('Noether', 'Deuring'), ('Deuring', 'Roquette')])
+>>> for n, year in [('Noether', 1907), ('Hermann', 1926), ('Deuring', 1930), ('Roquette', 1951)]:
+...     G.nodes[n]['year'] = year
+>>> FG = FrancyGraph(G, 'c', graphType='directed')
+>>> Q = FG.query()
+>>> [FG.nodes[i]['title'] for i in Q.nodes(('year', '>=', 1930), within=Q.descendants('Noether'))]
+['Deuring', 'Roquette']
+>>> [FG.nodes[i]['title'] for i in Q.nodes(('layer', '<=', 1), ('title', 'in', ['Hermann', 'Roquette']))]
+['Hermann']
+>>> sorted(Q.filtered(Q.nodes(('year', '<', 1935)))['links'])
+['c_edge6', 'c_edge7']
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+from bisect import bisect_left, bisect_right
+OPERATORS = ['==', '!=', '<', '<=', '>', '>=', 'in']
+
+
+class AttributeIndex:
+    r"""
+    Identifiers by attribute value, with the values in order for ranges.
+
+    Test:
+
+    >>> A = AttributeIndex([('a', 3), ('b', 1), ('c', 3), ('d', None)])
+    >>> A.select('==', 3), A.select('<', 3), A.select('>=', 1), A.select('in', [1, 5])
+    (['a', 'c'], ['b'], ['b', 'a', 'c'], ['b'])
+    >>> A.select('!=', 3)
+    ['b', 'd']
+    >>> A.select('~', 3)
+    Traceback (most recent call last):
+    ...
+    ValueError: Operator must be one of: ==, !=, <, <=, >, >=, in
+    """
+    def __init__(self, values):
+        r"""
+        Input:
+
+        * values -- an iterable of (identifier, value) pairs
+        """
+        self.ids = {}  # value -> list of identifiers
+        for ident, v in values:
+            self.ids.setdefault(v, []).append(ident)
+        self._values = None  # The values in order (not None)
+
+    def values(self):
+        r"""
+        The values, in order.
+        """
+        if self._values is None:
+            try:
+                self._values = sorted(v for v in self.ids if v is not None)
+            except TypeError:
+                raise TypeError("These attribute values cannot be ordered")
+        return self._values
+
+    def select(self, op, value):
+        r"""
+        The identifiers whose value satisfies a condition.
+
+        Input:
+
+        * op -- an operator
+        * value -- the value to compare with (a list, for 'in')
+        """
+        if op == '==':
+            return list(self.ids.get(value, []))
+        if op == 'in':
+            return [ident for v in value for ident in self.ids.get(v, [])]
+        if op == '!=':
+            return [ident for v, ids in self.ids.items() if v != value for ident in ids]
+        values = self.values()
+        if op == '<':
+            chosen = values[:bisect_left(values, value)]
+        elif op == '<=':
+            chosen = values[:bisect_right(values, value)]
+        elif op == '>':
+            chosen = values[bisect_right(values, value):]
+        elif op == '>=':
+            chosen = values[bisect_left(values, value):]
+        else:
+            raise ValueError("Operator must be one of: %s" % ', '.join(OPERATORS))
+        return [ident for v in chosen for ident in self.ids[v]]
+
+
+class GraphQuery:
+    r"""
+    Queries over the nodes and links of a computed FrancyGraph,
+    with indexes built once per attribute.
+    """
+    def __init__(self, graph):
+        r"""
+        Input:
+
+        * graph -- a computed FrancyGraph object
+        """
+        self.graph = graph
+        self._indexes = {}  # (kind, attribute name) -> AttributeIndex
+        self._incident = None  # node identifier -> identifiers of its links
+
+    def index(self, attribute, kind='nodes'):
+        r"""
+        The index of an attribute, built on first use.
+        The index of a function is not kept.
+
+        Input:
+
+        * attribute -- a field name, a node data name, or a function
+        * kind -- 'nodes' or 'links'
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> from francy_adapter import FrancyGraph
+        >>> Q = FrancyGraph(path_graph(3), 'c').query()
+        >>> Q.index('layer') is Q.index('layer')
+        True
+        >>> for i in range(3):
+        ...     _ = Q.nodes((lambda n: n, '>', i))
+        >>> len(Q._indexes)
+        1
+        """
+        if callable(attribute):
+            return AttributeIndex(self._values(attribute, kind))
+        key = (kind, attribute)
+        if key not in self._indexes:
+            self._indexes[key] = AttributeIndex(self._values(attribute, kind))
+        return self._indexes[key]
+
+    def _values(self, attribute, kind):
+        graph = self.graph
+        items = getattr(graph, kind)
+        objs = graph._objs
+        if callable(attribute):
+            if kind == 'nodes':
+                return ((ident, attribute(objs[ident])) for ident in items)
+            return ((ident, attribute(objs[link['source']], objs[link['target']]))
+                    for ident, link in items.items())
+        if any(attribute in item for item in items.values()):
+            return ((ident, item.get(attribute)) for ident, item in items.items())
+        if kind == 'links':
+            raise KeyError("Unknown link field: %s" % attribute)
+        data = getattr(graph.obj, 'nodes', None)  # networkx node attributes
+        if data is None or callable(data) and not hasattr(data, '__getitem__'):
+            raise KeyError("Unknown node field: %s" % attribute)
+        return ((ident, data[objs[ident]].get(attribute)) for ident in items)
+
+    def select(self, conditions, kind='nodes', within=None):
+        r"""
+        The identifiers satisfying all conditions.
+        """
+        results = [self.index(attribute, kind).select(op, value)
+                   for attribute, op, value in conditions]
+        if within is not None:
+            results.append(list(within))
+        if not results:
+            return list(getattr(self.graph, kind))
+        results.sort(key=len)
+        res = results[0]
+        for other in results[1:]:
+            if not res:
+                break
+            other = set(other)
+            res = [ident for ident in res if ident in other]
+        return res
+
+    def nodes(self, *conditions, **kws):
+        r"""
+        The identifiers of the nodes satisfying all conditions.
+
+        Input:
+
+        * conditions -- (attribute, operator, value) triples
+        * within -- a list of node identifiers, to select from
+        """
+        return self.select(conditions, 'nodes', kws.get('within'))
+
+    def links(self, *conditions, **kws):
+        r"""
+        The identifiers of the links satisfying all conditions.
+
+        Input:
+
+        * conditions -- (attribute, operator, value) triples
+        * within -- a list of link identifiers, to select from
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> from francy_adapter import FrancyGraph
+        >>> FG = FrancyGraph(Graph([(1, 2), (2, 3), (3, 4)]), 'c')
+        >>> FG.query().links(('target', '==', 'c_node4'))
+        ['c_edge7']
+        >>> FG.query().links((lambda src, tgt: src + tgt, '>=', 5))
+        ['c_edge7', 'c_edge8']
+        """
+        return self.select(conditions, 'links', kws.get('within'))
+
+    def incident(self, ident):
+        r"""
+        The links of a node, from an index built once.
+        """
+        if self._incident is None:
+            self._incident = {}
+            for link_id, link in self.graph.links.items():
+                self._incident.setdefault(link['source'], []).append(link_id)
+                if link['target'] != link['source']:
+                    self._incident.setdefault(link['target'], []).append(link_id)
+        return self._incident.get(ident, [])
+
+    def induced_links(self, nodes):
+        r"""
+        The links between some nodes.
+
+        Input:
+
+        * nodes -- a list of node identifiers
+        """
+        shown = set(nodes)
+        res = []
+        for ident in nodes:
+            for link_id in self.incident(ident):
+                link = self.graph.links[link_id]
+                if link['source'] == ident and link['target'] in shown:  # Each link once
+                    res.append(link_id)
+        return res
+
+    def descendants(self, n):
+        r"""
+        The displayed descendants of a node (successors, for undirected graphs
+        the connected component), including the node itself.
+
+        Input:
+
+        * n -- a math object, or a node identifier
+        """
+        graph = self.graph
+        if n not in graph._ids:
+            n = graph._objs[n]
+        succ = graph.adjacency().succ
+        seen = set([n])
+        res = []
+        todo = [n]
+        while todo:
+            m = todo.pop()
+            if m in graph._ids:
+                res.append(graph._ids[m])
+            for s in succ[m]:
+                if s not in seen:
+                    seen.add(s)
+                    todo.append(s)
+        return res
+
+    def filtered(self, nodes, links=None):
+        r"""
+        The graph payload, restricted to some nodes (and to the links between them).
+
+        Input:
+
+        * nodes -- a list of node identifiers
+        * links -- a list of link identifiers (default: all links between these nodes)
+        """
+        graph = self.graph
+        if links is None:
+            links = self.induced_links(nodes)
+        res = graph.to_dict()
+        res['nodes'] = dict((ident, graph.nodes[ident]) for ident in nodes)
+        res['links'] = dict((ident, graph.links[ident]) for ident in links)
+        return res
+
+    def visibility(self, nodes, visible=None):
+        r"""
+        The changes of visibility from the visible nodes to some nodes.
+
+        Input:
+
+        * nodes -- a list of node identifiers, to be visible
+        * visible -- the currently visible node identifiers (default: all nodes)
+
+        Output:
+
+        A dictionary with the node identifiers to 'show' and to 'hide',
+        in the order of the given lists.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> from francy_adapter import FrancyGraph
+        >>> Q = FrancyGraph(path_graph(4), 'c').query()
+        >>> Q.visibility(['c_node2', 'c_node3'])
+        {'show': [], 'hide': ['c_node4', 'c_node5']}
+        >>> Q.visibility(['c_node4'], ['c_node2', 'c_node3'])
+        {'show': ['c_node4'], 'hide': ['c_node2', 'c_node3']}
+        """
+        if visible is None:
+            visible = self.graph.nodes
+            shown = visible  # Already indexed
+        else:
+            shown = set(visible)
+        chosen = set()
+        show = []
+        for ident in nodes:
+            if ident not in chosen:
+                chosen.add(ident)
+                if ident not in shown:
+                    show.append(ident)
+        return {'show': show, 'hide': [ident for ident in visible if ident not in chosen]}
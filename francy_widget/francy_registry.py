@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+r"""
+A kernel-wide registry of Francy widgets, with memory accounting.
+
+The registry estimates the memory held by the derived state
+of each widget (its JSON payload, and its computed canvas),
+and keeps widgets in least recently used order.
+When a budget is set and exceeded, the derived state of
+closed widgets, then of the least recently used ones,
+is released. It is computed again when needed (on redisplay,
+or when a node menu is used). Source graphs are never released.
+
+Examples:
+
+>>> from networkx import path_graph
+>>> from francy_widget import FrancyWidget
+>>> R = WidgetRegistry(budget=None)
+>>> widgets = [FrancyWidget(path_graph(50), registry=R) for i in range(3)]
+>>> for w in widgets:
+...     w.make_json()
+>>> R.budget = R.total() * 5 // 6  # Room for two widgets and a half
+>>> R.enforce()
+>>> [w.json_data is None for w in widgets]
+[True, False, False]
+>>> R.report()['widgets'][0]['state']
+'released'
+>>> widgets[0].make_json()
+>>> [w.json_data is None for w in widgets]
+[False, True, False]
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import sys
+import weakref
+from collections import OrderedDict
+from threading import RLock
+
+
+def canvas_size(canvas):
+    r"""
+    Estimate the memory held by a computed canvas, from one node and one link.
+
+    Test:
+
+    >>> from networkx import path_graph
+    >>> from francy_adapter import FrancyCanvas
+    >>> FC = FrancyCanvas(base_id='mycanvas')
+    >>> small = canvas_size(FC)
+    >>> FC.set_graph(path_graph(100))
+    >>> canvas_size(FC) > 100 * 500 + small
+    True
+    """
+    size = sys.getsizeof(canvas.__dict__)
+    graph = getattr(canvas, 'graph', None)
+    if not graph:
+        return size
+    for items in [graph.nodes, graph.links]:
+        if not items:
+            continue
+        sample = next(iter(items.values()))
+        item_size = sys.getsizeof(sample) + sum(sys.getsizeof(v) for v in sample.values())
+        size += sys.getsizeof(items) + len(items) * item_size
+    # Node index: identifiers, and math objects by identifier
+    size += 2 * sys.getsizeof(getattr(graph, '_objs', {}))
+    return size
+
+
+def widget_size(widget):
+    r"""
+    Estimate the memory held by the derived state of a widget.
+    """
+    size = 0
+    if widget._json_data:  # Not serialized for accounting
+        size += sys.getsizeof(widget._json_data)
+    if widget._canvas_ready:
+        size += canvas_size(widget.adapter.canvas)
+    return size
+
+
+class WidgetRegistry:
+    r"""
+    Francy widgets, in least recently used order, with their memory usage.
+    """
+    def __init__(self, budget=None):
+        r"""
+        Input:
+
+        * budget -- a number of bytes, or None (no limit)
+        """
+        self.budget = budget
+        self._widgets = OrderedDict()  # id -> weak reference to the widget, oldest first
+        self._sizes = {}  # id -> estimated size
+        self._lock = RLock()
+
+    def register(self, widget):
+        r"""
+        Start tracking a widget. It is forgotten when garbage collected.
+        """
+        key = id(widget)
+
+        def forget(ref):
+            with self._lock:
+                if self._widgets.get(key) is ref:
+                    del self._widgets[key]
+                    self._sizes.pop(key, None)
+        with self._lock:
+            self._widgets[key] = weakref.ref(widget, forget)
+            self._sizes[key] = 0
+
+    def widgets(self):
+        r"""
+        The live widgets, least recently used first.
+        """
+        with self._lock:
+            refs = list(self._widgets.values())
+        return [w for w in (ref() for ref in refs) if w is not None]
+
+    def touch(self, widget):
+        r"""
+        Mark a widget as recently used.
+        """
+        key = id(widget)
+        with self._lock:
+            if key in self._widgets:
+                self._widgets.move_to_end(key)
+
+    def update(self, widget):
+        r"""
+        Account for the current state of a widget, mark it as recently used,
+        then release other widgets if the budget is exceeded.
+        """
+        with self._lock:
+            if id(widget) not in self._widgets:
+                self.register(widget)
+            self._sizes[id(widget)] = widget_size(widget)
+            self.touch(widget)
+        self.enforce(keep=widget)
+
+    def total(self):
+        r"""
+        The estimated memory held by all widgets, in bytes.
+        """
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def enforce(self, keep=None):
+        r"""
+        Release derived state until the budget is met:
+        closed widgets first, then the least recently used ones.
+
+        Input:
+
+        * keep -- a widget that should not be released
+        """
+        if self.budget is None:
+            return
+        with self._lock:
+            widgets = [w for w in self.widgets() if w is not keep and self._sizes[id(w)]]
+            widgets.sort(key=lambda w: w.comm is not None)  # Closed ones first (stable sort)
+            for w in widgets:
+                if self.total() <= self.budget:
+                    break
+                self.release(w)
+
+    def release(self, widget):
+        r"""
+        Release the derived state of a widget.
+        """
+        with self._lock:
+            widget.release()
+            self._sizes[id(widget)] = 0
+
+    def report(self):
+        r"""
+        Memory usage, by widget (least recently used first).
+
+        Output:
+
+        A dictionary with the 'total' and the 'budget',
+        and a list of 'widgets' with their 'title', 'canvas', 'size' and 'state'.
+        """
+        res = []
+        with self._lock:
+            for w in self.widgets():
+                size = self._sizes[id(w)]
+                res.append({'title': w.title, 'canvas': getattr(w, 'canvas_id', None),
+                            'size': size, 'state': 'live' if size else 'released'})
+            return {'total': self.total(), 'budget': self.budget, 'widgets': res}
+
+
+registry = WidgetRegistry()  # The kernel-wide registry
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+r"""
+Read Sage graphs and posets directly, without a networkx conversion.
+
+Sage `Graph`, `DiGraph` and `FinitePoset` objects are wrapped
+into light views, implementing the small part of the networkx
+protocol that Francy graphs use: `nodes()`, `edges()`, `is_directed()`,
+`is_multigraph()`, `len()`, `size()`, `obj[source][target]`,
+and, for sampling, `neighbors()`, `predecessors()` and `degree()`.
+Nothing is copied: vertices and edges are read from the Sage iterators.
+Posets are read from their Hasse diagram, indexed by integers,
+and their ranks (or level sets) are used as layers.
+
+Examples (in Sage) ::
+
+    sage: from francy_widget.francy_adapter import FrancyGraph
+    sage: P = posets.BooleanLattice(3)
+    sage: FG = FrancyGraph(P, 'mycanvas', graphType='directed')
+    sage: len(FG.nodes), len(FG.links)
+    (8, 12)
+    sage: sorted(set(node['layer'] for node in FG.nodes.values()))
+    [0, 1, 2, 3]
+    sage: FG = FrancyGraph(graphs.PetersenGraph(), 'mycanvas')
+    sage: len(FG.nodes), len(FG.links)
+    (10, 15)
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+
+
+def graph_view(obj):
+    r"""
+    Wrap a Sage graph or poset into a view; other objects are returned as they are.
+
+    Test:
+
+    >>> from networkx import Graph
+    >>> G = Graph([(1, 2)])
+    >>> graph_view(G) is G
+    True
+    """
+    if hasattr(obj, 'cover_relations_iterator') and hasattr(obj, 'rank_function'):
+        return SagePosetView(obj)
+    if hasattr(obj, 'vertex_iterator') and hasattr(obj, 'edge_iterator'):
+        return SageGraphView(obj)
+    return obj
+
+
+class SageGraphView:
+    r"""
+    A view over a Sage `Graph` or `DiGraph`.
+
+    Examples (in Sage) ::
+
+        sage: V = SageGraphView(Graph([(1, 2), (1, 2), (2, 3)], multiedges=True))
+        sage: V.is_multigraph(), len(V), V.size()
+        (True, 3, 3)
+        sage: list(V.edges(keys=True))
+        [(1, 2, 0), (1, 2, 1), (2, 3, 0)]
+        sage: list(V[1][2].values())
+        [{'label': None}, {'label': None}]
+    """
+    def __init__(self, obj):
+        r"""
+        Input:
+
+        * obj -- a Sage graph
+        """
+        self._view_of = obj
+
+    def __len__(self):
+        return self._view_of.order()
+
+    def size(self):
+        return self._view_of.size()
+
+    def is_directed(self):
+        return self._view_of.is_directed()
+
+    def is_multigraph(self):
+        return self._view_of.allows_multiple_edges()
+
+    def nodes(self):
+        return list(self._view_of.vertex_iterator())
+
+    def neighbors(self, n):
+        if self._view_of.is_directed():
+            return self._view_of.neighbor_out_iterator(n)
+        return self._view_of.neighbor_iterator(n)
+
+    def predecessors(self, n):
+        return self._view_of.neighbor_in_iterator(n)
+
+    def degree(self, n):
+        return self._view_of.degree(n)
+
+    def edges(self, keys=False, data=False):
+        r"""
+        Iterate over the edges, as (source, target) pairs,
+        or (source, target, key) triples for multigraphs,
+        followed by their data ({'label': edge label}) when `data` is set.
+        """
+        counts = {}
+        for src, tgt, label in self._view_of.edge_iterator(labels=True):
+            e = (src, tgt)
+            if keys:
+                key = counts.get((src, tgt), 0)
+                counts[(src, tgt)] = key + 1
+                e += (key,)
+            if data:
+                e += ({'label': label},)
+            yield e
+
+    def __getitem__(self, src):
+        return _SageAdjacency(self._view_of, src)
+
+
+class _SageAdjacency:
+    r"""
+    Edge data between a node and its neighbours, in the networkx format:
+    `view[source][target]` is a dictionary key -> data of the edges.
+    """
+    def __init__(self, obj, src):
+        self._view_of = obj
+        self.src = src
+
+    def __getitem__(self, tgt):
+        label = self._view_of.edge_label(self.src, tgt)
+        if not self._view_of.allows_multiple_edges():
+            return {'label': label}
+        return dict((i, {'label': l}) for i, l in enumerate(label))
+
+
+class SagePosetView:
+    r"""
+    A view over a Sage `FinitePoset`: its elements, with the cover relations as edges.
+
+    Examples (in Sage) ::
+
+        sage: V = SagePosetView(posets.ChainPoset(3))
+        sage: V.nodes(), list(V.edges())
+        ([0, 1, 2], [(0, 1), (1, 2)])
+        sage: V.layering()
+        ({0: 0, 1: 1, 2: 2}, {1: 0, 2: 1})
+    """
+    def __init__(self, obj):
+        r"""
+        Input:
+
+        * obj -- a Sage finite poset
+        """
+        self._view_of = obj
+        # Integer indexing: vertex i of the Hasse diagram is the element number i
+        self._hasse = getattr(obj, '_hasse_diagram', None)
+        if self._hasse is not None and hasattr(obj, '_elements'):
+            self._elements = obj._elements
+        else:
+            self._hasse = None
+            self._elements = obj.list()
+        self._diagram = None  # The Hasse diagram on the elements, built on first edge lookup
+
+    def __len__(self):
+        return len(self._elements)
+
+    def size(self):
+        if self._hasse is not None:
+            return self._hasse.size()
+        return len(self._view_of.cover_relations())
+
+    def is_directed(self):
+        return True
+
+    def is_multigraph(self):
+        return False
+
+    def nodes(self):
+        return list(self._elements)
+
+    def neighbors(self, n):
+        return self._view_of.upper_covers_iterator(n)
+
+    def predecessors(self, n):
+        return self._view_of.lower_covers_iterator(n)
+
+    def degree(self, n):
+        return len(self._view_of.upper_covers(n)) + len(self._view_of.lower_covers(n))
+
+    def edges(self, data=False):
+        r"""
+        Iterate over the cover relations, as (lower, upper) pairs,
+        followed by empty data when `data` is set.
+        """
+        if self._hasse is None:
+            pairs = self._view_of.cover_relations_iterator()
+        else:
+            elements = self._elements
+            pairs = ((elements[i], elements[j]) for i, j in self._hasse.edge_iterator(labels=False))
+        for src, tgt in pairs:
+            if data:
+                yield (src, tgt, {})
+            else:
+                yield (src, tgt)
+
+    def __getitem__(self, src):
+        if self._diagram is None:
+            self._diagram = self._view_of.hasse_diagram()
+        return _SageAdjacency(self._diagram, src)
+
+    def layering(self):
+        r"""
+        Layers and parents, from the poset ranks (or level sets, when it is not graded).
+
+        Output:
+
+        A pair of dictionaries: element -> layer, and element -> parent element.
+        """
+        rank = self._view_of.rank_function()
+        if rank is not None:
+            layers = dict((e, int(rank(e))) for e in self._elements)
+        else:
+            layers = {}
+            for i, level in enumerate(self._view_of.level_sets()):
+                for e in level:
+                    layers[e] = i
+        parents = {}
+        for src, tgt in self.edges():
+            if tgt not in parents and layers[src] == layers[tgt] - 1:
+                parents[tgt] = src
+        return layers, parents
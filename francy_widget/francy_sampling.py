@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+r"""
+Sampling of graphs that are too large to be displayed.
+
+A sample is a set of at most `max_nodes` nodes, chosen by one of the
+strategies below, with the edges between them (at most `max_edges`).
+Samples are reproducible from a seed. Walking strategies only visit
+the neighbourhoods of the nodes they pick, so that the time spent
+is roughly proportional to the budget (not to the number of edges).
+
+* uniform -- nodes picked uniformly at random
+* random_walk -- nodes visited by a random walk, restarting at random nodes
+* forest_fire -- nodes reached by a "forest fire", burning a random
+  part of the neighbours of each burnt node
+* top_degree -- the nodes of highest degree
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import heapq
+from random import Random
+SAMPLING_STRATEGIES = ['uniform', 'random_walk', 'forest_fire', 'top_degree']
+
+
+def neighbours(obj, n):
+    r"""
+    The neighbours of a node, whatever the edge directions.
+
+    Test:
+
+    >>> from networkx import DiGraph
+    >>> neighbours(DiGraph([(1, 2), (3, 1)]), 1)
+    [2, 3]
+    """
+    res = list(obj.neighbors(n))
+    if obj.is_directed():
+        res.extend(obj.predecessors(n))
+    return res
+
+
+def sample_nodes(obj, strategy, max_nodes, seed=None):
+    r"""
+    Choose at most `max_nodes` nodes of a graph.
+
+    Input:
+
+    * obj -- a graph object
+    * strategy -- one of 'uniform', 'random_walk', 'forest_fire', 'top_degree'
+    * max_nodes -- an integer, the node budget
+    * seed -- a seed for the random number generator
+
+    Output:
+
+    A list of nodes.
+
+    Test:
+
+    >>> from networkx import barabasi_albert_graph, star_graph
+    >>> G = barabasi_albert_graph(1000, 2, seed=1)
+    >>> [len(sample_nodes(G, s, 50, seed=1)) for s in SAMPLING_STRATEGIES]
+    [50, 50, 50, 50]
+    >>> sample_nodes(G, 'forest_fire', 50, seed=2) == sample_nodes(G, 'forest_fire', 50, seed=2)
+    True
+    >>> sample_nodes(star_graph(10), 'top_degree', 2)
+    [0, 1]
+    >>> sample_nodes(G, 'snowball', 50)
+    Traceback (most recent call last):
+    ...
+    ValueError: Sampling strategy must be one of: uniform, random_walk, forest_fire, top_degree
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError("Sampling strategy must be one of: %s" % ', '.join(SAMPLING_STRATEGIES))
+    max_nodes = int(max_nodes)
+    if strategy == 'top_degree':
+        return heapq.nlargest(max_nodes, obj.nodes(), key=obj.degree)
+    rng = Random(seed)
+    nodes = list(obj.nodes())
+    if len(nodes) <= max_nodes:
+        return nodes
+    if strategy == 'uniform':
+        return rng.sample(nodes, max_nodes)
+    found = set()
+    res = []
+
+    def add(n):
+        if n not in found:
+            found.add(n)
+            res.append(n)
+    if strategy == 'random_walk':
+        n = rng.choice(nodes)
+        add(n)
+        steps = 0
+        while len(res) < max_nodes:
+            steps += 1
+            nbrs = neighbours(obj, n)
+            if not nbrs or rng.random() < 0.15 or steps > 100 * max_nodes:
+                n = rng.choice(nodes)  # Restart
+                steps = 0
+            else:
+                n = rng.choice(nbrs)
+            add(n)
+        return res
+    # Forest fire: each burnt node sets fire to a geometric number of its neighbours
+    forward = 0.7
+    while len(res) < max_nodes:
+        start = rng.choice(nodes)
+        if start in found:
+            continue
+        add(start)
+        fire = [start]
+        while fire and len(res) < max_nodes:
+            n = fire.pop(0)
+            nbrs = [m for m in neighbours(obj, n) if m not in found]
+            rng.shuffle(nbrs)
+            burnt = 0
+            while burnt < len(nbrs) and rng.random() < forward:
+                burnt += 1
+            for m in nbrs[:burnt]:
+                if len(res) >= max_nodes:
+                    break
+                add(m)
+                fire.append(m)
+    return res
+
+
+def induced_edges(obj, nodes, max_edges=None, keys=False):
+    r"""
+    The edges between some nodes, each of them once.
+
+    Input:
+
+    * obj -- a graph object
+    * nodes -- a list of nodes
+    * max_edges -- an integer, the edge budget
+    * keys -- a boolean: give (source, target, key) triples for multigraphs
+
+    Test:
+
+    >>> from networkx import complete_graph, MultiGraph
+    >>> induced_edges(complete_graph(10), [0, 1, 2])
+    [(0, 1), (0, 2), (1, 2)]
+    >>> induced_edges(complete_graph(10), [0, 1, 2], max_edges=2)
+    [(0, 1), (0, 2)]
+    >>> induced_edges(MultiGraph([(0, 1), (0, 1), (1, 2)]), [0, 1], keys=True)
+    [(0, 1, 0), (0, 1, 1)]
+    """
+    position = dict((n, i) for i, n in enumerate(nodes))
+    directed = obj.is_directed()
+    res = []
+    for n in nodes:
+        for m in obj.neighbors(n):
+            if m not in position or (not directed and position[m] < position[n]):
+                continue
+            if keys:
+                res.extend((n, m, k) for k in obj[n][m])
+            else:
+                res.append((n, m))
+            if max_edges is not None and len(res) >= max_edges:
+                return res[:max_edges]
+    return res
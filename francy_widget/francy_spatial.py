@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+r"""
+A spatial index over laid-out nodes, for viewport culling.
+
+When nodes have coordinates (`x` and `y`, from node options, from
+attribute tables, or from a layout), a quadtree indexes them.
+A viewport request is answered with the nodes in the visible window,
+the links between them, and aggregated markers (node counts and centroids)
+for the regions outside the window. The plane is cut into tiles, so that
+panning only fetches the tiles that were not sent yet.
+
+Examples:
+
+>>> from networkx import grid_2d_graph
+>>> from francy_adapter import FrancyGraph
+>>> G = grid_2d_graph(20, 20)
+>>> FG = FrancyGraph(G, 'c', positions=dict((n, (10 * n[0], 10 * n[1])) for n in G))
+>>> S = SpatialIndex(FG)
+>>> view = S.viewport(0, 0, 25, 25)
+>>> len(view['nodes']), len(view['links'])
+(9, 12)
+>>> sum(m['count'] for m in view['markers'])
+391
+>>> S.tiles(0, 0, 25, 25, level=2)
+[(2, 0, 0)]
+>>> len(S.tile(2, 0, 0)), sum(len(S.tile(2, i, j)) for i in range(4) for j in range(4))
+(25, 400)
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+
+
+class QuadTree:
+    r"""
+    A point quadtree, with node counts and coordinate sums for every cell.
+
+    Test:
+
+    >>> Q = QuadTree(0, 0, 100, 100, capacity=2)
+    >>> for i in range(10):
+    ...     Q.insert(10 * i, 10 * i, i)
+    >>> sorted(Q.query(0, 0, 35, 35))
+    [0, 1, 2, 3]
+    >>> len(Q), Q.children is not None
+    (10, True)
+    >>> [(m['count'], m['x'], m['y']) for m in Q.markers(0, 0, 35, 35)]
+    [(1, 40.0, 40.0), (5, 70.0, 70.0)]
+    """
+    def __init__(self, x0, y0, x1, y1, capacity=64, depth=0, max_depth=16):
+        r"""
+        Input:
+
+        * x0, y0, x1, y1 -- the cell bounds
+        * capacity -- the number of points in a cell, before it is split
+        * depth -- the depth of the cell
+        * max_depth -- the maximum depth (points with equal coordinates are not split)
+        """
+        self.bounds = (x0, y0, x1, y1)
+        self.capacity = capacity
+        self.depth = depth
+        self.max_depth = max_depth
+        self.points = []  # (x, y, identifier), in a leaf
+        self.children = None
+        self.count = 0
+        self.sx = 0.  # Coordinate sums, for centroids
+        self.sy = 0.
+
+    def __len__(self):
+        return self.count
+
+    def insert(self, x, y, ident):
+        r"""
+        Insert a point.
+        """
+        cell = self
+        while True:
+            cell.count += 1
+            cell.sx += x
+            cell.sy += y
+            if cell.children is None:
+                cell.points.append((x, y, ident))
+                if len(cell.points) > cell.capacity and cell.depth < cell.max_depth:
+                    cell.split()
+                return
+            cell = cell.child(x, y)
+
+    def child(self, x, y):
+        x0, y0, x1, y1 = self.bounds
+        xm, ym = (x0 + x1) / 2., (y0 + y1) / 2.
+        return self.children[(x >= xm) + 2 * (y >= ym)]
+
+    def split(self):
+        x0, y0, x1, y1 = self.bounds
+        xm, ym = (x0 + x1) / 2., (y0 + y1) / 2.
+        d = self.depth + 1
+        self.children = [QuadTree(a, b, c, e, self.capacity, d, self.max_depth)
+                         for (b, e) in [(y0, ym), (ym, y1)] for (a, c) in [(x0, xm), (xm, x1)]]
+        points, self.points = self.points, []
+        for x, y, ident in points:
+            c = self.child(x, y)
+            c.count += 1
+            c.sx += x
+            c.sy += y
+            c.points.append((x, y, ident))
+        for c in self.children:
+            if len(c.points) > c.capacity and c.depth < c.max_depth:
+                c.split()
+
+    def query(self, x0, y0, x1, y1, res=None):
+        r"""
+        The identifiers of the points in a window (bounds included).
+        """
+        if res is None:
+            res = []
+        cx0, cy0, cx1, cy1 = self.bounds
+        if not self.count or cx0 > x1 or cy0 > y1 or cx1 < x0 or cy1 < y0:
+            return res
+        if self.children is None:
+            res.extend(ident for x, y, ident in self.points if x0 <= x <= x1 and y0 <= y <= y1)
+        else:
+            for c in self.children:
+                c.query(x0, y0, x1, y1, res)
+        return res
+
+    def markers(self, x0, y0, x1, y1, res=None):
+        r"""
+        Aggregated markers for the points outside a window:
+        the largest cells outside it, with their point counts and centroids.
+        """
+        if res is None:
+            res = []
+        if not self.count:
+            return res
+        cx0, cy0, cx1, cy1 = self.bounds
+        if cx0 > x1 or cy0 > y1 or cx1 < x0 or cy1 < y0:
+            res.append({'x': self.sx / self.count, 'y': self.sy / self.count, 'count': self.count})
+        elif self.children is None:
+            outside = [(x, y) for x, y, ident in self.points
+                       if not (x0 <= x <= x1 and y0 <= y <= y1)]
+            if outside:
+                res.append({'x': sum(x for x, y in outside) / float(len(outside)),
+                            'y': sum(y for x, y in outside) / float(len(outside)),
+                            'count': len(outside)})
+        else:
+            for c in self.children:
+                c.markers(x0, y0, x1, y1, res)
+        return res
+
+
+class SpatialIndex:
+    r"""
+    A quadtree over the nodes of a computed FrancyGraph, with tiles.
+    """
+    def __init__(self, graph, capacity=64):
+        r"""
+        Input:
+
+        * graph -- a computed FrancyGraph object, with node coordinates
+        * capacity -- the number of nodes in a quadtree cell, before it is split
+        """
+        self.graph = graph
+        self.capacity = capacity
+        nodes = graph.nodes
+        xs = [node['x'] for node in nodes.values()] or [0]
+        ys = [node['y'] for node in nodes.values()] or [0]
+        # Square bounds, so that tiles are square
+        x0, y0 = min(xs), min(ys)
+        side = max(max(xs) - x0, max(ys) - y0) or 1
+        self.bounds = (x0, y0, x0 + side, y0 + side)
+        self.tree = QuadTree(*self.bounds, capacity=capacity)
+        self.update(nodes)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def update(self, nodes):
+        r"""
+        Index new nodes.
+
+        Input:
+
+        * nodes -- a list of node identifiers
+
+        Output:
+
+        False when some node lies outside the bounds: the index is to be built again.
+        """
+        x0, y0, x1, y1 = self.bounds
+        for ident in nodes:
+            node = self.graph.nodes[ident]
+            x, y = node['x'], node['y']
+            if not (x0 <= x <= x1 and y0 <= y <= y1):
+                return False
+            self.tree.insert(x, y, ident)
+        return True
+
+    def window(self, x0, y0, x1, y1):
+        r"""
+        The identifiers of the nodes in a window.
+        """
+        return self.tree.query(x0, y0, x1, y1)
+
+    def links(self, nodes, shown=None):
+        r"""
+        The links between some nodes, or between them and nodes already shown.
+
+        Input:
+
+        * nodes -- a list of node identifiers
+        * shown -- a set of node identifiers, already shown
+        """
+        query = self.graph.query()
+        new = set(nodes)
+        res = []
+        for ident in nodes:
+            for link_id in query.incident(ident):
+                link = self.graph.links[link_id]
+                other = link['target'] if link['source'] == ident else link['source']
+                if other in new:
+                    if link['source'] == ident:  # Each link once
+                        res.append(link_id)
+                elif shown and other in shown:
+                    res.append(link_id)
+        return res
+
+    def viewport(self, x0, y0, x1, y1):
+        r"""
+        The nodes in a window, the links between them,
+        and aggregated markers for the nodes outside the window.
+        """
+        nodes = self.window(x0, y0, x1, y1)
+        graph = self.graph
+        return {'nodes': dict((ident, graph.nodes[ident]) for ident in nodes),
+                'links': dict((ident, graph.links[ident]) for ident in self.links(nodes)),
+                'markers': self.tree.markers(x0, y0, x1, y1)}
+
+    def tile_size(self, level):
+        return (self.bounds[2] - self.bounds[0]) / float(2 ** level)
+
+    def tile_of(self, x, y, level):
+        r"""
+        The (level, column, row) key of the tile of a point.
+        """
+        size = self.tile_size(level)
+        last = 2 ** level - 1
+        return (level, min(int((x - self.bounds[0]) // size), last),
+                min(int((y - self.bounds[1]) // size), last))
+
+    def tiles(self, x0, y0, x1, y1, level):
+        r"""
+        The keys of the tiles covering a window.
+        """
+        bx0, by0, bx1, by1 = self.bounds
+        x0, y0, x1, y1 = max(x0, bx0), max(y0, by0), min(x1, bx1), min(y1, by1)
+        if x0 > x1 or y0 > y1:
+            return []
+        level, i0, j0 = self.tile_of(x0, y0, level)
+        level, i1, j1 = self.tile_of(x1, y1, level)
+        return [(level, i, j) for j in range(j0, j1 + 1) for i in range(i0, i1 + 1)]
+
+    def tile(self, level, i, j):
+        r"""
+        The identifiers of the nodes in a tile; every node is in one tile of a level.
+        """
+        size = self.tile_size(level)
+        x0, y0 = self.bounds[0] + i * size, self.bounds[1] + j * size
+        nodes = self.graph.nodes
+        return [ident for ident in self.tree.query(x0, y0, x0 + size, y0 + size)
+                if self.tile_of(nodes[ident]['x'], nodes[ident]['y'], level) == (level, i, j)]
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+r"""
+Node styles from attribute tables.
+
+Node options (type, size, color, layer ..) can be computed from
+a table of node attributes -- a pandas DataFrame indexed by the nodes,
+or a dictionary column name -> dictionary node -> value --
+with declarative mappings, applied to whole columns at once with NumPy:
+
+* a column name -- the values, as they are
+* ColorScale -- a numeric column, mapped to a color scale
+* SizeRange -- a numeric column, mapped to a range of node sizes
+* Categories -- a column of categories, mapped to values (node types, colors ..)
+
+Node types are checked once per category, not once per node.
+Missing values leave the graph defaults.
+
+Links are styled the same way, from the edge data of the graph
+(`weight`, `color`, `length` and `invisible` options),
+or by a function computing options for all links at once.
+This module needs NumPy.
+
+Examples:
+
+>>> from networkx import star_graph
+>>> from francy_adapter import FrancyGraph
+>>> G = star_graph(3)
+>>> table = {'degree': dict(G.degree()), 'kind': {0: 'center'}}
+>>> styles = {'size': SizeRange('degree', 5, 20), 'color': ColorScale('degree', ['#0000ff', '#ff0000']),
+...           'type': Categories('kind', {'center': 'square'}, default='circle')}
+>>> FG = FrancyGraph(G, 'mycanvas', node_table=table, node_styles=styles)
+>>> [(node['size'], node['color'], node['type']) for node in FG.nodes.values()]
+[(20, '#ff0000', 'square'), (5, '#0000ff', 'circle'), (5, '#0000ff', 'circle'), (5, '#0000ff', 'circle')]
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import copy
+import numpy as np
+try:
+    from .francy_adapter import FRANCY_NODE_TYPES
+except:
+    from francy_adapter import FRANCY_NODE_TYPES # for doctesting
+LINK_OPTIONS = ['weight', 'color', 'length', 'invisible']
+INTEGER_OPTIONS = ['layer', 'size', 'weight']
+
+
+def hex_color(color):
+    r"""
+    The (red, green, blue) components of a '#rrggbb' color.
+
+    Test:
+
+    >>> hex_color('#ff8000')
+    (255, 128, 0)
+    """
+    color = color.lstrip('#')
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def scaled(values, vmin=None, vmax=None):
+    r"""
+    Numeric values, scaled to [0, 1] and clipped. NaN values stay NaN.
+
+    Test:
+
+    >>> scaled(np.array([1., 3., np.nan, 5.])).tolist()
+    [0.0, 0.5, nan, 1.0]
+    >>> scaled(np.array([2., 2.])).tolist()
+    [0.0, 0.0]
+    >>> scaled(np.array([0, None, 4], dtype=object)).tolist()
+    [0.0, nan, 1.0]
+    """
+    values = numeric(values)
+    if vmin is None:
+        vmin = np.nanmin(values) if np.isfinite(values).any() else 0.
+    if vmax is None:
+        vmax = np.nanmax(values) if np.isfinite(values).any() else 1.
+    if vmax <= vmin:
+        return np.where(np.isnan(values), np.nan, 0.)
+    return np.clip((values - vmin) / float(vmax - vmin), 0., 1.)
+
+
+def numeric(values):
+    r"""
+    Values as floats, with NaN for missing values.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'O':
+        values = np.where(missing(values), np.nan, values)
+    return values.astype(float)
+
+
+def missing(values):
+    r"""
+    Which values are missing (None or NaN).
+
+    Test:
+
+    >>> missing(np.array([1, None, float('nan'), 'a'], dtype=object)).tolist()
+    [False, True, True, False]
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'fc':
+        return np.isnan(values)
+    if values.dtype.kind != 'O':
+        return np.zeros(len(values), dtype=bool)
+    return np.asarray(np.equal(values, None) | (values != values), dtype=bool)
+
+
+class NodeStyle:
+    r"""
+    A mapping from a column of node attributes to the values of a node option.
+    """
+    def __init__(self, column):
+        r"""
+        Input:
+
+        * column -- a column name
+        """
+        self.column = column
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ', '.join(
+            "%s=%r" % (k, v) for k, v in sorted(self.__dict__.items())))
+
+    def apply(self, values):
+        r"""
+        Map a column of values.
+
+        Input:
+
+        * values -- a NumPy array
+
+        Output:
+
+        A NumPy array, of the same length, with None for missing values.
+        """
+        return np.asarray(values, dtype=object)
+
+
+class ColorScale(NodeStyle):
+    r"""
+    A numeric column mapped to a color scale, linear between color stops.
+
+    Test:
+
+    >>> ColorScale('x', ['#000000', '#ff0000', '#ffffff']).apply(np.array([0, 1, 2, 3, 4, np.nan])).tolist()
+    ['#000000', '#800000', '#ff0000', '#ff8080', '#ffffff', None]
+    """
+    def __init__(self, column, colors=('#ffffcc', '#800026'), vmin=None, vmax=None):
+        r"""
+        Input:
+
+        * column -- a column name
+        * colors -- a list of '#rrggbb' colors, from the lowest values to the highest
+        * vmin -- the value of the first color (default: the column minimum)
+        * vmax -- the value of the last color (default: the column maximum)
+        """
+        super(ColorScale, self).__init__(column)
+        self.colors = list(colors)
+        self.vmin = vmin
+        self.vmax = vmax
+
+    def apply(self, values):
+        t = scaled(values, self.vmin, self.vmax)
+        stops = np.linspace(0., 1., len(self.colors))
+        rgb = np.array([hex_color(c) for c in self.colors], dtype=float)
+        absent = np.isnan(t)
+        t = np.where(absent, 0., t)
+        channels = [np.rint(np.interp(t, stops, rgb[:, i])).astype(int) for i in range(3)]
+        codes = channels[0] * 65536 + channels[1] * 256 + channels[2]
+        # Format each distinct color once
+        uniques, inverse = np.unique(codes, return_inverse=True)
+        res = np.array(['#%06x' % c for c in uniques], dtype=object)[inverse]
+        res[absent] = None
+        return res
+
+
+class SizeRange(NodeStyle):
+    r"""
+    A numeric column mapped linearly to a range of node sizes.
+
+    Test:
+
+    >>> SizeRange('x', 10, 20).apply(np.array([0, 5, 10, np.nan])).tolist()
+    [10, 15, 20, None]
+    """
+    def __init__(self, column, smin=5, smax=30, vmin=None, vmax=None):
+        r"""
+        Input:
+
+        * column -- a column name
+        * smin -- the size for the lowest values
+        * smax -- the size for the highest values
+        * vmin -- the value of the smallest size (default: the column minimum)
+        * vmax -- the value of the largest size (default: the column maximum)
+        """
+        super(SizeRange, self).__init__(column)
+        self.smin = smin
+        self.smax = smax
+        self.vmin = vmin
+        self.vmax = vmax
+
+    def apply(self, values):
+        t = scaled(values, self.vmin, self.vmax)
+        absent = np.isnan(t)
+        sizes = np.rint(self.smin + np.where(absent, 0., t) * (self.smax - self.smin)).astype(int)
+        res = sizes.astype(object)
+        res[absent] = None
+        return res
+
+
+class Categories(NodeStyle):
+    r"""
+    A column of categories mapped to values, such as node types or colors.
+
+    Test:
+
+    >>> Categories('x', {'a': 'square'}, default='circle').apply(np.array(['a', 'b', 'a'], dtype=object)).tolist()
+    ['square', 'circle', 'square']
+    """
+    def __init__(self, column, mapping, default=None):
+        r"""
+        Input:
+
+        * column -- a column name
+        * mapping -- a dictionary category -> value
+        * default -- the value for other categories (None: the graph default)
+        """
+        super(Categories, self).__init__(column)
+        self.mapping = mapping
+        self.default = default
+
+    def apply(self, values):
+        values = np.asarray(values, dtype=object)
+        present = ~missing(values)
+        res = np.empty(len(values), dtype=object)
+        if present.any():
+            # Map each category once
+            uniques, inverse = np.unique(values[present].astype(str), return_inverse=True)
+            keys = dict((str(k), k) for k in self.mapping)
+            mapped = np.array([self.mapping.get(keys.get(u), self.default) for u in uniques], dtype=object)
+            res[present] = mapped[inverse]
+        res[~present] = self.default
+        return res
+
+
+def table_columns(table, names, nodes):
+    r"""
+    Columns of a node attribute table, as NumPy arrays.
+
+    Input:
+
+    * table -- a pandas DataFrame indexed by the nodes,
+      or a dictionary column name -> dictionary node -> value
+    * names -- a list of column names
+    * nodes -- the graph nodes (for dictionary tables)
+
+    Output:
+
+    A (list of nodes, dictionary column name -> NumPy array) pair.
+
+    Test:
+
+    >>> nodes, columns = table_columns({'x': {1: 2.5}}, ['x'], [1, 2])
+    >>> nodes, columns['x'].tolist()
+    ([1, 2], [2.5, None])
+    """
+    if hasattr(table, 'index') and hasattr(table, 'columns'):  # A DataFrame
+        return list(table.index), dict((name, table[name].to_numpy()) for name in names)
+    nodes = list(nodes)
+    columns = {}
+    for name in names:
+        column = table[name]
+        columns[name] = np.array([column.get(n) for n in nodes], dtype=object)
+    return nodes, columns
+
+
+def style_table(table, styles, nodes):
+    r"""
+    Node options, computed column by column.
+
+    Input:
+
+    * table -- a node attribute table
+    * styles -- a dictionary node option -> column name or NodeStyle object
+    * nodes -- the graph nodes
+
+    Output:
+
+    A (dictionary node -> row number, dictionary node option -> list of values) pair.
+
+    Test:
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'year': [1990, 2000, 2010], 'kind': ['a', 'b', 'c']}, index=['x', 'y', 'z'])
+    >>> rows, options = style_table(df, {'layer': 'year', 'size': SizeRange('year', 10, 30)}, [])
+    >>> rows, options
+    ({'x': 0, 'y': 1, 'z': 2}, {'layer': [1990, 2000, 2010], 'size': [10, 20, 30]})
+    >>> style_table(df, {'type': Categories('kind', {'a': 'square', 'b': 'hexagon'})}, [])
+    Traceback (most recent call last):
+    ...
+    TypeError: Node type must be one of: circle, diamond, square
+    """
+    names = [s.column if isinstance(s, NodeStyle) else s for s in styles.values()]
+    nodes, columns = table_columns(table, sorted(set(names)), nodes)
+    return dict((n, i) for i, n in enumerate(nodes)), apply_styles(columns, styles)
+
+
+def apply_styles(columns, styles):
+    r"""
+    Apply styles to columns of attributes.
+
+    Input:
+
+    * columns -- a dictionary column name -> NumPy array
+    * styles -- a dictionary option -> column name or NodeStyle object
+
+    Output:
+
+    A dictionary option -> list of values, with None for missing values.
+    """
+    options = {}
+    for optname, style in styles.items():
+        if isinstance(style, NodeStyle):
+            values = style.apply(columns[style.column])
+        else:
+            values = np.asarray(columns[style], dtype=object)
+            values[missing(values)] = None
+        present = ~missing(values)
+        if optname in INTEGER_OPTIONS:  # Typecasting (for NumPy integers ..)
+            values[present] = values[present].astype(float).astype(int)
+        elif optname == 'invisible':
+            values[present] = values[present].astype(bool)
+        if optname == 'type':
+            for t in np.unique(values[present].astype(str)):  # Once per category
+                if t not in FRANCY_NODE_TYPES:
+                    raise TypeError("Node type must be one of: %s" % ', '.join(FRANCY_NODE_TYPES))
+        options[optname] = values.tolist()
+    return options
+
+
+def bounded_styles(styles, data):
+    r"""
+    Styles with the bounds of their scales fixed from the edge data,
+    so that links added later are mapped as the first ones.
+
+    Input:
+
+    * styles -- a dictionary link option -> edge attribute name or NodeStyle object
+    * data -- a list of edge data dictionaries
+
+    Test:
+
+    >>> styles = bounded_styles({'color': ColorScale('w'), 'weight': 'w'}, [{'w': 2}, {'w': 6}, {}])
+    >>> styles['color'].vmin, styles['color'].vmax, styles['weight']
+    (2.0, 6.0, 'w')
+    >>> style_links([(1, 2)], [{'w': 4}], styles)
+    [{'color': '#c08079', 'weight': 4}]
+    """
+    res = {}
+    for optname, style in styles.items():
+        if getattr(style, 'vmin', 0) is None or getattr(style, 'vmax', 0) is None:
+            values = numeric([d.get(style.column) for d in data])
+            if np.isfinite(values).any():
+                style = copy.copy(style)
+                if style.vmin is None:
+                    style.vmin = float(np.nanmin(values))
+                if style.vmax is None:
+                    style.vmax = float(np.nanmax(values))
+        res[optname] = style
+    return res
+
+
+def style_links(edges, data, styles=None, batch_options=None):
+    r"""
+    Link options, computed column by column from the edge data.
+
+    Input:
+
+    * edges -- a list of (source, target) pairs, or (source, target, key) triples
+    * data -- the list of their edge data dictionaries
+    * styles -- a dictionary link option -> edge attribute name or NodeStyle object
+    * batch_options -- a function of the edges and their data,
+      returning a dictionary link option -> list of values
+
+    Output:
+
+    A list of dictionaries of link options, one for each edge.
+
+    Test:
+
+    >>> edges = [(1, 2), (2, 3), (3, 4)]
+    >>> data = [{'weight': 1, 'kind': 'a'}, {'weight': 3}, {'weight': 5, 'kind': 'b'}]
+    >>> style_links(edges, data, {'weight': 'weight', 'color': ColorScale('weight', ['#000000', '#ffffff'])})
+    [{'weight': 1, 'color': '#000000'}, {'weight': 3, 'color': '#808080'}, {'weight': 5, 'color': '#ffffff'}]
+    >>> def dashed(edges, data):
+    ...   return {'invisible': [d.get('kind') == 'b' for d in data]}
+    >>> style_links(edges, data, {'color': Categories('kind', {'a': 'red'})}, dashed)
+    [{'color': 'red', 'invisible': False}, {'invisible': False}, {'invisible': True}]
+    >>> style_links(edges, data, {'size': 'weight'})
+    Traceback (most recent call last):
+    ...
+    ValueError: Link options must be among: weight, color, length, invisible
+    >>> style_links(edges, data, batch_options=lambda edges, data: {'weight': [1, 2]})
+    Traceback (most recent call last):
+    ...
+    ValueError: Batch link option 'weight' has 2 values, for 3 edges
+    """
+    options = {}
+    if styles:
+        for optname in styles:
+            if optname not in LINK_OPTIONS:
+                raise ValueError("Link options must be among: %s" % ', '.join(LINK_OPTIONS))
+        names = set(s.column if isinstance(s, NodeStyle) else s for s in styles.values())
+        columns = dict((name, np.array([d.get(name) for d in data], dtype=object)) for name in names)
+        options.update(apply_styles(columns, styles))
+    if batch_options:
+        batch = batch_options(edges, data)
+        for optname in batch:
+            if len(batch[optname]) != len(edges):
+                raise ValueError("Batch link option '%s' has %d values, for %d edges" % (
+                    optname, len(batch[optname]), len(edges)))
+        options.update(batch)
+    optnames = list(options)
+    return [dict((k, v) for k, v in zip(optnames, row) if v is not None)
+            for row in zip(*[options[k] for k in optnames])] or [{} for e in edges]
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+r"""
+Static SVG rendering of computed Francy canvases.
+
+For graphs too large for the interactive frontend, or for reports,
+a computed canvas (with node coordinates, see the `positions` option)
+is drawn kernel-side as a compact SVG document, written as a stream of chunks.
+The drawing is fitted to the canvas size. Nodes below pixel size are left out;
+small nodes close to each other are merged into one marker,
+and the links between merged nodes are drawn once.
+
+Examples:
+
+>>> from networkx import path_graph
+>>> from francy_adapter import FrancyCanvas
+>>> FC = FrancyCanvas(base_id='c', width=200, height=100)
+>>> FC.set_graph(path_graph(3), positions={0: (0, 0), 1: (50, 0), 2: (100, 50)})
+>>> print(render_svg(FC))
+<svg xmlns="http://www.w3.org/2000/svg" width="200" height="100" viewBox="0 0 200 100">
+<title>My Canvas</title>
+<g class="links" stroke="#999">
+<line x1="42.9" y1="21.4" x2="100.0" y2="21.4"/>
+<line x1="100.0" y1="21.4" x2="157.1" y2="78.6"/>
+</g>
+<g class="nodes" stroke="#fff">
+<circle cx="42.9" cy="21.4" r="11.4" fill="#d62728"/>
+<circle cx="100.0" cy="21.4" r="11.4" fill="#9467bd"/>
+<circle cx="157.1" cy="78.6" r="11.4" fill="#8c564b"/>
+</g>
+</svg>
+<BLANKLINE>
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import os
+from xml.sax.saxutils import escape, quoteattr
+SVG_MIMETYPE = 'image/svg+xml'
+PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+           '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']  # Node colors, by layer
+SVG_HEADER = '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n'
+ARROW = ('<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" '
+         'markerWidth="6" markerHeight="6" orient="auto">'
+         '<path d="M0,0L10,5L0,10z" fill="#999"/></marker></defs>\n')
+
+
+class SvgRenderer:
+    r"""
+    Draws a computed FrancyCanvas as SVG.
+
+    Test:
+
+    >>> from networkx import grid_2d_graph, path_graph
+    >>> from francy_adapter import FrancyCanvas
+    >>> G = grid_2d_graph(100, 100)
+    >>> FC = FrancyCanvas(base_id='c', width=400, height=400)
+    >>> FC.set_graph(G, positions=dict((n, (10 * n[0], 10 * n[1])) for n in G))
+    >>> svg = render_svg(FC)
+    >>> svg.count('<circle'), svg.count('class="merged"'), svg.count('<line')
+    (2304, 2300, 4512)
+    >>> len(svg) < len(render_svg(FC, merge_size=0)) / 3
+    True
+    >>> svg = render_svg(FC, cull_size=4)
+    >>> svg.count('<circle'), svg.count('<line')
+    (0, 0)
+    >>> FC.set_graph(path_graph(3))
+    >>> render_svg(FC)
+    Traceback (most recent call last):
+    ...
+    ValueError: The nodes have no coordinates: use the 'positions' option
+    """
+    def __init__(self, width=None, height=None, margin=10, cull_size=0.5, merge_size=4,
+                 labels=False, chunk_size=1 << 16):
+        r"""
+        Input:
+
+        * width -- the drawing width, in pixels (default: the canvas width)
+        * height -- the drawing height, in pixels (default: the canvas height)
+        * margin -- the margin, in pixels
+        * cull_size -- nodes with a smaller radius, in pixels, are left out
+        * merge_size -- nodes with a smaller radius, in pixels, are merged
+          with their neighbours within a cell of twice this size
+        * labels -- a boolean: whether node titles are drawn (for nodes that are not merged)
+        * chunk_size -- the size of the chunks of output
+        """
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.cull_size = cull_size
+        self.merge_size = merge_size
+        self.labels = labels
+        self.chunk_size = chunk_size
+
+    def transform(self, canvas):
+        r"""
+        The scale and translation fitting the graph into the drawing.
+
+        Output:
+
+        A (scale, dx, dy) tuple: pixel = scale * coordinate + translation.
+        """
+        width, height = self.width or canvas.width, self.height or canvas.height
+        nodes = canvas.graph.nodes.values()
+        if len(nodes) > 1 and not any(node['x'] or node['y'] for node in nodes):
+            raise ValueError("The nodes have no coordinates: use the 'positions' option")
+        x0 = min([node['x'] - (node['size'] or 0) for node in nodes] or [0])
+        y0 = min([node['y'] - (node['size'] or 0) for node in nodes] or [0])
+        x1 = max([node['x'] + (node['size'] or 0) for node in nodes] or [1])
+        y1 = max([node['y'] + (node['size'] or 0) for node in nodes] or [1])
+        scale = min((width - 2 * self.margin) / float(x1 - x0 or 1),
+                    (height - 2 * self.margin) / float(y1 - y0 or 1))
+        # Centered
+        dx = (width - scale * (x0 + x1)) / 2.
+        dy = (height - scale * (y0 + y1)) / 2.
+        return scale, dx, dy
+
+    def render(self, canvas):
+        r"""
+        The SVG document, as a generator of chunks.
+
+        Input:
+
+        * canvas -- a FrancyCanvas object, with a computed graph
+        """
+        graph = canvas.graph
+        scale, dx, dy = self.transform(canvas)
+        width, height = self.width or canvas.width, self.height or canvas.height
+        places = {}  # node identifier -> key of its drawing
+        shapes = {}  # key -> (x, y, radius, node or None), in pixels
+        cells = {}  # cell -> [sum of x, sum of y, count, first node]
+        cell_size = 2. * self.merge_size
+        for ident, node in graph.nodes.items():
+            r = (node['size'] or 0) * scale
+            if r < self.cull_size:
+                continue
+            x, y = scale * node['x'] + dx, scale * node['y'] + dy
+            if r < self.merge_size:
+                key = (int(x // cell_size), int(y // cell_size))
+                acc = cells.get(key)
+                if acc is None:
+                    cells[key] = [x, y, 1, node]
+                else:
+                    acc[0] += x
+                    acc[1] += y
+                    acc[2] += 1
+                places[ident] = key
+            else:
+                places[ident] = ident
+                shapes[ident] = (x, y, r, node)
+        for key, (sx, sy, count, node) in cells.items():
+            if count == 1:
+                shapes[key] = (sx, sy, (node['size'] or 0) * scale, node)
+            else:
+                shapes[key] = (sx / count, sy / count, self.merge_size, None)
+        buf = []
+        size = [0]
+
+        def out(s):
+            buf.append(s)
+            size[0] += len(s)
+
+        def flush():
+            res = ''.join(buf)
+            del buf[:]
+            size[0] = 0
+            return res
+        out(SVG_HEADER % (width, height, width, height))
+        out('<title>%s</title>\n' % escape(canvas.title))
+        directed = graph.graphType != 'undirected'
+        if directed:
+            out(ARROW)
+        out('<g class="links" stroke="#999"%s>\n' % (
+            ' marker-end="url(#arrow)"' if directed else ''))
+        drawn = set()
+        for link in graph.links.values():
+            if link.get('invisible'):
+                continue
+            a, b = places.get(link['source']), places.get(link['target'])
+            if a is None or b is None or a == b:
+                continue
+            pair = (a, b) if directed or str(a) < str(b) else (b, a)
+            if pair in drawn:
+                continue  # Between merged nodes
+            drawn.add(pair)
+            x1, y1 = shapes[a][:2]
+            x2, y2 = shapes[b][:2]
+            if abs(x2 - x1) < self.cull_size and abs(y2 - y1) < self.cull_size:
+                continue
+            color = link.get('color')
+            out('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f"%s/>\n' % (
+                x1, y1, x2, y2, color and ' stroke=%s' % quoteattr(color) or ''))
+            if size[0] >= self.chunk_size:
+                yield flush()
+        out('</g>\n<g class="nodes" stroke="#fff">\n')
+        for key, (x, y, r, node) in shapes.items():
+            if node is None:
+                out('<circle class="merged" cx="%.1f" cy="%.1f" r="%.1f" fill="#999"><title>%d nodes</title></circle>\n'
+                    % (x, y, r, cells[key][2]))
+            else:
+                out(self.node_shape(node, x, y, r))
+            if size[0] >= self.chunk_size:
+                yield flush()
+        out('</g>\n</svg>\n')
+        yield flush()
+
+    def node_shape(self, node, x, y, r):
+        r"""
+        The SVG element of a node, at pixel coordinates, with its radius.
+        """
+        color = node['color'] or PALETTE[(node['layer'] or 0) % len(PALETTE)]
+        if node['type'] == 'square':
+            res = '<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" fill=%s/>\n' % (
+                x - r, y - r, 2 * r, 2 * r, quoteattr(color))
+        elif node['type'] == 'diamond':
+            res = '<polygon points="%.1f,%.1f %.1f,%.1f %.1f,%.1f %.1f,%.1f" fill=%s/>\n' % (
+                x, y - r, x + r, y, x, y + r, x - r, y, quoteattr(color))
+        else:
+            res = '<circle cx="%.1f" cy="%.1f" r="%.1f" fill=%s/>\n' % (x, y, r, quoteattr(color))
+        if self.labels and node['title']:
+            res += '<text x="%.1f" y="%.1f" stroke="none">%s</text>\n' % (
+                x + r + 2, y + 4, escape(str(node['title'])))
+        return res
+
+
+def render_svg(canvas, **kws):
+    r"""
+    The SVG document of a computed canvas, as a string.
+
+    Input:
+
+    * canvas -- a FrancyCanvas object, with a computed graph
+    * kws -- SvgRenderer options
+    """
+    return ''.join(SvgRenderer(**kws).render(canvas))
+
+
+def write_svg(canvas, out, **kws):
+    r"""
+    Write the SVG document of a computed canvas to a file, as a stream of chunks.
+    A file path is written under a temporary name, then renamed.
+
+    Input:
+
+    * canvas -- a FrancyCanvas object, with a computed graph
+    * out -- a file path, or a file object
+    * kws -- SvgRenderer options
+
+    Test:
+
+    >>> import os, tempfile
+    >>> from networkx import cycle_graph, circular_layout
+    >>> from francy_adapter import FrancyCanvas
+    >>> FC = FrancyCanvas(base_id='c', title="A <cycle>")
+    >>> FC.set_graph(cycle_graph(5), graphType='directed', nodeType='diamond',
+    ...              positions=lambda G: dict((n, 100 * p) for n, p in circular_layout(G).items()))
+    >>> out = os.path.join(tempfile.mkdtemp(), 'cycle.svg')
+    >>> write_svg(FC, out, labels=True)
+    >>> svg = open(out).read()
+    >>> svg.count('<polygon'), svg.count('<line'), svg.count('<text'), '<title>A &lt;cycle&gt;</title>' in svg
+    (5, 5, 5, True)
+    """
+    renderer = SvgRenderer(**kws)
+    if hasattr(out, 'write'):
+        for chunk in renderer.render(canvas):
+            out.write(chunk)
+        return
+    tmp = out + '.tmp'
+    with open(tmp, 'w') as f:
+        for chunk in renderer.render(canvas):
+            f.write(chunk)
+    os.replace(tmp, out)
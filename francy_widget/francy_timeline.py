@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+r"""
+Precomputed animation timelines for Francy graphs.
+
+A timeline is made of a base graph, encoded once,
+and of a list of steps, each encoded as a compact delta
+over the previous step. The whole timeline is sent with
+the canvas, so that the frontend can scrub through the steps
+without a kernel round-trip for each frame.
+
+The timeline is sent as a 'timeline' entry of the canvas, which is not
+part of the Francy schema: only a frontend supporting it plays the steps,
+the stock Francy frontend ignores it and displays the base graph.
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+from copy import copy
+try:
+    from .francy_adapter import FrancyOutput, FrancyGraph, GraphEdge, francy_id, FRANCY_NODE_TYPES
+except:
+    from francy_adapter import FrancyOutput, FrancyGraph, GraphEdge, francy_id, FRANCY_NODE_TYPES # for doctesting
+TIMELINE_NODE_FIELDS = ['type', 'size', 'title', 'color', 'highlight', 'layer']
+
+
+class FrancyTimeline(FrancyOutput):
+    r"""
+    A sequence of step changes over a computed FrancyGraph.
+
+    Each step is a dictionary, with optional entries:
+
+    * nodes -- a dictionary node -> dictionary of changed node fields
+    * add_links -- a list of (source, target) or (source, target, options) tuples
+    * remove_links -- a list of (source, target) tuples
+
+    Nodes are given as math objects (or as Francy node ids).
+    Changes are cumulative: a step applies to the state left by the previous one.
+
+    Examples:
+
+    >>> from networkx import Graph
+    >>> FG = FrancyGraph(Graph([(1, 2), (2, 3)]), 'mycanvas')
+    >>> T = FrancyTimeline(FG, [
+    ...     {'nodes': {1: {'color': 'red'}}},
+    ...     {'nodes': {1: {'color': ''}, 2: {'color': 'red'}}, 'add_links': [(1, 3)]}], 'mycanvas')
+    >>> len(T)
+    2
+    >>> T.to_json()
+    '{"id": "mycanvas_timeline1", "steps": [{"nodes": {"mycanvas_node2": {"color": "red"}}}, {"nodes": {"mycanvas_node2": {"color": ""}, "mycanvas_node3": {"color": "red"}}, "addLinks": {"mycanvas_edge7": {"source": "mycanvas_node2", "weight": 1, "color": "", "target": "mycanvas_node4", "id": "mycanvas_edge7"}}}]}'
+    """
+    def __init__(self, graph, steps=[], canvas_id=None, counter=0):
+        r"""
+        Input:
+
+        * graph -- a computed FrancyGraph object
+        * steps -- a list of step changes
+        * canvas_id -- a string
+        * counter -- an integer
+        """
+        super(FrancyTimeline, self).__init__(canvas_id, 'timeline', counter)
+        self._graph = graph
+        self._counter = graph._last_counter  # Link ids go on after the graph ones
+        self._links = {}  # (source id, target id) -> link id, as of the last step
+        for ident, link in graph.links.items():
+            self._index_link(link['source'], link['target'], ident)
+        self.steps = []
+        for step in steps:
+            self.add_step(step)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _index_link(self, src, tgt, ident):
+        self._links[(src, tgt)] = ident
+        if not self._graph.obj.is_directed():
+            self._links[(tgt, src)] = ident
+
+    def node_id(self, n):
+        r"""
+        Francy id of a graph node.
+
+        Input:
+
+        * n -- a math object, or a Francy node id
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> T = FrancyTimeline(FrancyGraph(Graph([(1, 2)]), 'mycanvas'))
+        >>> T.node_id(2), T.node_id('mycanvas_node2')
+        ('mycanvas_node3', 'mycanvas_node2')
+        """
+        if n in self._graph._ids:
+            return self._graph._ids[n]
+        if n in self._graph.nodes:
+            return n
+        raise KeyError("Unknown node: %s" % str(n))
+
+    def add_step(self, step):
+        r"""
+        Encode a step as a delta, and append it to the timeline.
+
+        Input:
+
+        * step -- a dictionary of changes (see the class documentation)
+
+        Test:
+
+        >>> from networkx import DiGraph
+        >>> T = FrancyTimeline(FrancyGraph(DiGraph([(1, 2)]), 'mycanvas', graphType='directed'))
+        >>> T.add_step({'remove_links': [(1, 2)], 'nodes': {2: {'type': 'square', 'layer': 1.0}}})
+        >>> T.steps
+        [{'nodes': {'mycanvas_node3': {'type': 'square', 'layer': 1}}, 'removeLinks': ['mycanvas_edge4']}]
+        >>> T.add_step({'remove_links': [(1, 2)]})
+        Traceback (most recent call last):
+        ...
+        KeyError: 'No link between 1 and 2'
+        >>> T.add_step({'nodes': {1: {'type': 'star'}}})
+        Traceback (most recent call last):
+        ...
+        TypeError: Node type must be one of: circle, diamond, square
+
+        Links of undirected graphs are found both ways, whatever the graph type:
+
+        >>> from networkx import Graph
+        >>> T = FrancyTimeline(FrancyGraph(Graph([(1, 2), (2, 3)]), 'mycanvas', graphType='tree'))
+        >>> T.add_step({'remove_links': [(2, 1)]})
+        >>> T.steps
+        [{'removeLinks': ['mycanvas_edge5']}]
+        """
+        delta = {}
+        nodes = {}
+        for n, changes in step.get('nodes', {}).items():
+            fields = {}
+            for k, v in changes.items():
+                if k not in TIMELINE_NODE_FIELDS:
+                    raise KeyError("Node field must be one of: %s" % ', '.join(TIMELINE_NODE_FIELDS))
+                if k == 'type' and v not in FRANCY_NODE_TYPES:
+                    raise TypeError("Node type must be one of: %s" % ', '.join(FRANCY_NODE_TYPES))
+                if k == 'layer':
+                    v = int(v)  # Typecasting (for Sage Integers ..)
+                elif k == 'title':
+                    v = str(v)
+                fields[k] = v
+            nodes[self.node_id(n)] = fields
+        if nodes:
+            delta['nodes'] = nodes
+        links = {}
+        for link in step.get('add_links', []):
+            src, tgt = self.node_id(link[0]), self.node_id(link[1])
+            options = {'color': self._graph.color, 'weight': self._graph.weight}
+            if len(link) > 2:
+                options.update(link[2])
+            self._counter += 1
+            ident = francy_id(self._graph.canvas_id, 'edge', self._counter)
+            links[ident] = GraphEdge(id=ident, source=src, target=tgt, **options)
+            self._index_link(src, tgt, ident)
+        if links:
+            delta['addLinks'] = links
+        removed = []
+        for link in step.get('remove_links', []):
+            src, tgt = self.node_id(link[0]), self.node_id(link[1])
+            if (src, tgt) not in self._links:
+                raise KeyError("No link between %s and %s" % (link[0], link[1]))
+            ident = self._links[(src, tgt)]
+            for k in [(src, tgt), (tgt, src)]:
+                if self._links.get(k) == ident:
+                    del self._links[k]
+            removed.append(ident)
+        if removed:
+            delta['removeLinks'] = removed
+        self.steps.append(delta)
+
+    def frame(self, index):
+        r"""
+        Rebuild the full state of the graph at some step.
+
+        Input:
+
+        * index -- an integer; -1 stands for the base graph
+
+        Output:
+
+        A (nodes, links) pair of dictionaries.
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> FG = FrancyGraph(Graph([(1, 2), (2, 3)]), 'mycanvas')
+        >>> T = FrancyTimeline(FG, [{'nodes': {1: {'color': 'red'}}}, {'remove_links': [(2, 1)]}])
+        >>> nodes, links = T.frame(-1)
+        >>> nodes['mycanvas_node2']['color'], len(links)
+        ('', 2)
+        >>> nodes, links = T.frame(1)
+        >>> nodes['mycanvas_node2']['color'], sorted(links)
+        ('red', ['mycanvas_edge6'])
+        >>> FG.nodes['mycanvas_node2']['color']
+        ''
+        """
+        nodes = dict(self._graph.nodes)
+        links = dict(self._graph.links)
+        for delta in self.steps[:index + 1]:
+            for ident, fields in delta.get('nodes', {}).items():
+                node = copy(nodes[ident])
+                node.update(fields)
+                nodes[ident] = node
+            links.update(delta.get('addLinks', {}))
+            for ident in delta.get('removeLinks', []):
+                del links[ident]
+        return nodes, links
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+r"""
+Streaming validation of Francy JSON payloads.
+
+A payload is checked in one pass, without building it in memory:
+the canvas and graph headers are walked member by member,
+and each node and link is decoded, checked and dropped in turn.
+Only the node identifiers are kept, to check link ends.
+Files are read by chunks.
+
+The checks are:
+
+* well-formedness, as JSON
+* required fields: the canvas and its 'id', the graph 'id', 'nodes' and 'links',
+  the node 'id' (the node key), the link 'source' and 'target'
+* node types within FRANCY_NODE_TYPES, graph types within FRANCY_GRAPH_TYPES
+* link ends that are nodes of the graph
+
+The first error is reported with its location, as by the json module.
+
+Examples:
+
+>>> from networkx import path_graph
+>>> from francy_adapter import FrancyAdapter
+>>> payload = FrancyAdapter().to_json(path_graph(3), base_id='c')
+>>> validate_payload(payload)
+{'nodes': 3, 'links': 2}
+>>> validate_payload(payload.replace('"type": "circle"', '"type": "hexagon"', 1))
+Traceback (most recent call last):
+...
+francy_validate.PayloadError: Node type must be one of: circle, diamond, square: line 1 column 330 (char 329)
+>>> validate_payload(payload.replace('"target": "c_node4"', '"target": "c_node9"'))
+Traceback (most recent call last):
+...
+francy_validate.PayloadError: Link end c_node9 is not a node: line 1 column 923 (char 922)
+>>> validate_payload(payload[:-2])
+Traceback (most recent call last):
+...
+francy_validate.PayloadError: Expecting '}' delimiter: line 1 column 1159 (char 1158)
+
+AUTHORS ::
+
+    Odile Bénassy
+
+"""
+import codecs
+import re
+from json import JSONDecoder
+from json.decoder import scanstring
+try:
+    from .francy_adapter import FRANCY_NODE_TYPES
+except:
+    from francy_adapter import FRANCY_NODE_TYPES # for doctesting
+FRANCY_GRAPH_TYPES = ['undirected', 'directed', 'tree']
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+WHITESPACE_CHARS = ' \t\n\r'
+STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]"]')  # Strings and brackets; a lone '"' opens a cut string
+NEXT_MEMBER = re.compile(r'[ \t\n\r]*,[ \t\n\r]*"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*')  # Simple keys only
+
+
+class PayloadError(ValueError):
+    r"""
+    An invalid payload, with the location of the error:
+    `pos` (a character offset), `lineno` and `colno`.
+    """
+    def __init__(self, msg, pos, lineno, colno):
+        super(PayloadError, self).__init__("%s: line %d column %d (char %d)" % (msg, lineno, colno, pos))
+        self.msg = msg
+        self.pos = pos
+        self.lineno = lineno
+        self.colno = colno
+
+
+class PayloadReader:
+    r"""
+    A JSON reader, over a string or a file read by chunks.
+
+    Test:
+
+    >>> import io
+    >>> r = PayloadReader(io.StringIO('{"a":\n [1, 2]}'), chunk_size=4)
+    >>> r.expect('{'), r.key(), r.expect(':'), r.value(), r.peek()
+    ('{', 'a', ':', [1, 2], '}')
+    >>> r.error("Here").lineno, r.error("Here").colno
+    (2, 8)
+    """
+    def __init__(self, payload, chunk_size=1 << 16):
+        r"""
+        Input:
+
+        * payload -- a string, or a file object (text or binary)
+        * chunk_size -- the size of the chunks read from a file
+        """
+        if hasattr(payload, 'read'):
+            self._file = payload
+            self._decoder = codecs.getincrementaldecoder('utf-8')()
+            self.buf = ''
+        else:
+            self._file = None
+            self.buf = payload
+        self.chunk_size = chunk_size
+        self.pos = 0  # In the buffer
+        self.offset = 0  # Characters dropped from the buffer
+        self.lines = 0  # Line breaks dropped from the buffer
+        self.line_start = 0  # Offset of the current line, when dropped
+        self._json = JSONDecoder()
+
+    def more(self):
+        r"""
+        Read another chunk, dropping what was read already.
+        Return False at the end of the payload.
+        """
+        if self._file is None:
+            return False
+        chunk = self._file.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk, not chunk)
+        if not chunk:
+            self._file = None
+            return False
+        dropped = self.buf[:self.pos]
+        n = dropped.count('\n')
+        if n:
+            self.lines += n
+            self.line_start = self.offset + dropped.rindex('\n') + 1
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def tell(self):
+        r"""
+        The current position, in characters from the start of the payload.
+        """
+        return self.offset + self.pos
+
+    def location(self, pos=None):
+        r"""
+        The (position, line, column) location of a position (by default, the current one),
+        still in the buffer.
+        """
+        if pos is None:
+            pos = self.tell()
+        rel = pos - self.offset
+        n = self.buf.count('\n', 0, rel)
+        if n:
+            return pos, self.lines + n + 1, rel - self.buf.rindex('\n', 0, rel)
+        return pos, self.lines + 1, pos - self.line_start + 1
+
+    def error(self, msg, where=None):
+        r"""
+        A PayloadError, at a position or location (by default, the current position).
+        """
+        if not isinstance(where, tuple):
+            where = self.location(where)
+        return PayloadError(msg, *where)
+
+    def peek(self):
+        r"""
+        The next character, after whitespace ('' at the end of the payload).
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.more():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, c, what=None):
+        r"""
+        Read a character.
+        """
+        if self.peek() != c:
+            raise self.error("Expecting %s" % (what or "'%s' delimiter" % c))
+        self.pos += 1
+        return c
+
+    def key(self):
+        r"""
+        Read an object key.
+        """
+        self.expect('"', "property name enclosed in double quotes")
+        while True:
+            try:
+                res, end = scanstring(self.buf, self.pos)
+            except ValueError as e:
+                if self.more():
+                    continue
+                raise self.error(e.msg, self.offset + e.pos)
+            self.pos = end
+            return res
+
+    def value(self):
+        r"""
+        Read a JSON value, and decode it.
+        An object, array or string cut by the end of the buffer is read
+        up to its end first, then decoded once.
+
+        Test:
+
+        >>> import io, json
+        >>> big = json.dumps({'menus': dict(('m%d' % i, {'title': 'x]}"'}) for i in range(1000))})
+        >>> r = PayloadReader(io.StringIO(big + ' 1'), chunk_size=100)
+        >>> r.value() == json.loads(big), r.value()
+        (True, 1)
+        >>> r = PayloadReader(io.StringIO(big[:-1]), chunk_size=100)
+        >>> r.value()
+        Traceback (most recent call last):
+        ...
+        francy_validate.PayloadError: Expecting ',' delimiter: line 1 column 27901 (char 27900)
+        """
+        scanned = False
+        while True:
+            try:
+                res, end = self._json.raw_decode(self.buf, self.pos)
+            except ValueError as e:
+                if self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE_CHARS:
+                    self.peek()
+                    continue
+                if not scanned and self.buf[self.pos:self.pos + 1] in ['{', '[', '"']:
+                    scanned = True
+                    self._extent()  # Then decoded again, once
+                    continue
+                if not scanned and self.more():
+                    continue
+                raise self.error(e.msg, self.offset + getattr(e, 'pos', self.pos))
+            if end == len(self.buf) and self.more():
+                continue  # A number may go on in the next chunk
+            self.pos = end
+            return res
+
+    def _extent(self):
+        r"""
+        Read up to the end of the object, array or string at the current position,
+        scanning each character once, whatever the number of chunks.
+        Return False at the end of the payload.
+        """
+        depth = 0
+        scan = self.pos
+        while True:
+            for m in STRUCTURE.finditer(self.buf, scan):
+                c = m.group()[0]
+                if c == '"' and m.end() - m.start() == 1:
+                    scan = m.start()  # A cut string: scanned again with the next chunk
+                    break
+                if c in '{[':
+                    depth += 1
+                elif c in '}]':
+                    depth -= 1
+                if depth <= 0:
+                    return True
+            else:
+                scan = len(self.buf)
+            scan -= self.pos
+            if not self.more():
+                return False
+            scan += self.pos
+
+    def members(self, member):
+        r"""
+        Read an object, member by member.
+
+        Input:
+
+        * member -- a function of the key, reading the value
+
+        Output:
+
+        The set of keys.
+        """
+        keys = set()
+        self.expect('{', "object")
+        if self.peek() == '}':
+            self.pos += 1
+            return keys
+        k = self.key()
+        while True:
+            keys.add(k)
+            self.expect(':')
+            self.peek()
+            member(k)
+            # Most often, the next key is a simple one, already in the buffer
+            m = NEXT_MEMBER.match(self.buf, self.pos)
+            while m:
+                self.pos = m.end()
+                k = m.group(1)
+                keys.add(k)
+                member(k)
+                m = NEXT_MEMBER.match(self.buf, self.pos)
+            if self.peek() == ',':
+                self.pos += 1
+                k = self.key()
+                continue
+            self.expect('}')
+            return keys
+
+
+def validate_payload(payload, chunk_size=1 << 16):
+    r"""
+    Check a Francy JSON payload, in one pass.
+
+    Input:
+
+    * payload -- a string, or a file object (text or binary)
+    * chunk_size -- the size of the chunks read from a file
+
+    Output:
+
+    The numbers of 'nodes' and 'links'. A PayloadError is raised at the first error.
+
+    Test:
+
+    >>> import io
+    >>> from networkx import path_graph
+    >>> from francy_adapter import FrancyAdapter
+    >>> payload = FrancyAdapter().to_json(path_graph(300), base_id='c', graphType='tree')
+    >>> validate_payload(io.BytesIO(payload.encode('utf-8')), chunk_size=100)
+    {'nodes': 300, 'links': 299}
+    >>> validate_payload('{"canvas": {"id": "c", "graph": null}}')
+    {'nodes': 0, 'links': 0}
+    >>> validate_payload('{"canvas": {"graph": null}}')
+    Traceback (most recent call last):
+    ...
+    francy_validate.PayloadError: Missing field 'id' in the canvas: line 1 column 12 (char 11)
+    >>> validate_payload('{"canvas": {"id": "c", "graph": null}} {}')
+    Traceback (most recent call last):
+    ...
+    francy_validate.PayloadError: Extra data: line 1 column 40 (char 39)
+    """
+    r = PayloadReader(payload, chunk_size)
+    ids = set()  # Node identifiers
+    pending = {}  # Link ends not yet seen as nodes -> their position
+    counts = {'nodes': 0, 'links': 0}
+    state = {'nodes_done': False}
+
+    def required(keys, fields, what, where):
+        for field in fields:
+            if field not in keys:
+                raise r.error("Missing field '%s' in %s" % (field, what), where)
+
+    def node(k):
+        pos = r.tell()
+        n = r.value()
+        if not isinstance(n, dict):
+            raise r.error("Expecting a node object", pos)
+        required(n, ['id'], "node %s" % k, pos)
+        if n['id'] != k:
+            raise r.error("Node id %s does not match its key %s" % (n['id'], k), pos)
+        if 'type' in n and n['type'] not in FRANCY_NODE_TYPES:
+            raise r.error("Node type must be one of: %s" % ', '.join(FRANCY_NODE_TYPES), pos)
+        ids.add(k)
+        counts['nodes'] += 1
+
+    def link(k):
+        pos = r.tell()
+        l = r.value()
+        if not isinstance(l, dict):
+            raise r.error("Expecting a link object", pos)
+        required(l, ['source', 'target'], "link %s" % k, pos)
+        for end in [l['source'], l['target']]:
+            if end not in ids:
+                if state['nodes_done']:
+                    raise r.error("Link end %s is not a node" % end, pos)
+                if end not in pending:  # Links before nodes: checked afterwards
+                    pending[end] = r.location(pos)
+        counts['links'] += 1
+
+    def graph_member(k):
+        if k == 'nodes':
+            r.members(node)
+            state['nodes_done'] = True
+            for end, where in sorted(pending.items(), key=lambda item: item[1]):
+                if end not in ids:
+                    raise r.error("Link end %s is not a node" % end, where)
+        elif k == 'links':
+            r.members(link)
+        elif k == 'type':
+            pos = r.tell()
+            if r.value() not in FRANCY_GRAPH_TYPES:
+                raise r.error("Graph type must be one of: %s" % ', '.join(FRANCY_GRAPH_TYPES), pos)
+        else:
+            r.value()
+
+    def canvas_member(k):
+        if k == 'graph' and r.peek() != 'n':
+            where = r.location()  # Dropped from the buffer, by the end of the graph
+            required(r.members(graph_member), ['id', 'nodes', 'links'], "the graph", where)
+        else:
+            r.value()
+
+    def top_member(k):
+        if k == 'canvas':
+            r.peek()
+            where = r.location()
+            required(r.members(canvas_member), ['id'], "the canvas", where)
+        else:
+            r.value()
+    r.peek()
+    where = r.location()
+    required(r.members(top_member), ['canvas'], "the payload", where)
+    if r.peek():
+        raise r.error("Extra data")
+    return counts
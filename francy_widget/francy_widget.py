@@ -10,10 +10,45 @@ AUTHORS ::
 from ipywidgets import register
 from ipywidgets.widgets.widget_string import Text
 from traitlets import Any
+import re
 try:
-    from .francy_adapter import FrancyAdapter
+    from .francy_adapter import FrancyAdapter, FrancyCanvas, GraphNode, FRANCY_NODE_TYPES, canvas_id
+    from .francy_callbacks import CallbackDispatcher
+    from .francy_cache import PayloadCache
+    from .francy_registry import registry as default_registry
+    from .francy_budget import degrade, DEGRADE_STEPS, DEGRADE_MESSAGES
+    from .francy_ids import IdMap
+    from .francy_validate import validate_payload, PayloadError
+    from .francy_svg import SVG_MIMETYPE
+    from .francy_history import History
+    from .francy_index import clear_cache
 except:
-    from francy_adapter import FrancyAdapter # for doctesting
+    from francy_adapter import FrancyAdapter, FrancyCanvas, GraphNode, FRANCY_NODE_TYPES, canvas_id # for doctesting
+    from francy_callbacks import CallbackDispatcher
+    from francy_cache import PayloadCache
+    from francy_registry import registry as default_registry
+    from francy_budget import degrade, DEGRADE_STEPS, DEGRADE_MESSAGES
+    from francy_ids import IdMap
+    from francy_validate import validate_payload, PayloadError
+    from francy_svg import SVG_MIMETYPE
+    from francy_history import History
+    from francy_index import clear_cache
+FRANCY_MIMETYPE = 'application/vnd.francy+json'
+PAYLOAD_CANVAS_ID = re.compile(r'"canvas": \{"id": "([^"]*)"')
+
+
+def rename_canvas(payload, old_id, new_id):
+    r"""
+    Give a new identifier to the canvas of a JSON payload,
+    and to all identifiers derived from it.
+
+    Test:
+
+    >>> rename_canvas('{"id": "c1", "graph": {"id": "c1_graph2", "title": "c1"}}', 'c1', 'c2')
+    '{"id": "c2", "graph": {"id": "c2_graph2", "title": "c2"}}'
+    """
+    return payload.replace('"%s"' % old_id, '"%s"' % new_id).replace(
+        '"%s_' % old_id, '"%s_' % new_id)
 
 @register
 class FrancyWidget(Text):
@@ -30,11 +65,36 @@ class FrancyWidget(Text):
     4
     """
     value = Any()  # should be a networkx graph
-    adapter = FrancyAdapter()
 
     def __init__(self, obj=None, title="", counter=-1, menus=[], messages=[],
-                 node_options=None, link_options=None, **kws):
+                 node_options=None, link_options=None, timeline=None,
+                 namespace=None, callback_cache_size=128, callback_executor=None,
+                 callback_timeout=None, cache=None, registry=None, payload_budget=None,
+                 node_budget=None, link_budget=None, degrade_steps=DEGRADE_STEPS,
+                 viewport=None, tile_level=3, mimetype=FRANCY_MIMETYPE, svg_options=None,
+                 history=False, **kws):
         r"""
+        Input:
+
+        * cache -- a PayloadCache object, or True for the default one:
+          payloads are kept on disk, across kernel restarts
+        * registry -- a WidgetRegistry object (default: the kernel-wide one),
+          accounting for the memory held by the widget
+        * payload_budget -- a number of bytes: the maximum payload size
+        * node_budget -- an integer: the maximum number of displayed nodes
+        * link_budget -- an integer: the maximum number of displayed links
+        * degrade_steps -- how the rendering may be degraded to fit the budgets
+          (see `francy_budget`); beyond that, rendering is refused
+        * viewport -- a window (x0, y0, x1, y1), for graphs with node coordinates:
+          the payload only holds the nodes in the tiles covering it, and the links between them;
+          panning fetches the other tiles (see `francy_spatial`)
+        * tile_level -- the tiles cut the graph bounds in 2^tile_level x 2^tile_level squares
+        * mimetype -- the display mimetype: the interactive Francy frontend,
+          or 'image/svg+xml' for a static SVG rendering, kernel-side (see `francy_svg`)
+        * svg_options -- a dictionary of options for the SVG rendering
+        * history -- a boolean, or a maximum number of snapshots: whether the states
+          of the canvas are recorded, to be restored (see `francy_history`)
+
         Test:
 
         >>> from networkx import Graph
@@ -46,6 +106,7 @@ class FrancyWidget(Text):
         super(FrancyWidget, self).__init__()
         self.value = obj
         self.title = title
+        self.adapter = FrancyAdapter()
         if counter > -1:
             self.adapter.counter = counter
         self.test_json = False
@@ -56,20 +117,84 @@ class FrancyWidget(Text):
         self.messages = messages
         self.node_options = node_options  # A function: node object -> dict of options
         self.link_options = link_options  # A function: link object -> dict of options
+        self.timeline = timeline  # A list of step changes
+        self.dispatcher = CallbackDispatcher(
+            namespace, callback_cache_size, executor=callback_executor, timeout=callback_timeout)
+        if cache is True:
+            cache = PayloadCache()
+        self.cache = cache
         self.draw_kws = kws  # width, height ..
-        self.json_data = None
+        self.json_data = None  # Serialized lazily, see `_invalidate`
+        self._canvas_ready = False  # Payloads read from the cache have no canvas yet
+        if registry is None:
+            registry = default_registry
+        self._registry = registry
+        registry.register(self)
+        self.payload_budget = payload_budget
+        self.node_budget = node_budget
+        self.link_budget = link_budget
+        self.degrade_steps = degrade_steps
+        self._id_map = None  # Stable identifiers, kept across renderings
+        self._visible = None  # Node identifiers shown by a filter (None: all nodes)
+        self.viewport = viewport
+        self.tile_level = tile_level
+        self._sent = None  # Tiles, nodes and links sent to the frontend, with a viewport
+        if mimetype not in [FRANCY_MIMETYPE, SVG_MIMETYPE]:
+            raise ValueError("Mimetype must be one of: %s, %s" % (FRANCY_MIMETYPE, SVG_MIMETYPE))
+        self.mimetype = mimetype
+        self.svg_options = svg_options or {}
+        self._history = None
+        if history:
+            self._history = History(None if history is True else history)
+        self.on_msg(self._handle_francy_msg)
+
+    @property
+    def json_data(self):
+        r"""
+        The JSON payload. After interactions, it is serialized again on demand.
+        """
+        if self._json_stale:
+            self._json_stale = False
+            self._json_data = self._canvas_json()
+        return self._json_data
+
+    @json_data.setter
+    def json_data(self, data):
+        self._json_data = data
+        self._json_stale = False
+
+    def _invalidate(self):
+        r"""
+        Drop the payload, after an interaction: it is serialized again when needed,
+        not on each change.
+        """
+        self._json_data = None
+        self._json_stale = True
 
     def validate(self, obj, obj_class=None):
         r"""
         Validate object type.
+        With `test_json`, the payload is checked in one pass (see `francy_validate`),
+        and the first error is kept as `payload_error`.
+
+        Test:
+
+        >>> w = FrancyWidget('{"canvas": {"id": "c", "graph": null}}', test_json=True)
+        >>> w.validate(w.value)
+        True
+        >>> w.validate('{"canvas": {"id": "c", "graph": {"id": "g", "nodes": {}}}}')
+        False
+        >>> w.payload_error
+        PayloadError("Missing field 'links' in the graph: line 1 column 33 (char 32)")
         """
         if self.test_json:
-            import json
             try:
-                json.loads(obj)
-            except IOError:
+                validate_payload(obj)
+            except PayloadError as e:
+                self.payload_error = e
                 return False
             else:
+                self.payload_error = None
                 return True
         if obj_class:
             return issubclass(obj.__class__, obj_class)
@@ -91,13 +216,50 @@ class FrancyWidget(Text):
         >>> w.set_value(G)
         >>> len(w.canvas_id)
         32
+
+        With stable identifiers, nodes and links that are still there keep their identifiers:
+
+        >>> w = FrancyWidget(G, stable_ids=True)
+        >>> w.make_json()
+        >>> graph = w.adapter.canvas.graph
+        >>> nodes, links = set(graph.nodes), set(graph.links)
+        >>> w.set_value(Graph([(1, 2), (2, 3), (3, 5)]))
+        >>> graph = w.adapter.canvas.graph
+        >>> len(nodes & set(graph.nodes)), len(links & set(graph.links))
+        (3, 2)
         """
-        if self.value and not self.validate(obj, self.value.__class__):
+        if self.test_json:
+            if not self.validate(obj):
+                raise self.payload_error  # With its location
+        elif self.value and not self.validate(obj, self.value.__class__):
             raise ValueError("Object %s is not compatible." % str(obj))
         self.value = obj
         self.make_json()
-        if not self.test_json:
-            self.canvas_id = self.adapter.canvas.id
+
+    def set_timeline(self, steps):
+        r"""
+        Set a timeline of step changes over the graph,
+        then make JSON output for the display.
+        The steps are only played by a frontend supporting
+        the 'timeline' canvas entry (see `francy_timeline`).
+
+        Input:
+
+        * steps -- a list of step changes (see FrancyTimeline)
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> G = Graph([(1, 2), (2, 3), (3, 4)])
+        >>> w = FrancyWidget(G, base_id='mycanvas')
+        >>> w.set_timeline([{'nodes': {n: {'color': 'red'}}} for n in G.nodes()])
+        >>> len(w.adapter.canvas.timeline)
+        4
+        >>> '"timeline": {"id": "mycanvas_timeline2"' in w.json_data
+        True
+        """
+        self.timeline = steps
+        self.make_json()
 
     def make_json(self):
         r"""
@@ -120,19 +282,649 @@ class FrancyWidget(Text):
         >>> w.make_json()
         >>> w.json_data
         '{"version": "1.1.3", "mime": "application/vnd.francy+json", "canvas": {"id": "mycanvas", "title": "A small, but rich graph", "width": 800.0, "height": 100.0, "zoomToFit": true, "texTypesetting": false, "graph": {"id": "mycanvas_graph2", "simulation": true, "collapsed": true, "drag": false, "showNeighbours": false, "nodes": {"mycanvas_node3": {"id": "mycanvas_node3", "x": 0, "y": 0, "type": "square", "size": 10, "title": "1", "color": "", "highlight": true, "layer": 3, "parent": "", "menus": {"mycanvas_menu4": {"id": "mycanvas_menu4", "title": "cardinality", "callback": {"id": "mycanvas_callback4", "funcname": "cardinality", "trigger": "click", "knownArgs": ["python", "<object>"], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node4": {"id": "mycanvas_node4", "x": 0, "y": 0, "type": "square", "size": 10, "title": "2", "color": "", "highlight": true, "layer": 4, "parent": "", "menus": {"mycanvas_menu5": {"id": "mycanvas_menu5", "title": "cardinality", "callback": {"id": "mycanvas_callback5", "funcname": "cardinality", "trigger": "click", "knownArgs": ["python", "<object>"], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node5": {"id": "mycanvas_node5", "x": 0, "y": 0, "type": "square", "size": 10, "title": "3", "color": "", "highlight": true, "layer": 5, "parent": "", "menus": {"mycanvas_menu6": {"id": "mycanvas_menu6", "title": "cardinality", "callback": {"id": "mycanvas_callback6", "funcname": "cardinality", "trigger": "click", "knownArgs": ["python", "<object>"], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}, "mycanvas_node6": {"id": "mycanvas_node6", "x": 0, "y": 0, "type": "square", "size": 10, "title": "4", "color": "", "highlight": true, "layer": 6, "parent": "", "menus": {"mycanvas_menu7": {"id": "mycanvas_menu7", "title": "cardinality", "callback": {"id": "mycanvas_callback7", "funcname": "cardinality", "trigger": "click", "knownArgs": ["python", "<object>"], "requiredArgs": {}}, "menus": {}, "messages": {}}}, "messages": {}, "callbacks": {}}}, "links": {"mycanvas_edge7": {"source": "mycanvas_node3", "weight": 1, "color": "", "target": "mycanvas_node4", "id": "mycanvas_edge7"}, "mycanvas_edge8": {"source": "mycanvas_node4", "weight": 1, "color": "", "target": "mycanvas_node5", "id": "mycanvas_edge8"}, "mycanvas_edge9": {"source": "mycanvas_node5", "weight": 1, "color": "", "target": "mycanvas_node6", "id": "mycanvas_edge9"}}, "type": "undirected"}, "menus": {}, "messages": {}}}'
+
+        With budgets, the rendering is degraded to fit them, or refused:
+
+        >>> from networkx import barabasi_albert_graph
+        >>> G = barabasi_albert_graph(3000, 2, seed=1)
+        >>> w = FrancyWidget(G, payload_budget=300000)
+        >>> w.make_json()
+        >>> len(w.json_data) < 300000, len(w.adapter.canvas.graph.nodes) < 3000
+        (True, True)
+        >>> [m.title for m in w.adapter.canvas.messages.values()]
+        ['Sample', 'Degraded rendering']
+        >>> import tempfile
+        >>> cache = PayloadCache(tempfile.mkdtemp())
+        >>> FrancyWidget(G, cache=cache).make_json()
+        >>> w = FrancyWidget(G, cache=cache, payload_budget=300000)
+        >>> w.make_json()
+        >>> len(w.json_data) < 300000, len(cache)
+        (True, 2)
+        >>> FrancyWidget(G, link_budget=100, degrade_steps=[]).make_json()
+        Traceback (most recent call last):
+        ...
+        ValueError: The graph has 3000 nodes and 5996 links (about 2.2 MB), over budget (100 links); try a sample
         """
         if self.test_json:
             self.json_data = self.value
+            return
+        clear_cache(self.value)  # The graph may have been changed in place
+        kws = dict(self.draw_kws)
+        if self.timeline:
+            kws['timeline'] = self.timeline
+        kws.update(title=self.title, menus=self.menus, messages=self.messages,
+                   node_options=self.node_options, link_options=self.link_options)
+        stable = kws.get('stable_ids') or kws.get('node_key') or kws.get('id_map')
+        if stable and not kws.get('base_id') and getattr(self, 'canvas_id', None):
+            kws['base_id'] = self.canvas_id  # Same canvas, same identifiers
+        # Canvases displayed as SVG are not serialized
+        svg = self.mimetype == SVG_MIMETYPE
+        use_cache = self.cache is not None and self.viewport is None and not svg
+        if use_cache:
+            key_kws = dict(kws)
+            if self.payload_budget or self.node_budget or self.link_budget:
+                # Degraded renderings are cached apart
+                key_kws.update(payload_budget=self.payload_budget, node_budget=self.node_budget,
+                               link_budget=self.link_budget, degrade_steps=self.degrade_steps)
+            try:
+                key = self.cache.key(self.value, **key_kws)
+            except ValueError:  # Some option has no stable identity
+                use_cache = False
+        if use_cache:
+            payload = self.cache.get(key)
+            if payload is not None:
+                cached_id = PAYLOAD_CANVAS_ID.search(payload, 0, 1000).group(1)
+                if kws.get('base_id'):
+                    self.canvas_id = cached_id
+                else:
+                    # A canvas of its own, not the one of the widget that cached the payload
+                    self.canvas_id = canvas_id()
+                    while self.canvas_id == cached_id:
+                        self.canvas_id = canvas_id()
+                    payload = rename_canvas(payload, cached_id, self.canvas_id)
+                self.json_data = payload
+                self._canvas_ready = False
+                self._registry.update(self)
+                return
+        if stable and not kws.get('id_map'):
+            if self._id_map is None:
+                self._id_map = IdMap(kws.get('node_key'))
+            kws['id_map'] = self._id_map
+        steps = []
+        if self.payload_budget or self.node_budget or self.link_budget:
+            # Estimated before rendering
+            kws, estimate, steps = degrade(self.value, payload_budget=self.payload_budget,
+                                           node_budget=self.node_budget, link_budget=self.link_budget,
+                                           steps=self.degrade_steps, **kws)
+        if self.viewport is None and not svg:
+            self.json_data = self.adapter.to_json(self.value, **kws)
         else:
-            self.json_data = self.adapter.to_json(
-                self.value,
-                title=self.title,
-                menus=self.menus,
-                messages=self.messages,
-                node_options=self.node_options,
-                link_options=self.link_options,
-                **self.draw_kws
-            )
+            self.adapter.to_dict(self.value, **kws)
+        if steps:
+            self.adapter.canvas.add_message(
+                "To fit the budget, %s." % ', '.join(DEGRADE_MESSAGES[s] for s in steps),
+                'warning', 'Degraded rendering')
+        if svg:
+            self._invalidate()
+        elif steps or self.viewport is not None:
+            self._sent = None
+            self.json_data = self._canvas_json()
+        self.dispatcher.attach(self.adapter.canvas.graph)
+        self._visible = None  # All nodes
+        if self._history is not None:
+            self._history = History(self._history.max_snapshots)
+            self._record('render')
+        self.canvas_id = self.adapter.canvas.id
+        self._canvas_ready = True
+        if use_cache:
+            self.cache.put(key, self.json_data)
+        self._registry.update(self)
+
+    def release(self):
+        r"""
+        Release the derived state of the widget: the JSON payload, and the computed canvas.
+        They are computed again when needed, with the same identifiers.
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> w = FrancyWidget(Graph([(1, 2)]), base_id='mycanvas')
+        >>> w.make_json()
+        >>> data = w.json_data
+        >>> w.release()
+        >>> w.json_data, w.adapter.canvas.graph
+        (None, None)
+        >>> w.canvas().graph.nodes['mycanvas_node3']['title']
+        '1'
+        >>> w.json_data == data
+        True
+        """
+        self.json_data = None
+        self.adapter.canvas = FrancyCanvas()
+        self.dispatcher.attach(None)
+        self._canvas_ready = False
+
+    def canvas(self):
+        r"""
+        The canvas object, computed again when the payload was read from the cache.
+
+        Test:
+
+        >>> import tempfile
+        >>> from networkx import Graph
+        >>> cache = PayloadCache(tempfile.mkdtemp())
+        >>> w = FrancyWidget(Graph([(1, 2)]), cache=cache)
+        >>> w.make_json()
+        >>> len(cache)
+        1
+        >>> w2 = FrancyWidget(Graph([(1, 2)]), cache=cache)
+        >>> w2.make_json()
+        >>> w2.canvas_id == w.canvas_id, w2.adapter.canvas.graph
+        (False, None)
+        >>> w2.json_data == w.json_data.replace(w.canvas_id, w2.canvas_id)
+        True
+        >>> w2.canvas().to_json() == w.adapter.canvas.to_json().replace(w.canvas_id, w2.canvas_id)
+        True
+
+        Options are known by their contents, functions by their code:
+
+        >>> from networkx import grid_2d_graph
+        >>> G = grid_2d_graph(3, 3)
+        >>> FrancyWidget(G, cache=cache, node_options=lambda n: {'color': 'red'}).make_json()
+        >>> w = FrancyWidget(G, cache=cache, node_options=lambda n: {'color': 'blue'})
+        >>> w.make_json()
+        >>> '"blue"' in w.json_data, '"red"' in w.json_data
+        (True, False)
+        >>> FrancyWidget(G, cache=cache, positions=dict((n, n) for n in G)).make_json()
+        >>> len(cache)
+        4
+        """
+        if not self._canvas_ready:
+            # Same identifiers as in the cached payload
+            draw_kws, cache, visible, sent = self.draw_kws, self.cache, self._visible, self._sent
+            history = self._history
+            if getattr(self, 'canvas_id', None):
+                self.draw_kws = dict(draw_kws, base_id=self.canvas_id)
+            self.cache = None
+            try:
+                self.make_json()
+            finally:
+                self.draw_kws, self.cache = draw_kws, cache
+                self._visible, self._sent = visible, sent  # As displayed
+            if history is not None and len(history):
+                # As recorded
+                self._history = history
+                history.reapply(self.adapter.canvas.graph)
+                self._invalidate()
+        return self.adapter.canvas
+
+    def expand(self, node):
+        r"""
+        Display the neighbours of a node, that were not displayed yet.
+        Only the new nodes and links are sent to the frontend.
+
+        Input:
+
+        * node -- a math object, or a node identifier
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> w = FrancyWidget(path_graph(10), base_id='mycanvas', focus=0, max_nodes=3)
+        >>> w.make_json()
+        >>> sorted(w.expand(1)['nodes'])
+        ['mycanvas_node6']
+        >>> w._json_data is None  # serialized on demand only
+        True
+        >>> w.json_data.count('"title"')  # the canvas, and three nodes
+        4
+
+        After changes of the graph in place, it is rendered again:
+
+        >>> G = path_graph(5)
+        >>> w = FrancyWidget(G, focus=0)
+        >>> w.make_json()
+        >>> G.remove_edge(0, 1)
+        >>> G.add_edge(0, 3)
+        >>> w.make_json()
+        >>> sorted(node['title'] for node in w.adapter.canvas.graph.nodes.values())
+        ['0', '3']
+        """
+        delta = self.canvas().graph.expand(node)
+        if self._sent is not None:
+            self._sent['nodes'].update(delta['nodes'])
+            self._sent['links'].update(delta['links'])
+        self._invalidate()
+        self._registry.update(self)
+        self._record('expand', delta['nodes'], delta['links'])
+        self.send({
+            'action': 'expand',
+            'canvas': self.adapter.canvas.id,
+            'nodes': delta['nodes'],
+            'links': delta['links']
+        })
+        return delta
+
+    def _canvas_json(self):
+        r"""
+        The payload of the canvas; with a viewport, only the tiles covering it.
+        The first time, these tiles are recorded as sent.
+        """
+        if self.viewport is None:
+            return self.adapter.canvas_json()
+        sent = {'tiles': set(), 'nodes': set(), 'links': set()}
+        delta = self._tiles(self.viewport, sent)
+        if self._sent is None:
+            self._sent = sent
+        return self.adapter.canvas_json(delta['nodes'], delta['links'])
+
+    def _tiles(self, window, sent):
+        r"""
+        The tiles covering a window that were not sent yet, their nodes,
+        and their links to the nodes sent; they are recorded as sent.
+        """
+        index = self.adapter.canvas.spatial()
+        tiles = [t for t in index.tiles(*window, level=self.tile_level) if t not in sent['tiles']]
+        nodes = [ident for t in tiles for ident in index.tile(*t) if ident not in sent['nodes']]
+        links = [ident for ident in index.links(nodes, sent['nodes']) if ident not in sent['links']]
+        sent['tiles'].update(tiles)
+        sent['nodes'].update(nodes)
+        sent['links'].update(links)
+        return {'tiles': tiles, 'nodes': nodes, 'links': links}
+
+    def to_svg(self, out=None, **kws):
+        r"""
+        A static SVG rendering of the canvas (see `francy_svg`).
+
+        Input:
+
+        * out -- a file path, or a file object, to write the SVG document to, as a stream
+        * kws -- options for the SVG rendering (default: `svg_options`)
+
+        Output:
+
+        The SVG document, as a string, when there is no `out`.
+
+        Test:
+
+        >>> from networkx import star_graph
+        >>> w = FrancyWidget(star_graph(4), positions=lambda G: dict((n, (n, n % 2)) for n in G),
+        ...                  mimetype='image/svg+xml', svg_options={'labels': True})
+        >>> svg = w.to_svg()
+        >>> svg.count('<circle'), svg.count('<line'), svg.count('<text')
+        (5, 4, 5)
+        >>> w._json_data is None  # not serialized
+        True
+        >>> FrancyWidget(star_graph(4), mimetype='image/png')
+        Traceback (most recent call last):
+        ...
+        ValueError: Mimetype must be one of: application/vnd.francy+json, image/svg+xml
+        """
+        try:
+            from .francy_svg import render_svg, write_svg
+        except:
+            from francy_svg import render_svg, write_svg # for doctesting
+        options = dict(self.svg_options, **kws)
+        if out is None:
+            return render_svg(self.canvas(), **options)
+        write_svg(self.canvas(), out, **options)
+
+    def pan(self, x0, y0, x1, y1):
+        r"""
+        Move the viewport to a window. With a viewport, the frontend gets
+        the tiles covering the window that were not sent yet;
+        in all cases, it gets aggregated markers for the nodes outside the window.
+
+        Input:
+
+        * x0, y0, x1, y1 -- the window bounds
+
+        Output:
+
+        A dictionary with the new 'tiles', 'nodes' and 'links', and the 'markers'.
+
+        Test:
+
+        >>> from networkx import grid_2d_graph
+        >>> G = grid_2d_graph(20, 20)
+        >>> positions = dict((n, (10 * n[0], 10 * n[1])) for n in G)
+        >>> w = FrancyWidget(G, positions=positions, viewport=(0, 0, 40, 40), tile_level=2)
+        >>> w.make_json()
+        >>> w.json_data.count('"source"'), w.json_data.count('"type": "circle"')
+        (40, 25)
+        >>> delta = w.pan(30, 0, 70, 40)
+        >>> delta['tiles'], len(delta['nodes']), len(delta['links'])
+        ([(2, 1, 0)], 25, 45)
+        >>> w.pan(10, 10, 60, 30)['tiles'], sum(m['count'] for m in delta['markers'])
+        ([], 375)
+        """
+        canvas = self.canvas()
+        window = (x0, y0, x1, y1)
+        if self._sent is None:
+            delta = {'tiles': [], 'nodes': [], 'links': []}  # Everything was sent
+        else:
+            delta = self._tiles(window, self._sent)
+        graph = canvas.graph
+        delta['markers'] = canvas.spatial().tree.markers(*window)
+        self.send({
+            'action': 'viewport',
+            'canvas': canvas.id,
+            'nodes': dict((ident, graph.nodes[ident]) for ident in delta['nodes']),
+            'links': dict((ident, graph.links[ident]) for ident in delta['links']),
+            'markers': delta['markers']
+        })
+        return delta
+
+    def filter(self, *conditions, **kws):
+        r"""
+        Only show the nodes satisfying some conditions (see `francy_query`).
+        Only the visibility changes are sent to the frontend.
+
+        Input:
+
+        * conditions -- (attribute, operator, value) triples; none to show all nodes
+        * within -- a list of node identifiers, to select from
+
+        Output:
+
+        A dictionary with the node identifiers to 'show' and to 'hide'.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> w = FrancyWidget(path_graph(4), base_id='mycanvas')
+        >>> w.make_json()
+        >>> w.filter(('layer', '>', 4))
+        {'show': [], 'hide': ['mycanvas_node3', 'mycanvas_node4']}
+        >>> w.filter(('layer', '<', 4))
+        {'show': ['mycanvas_node3'], 'hide': ['mycanvas_node5', 'mycanvas_node6']}
+        >>> w.filter()
+        {'show': ['mycanvas_node4', 'mycanvas_node5', 'mycanvas_node6'], 'hide': []}
+        """
+        query = self.canvas().graph.query()
+        nodes = query.nodes(*conditions, **kws)
+        delta = query.visibility(nodes, self._visible)
+        self._visible = None if not conditions and kws.get('within') is None else nodes
+        self._record('filter', [], [])
+        self.send({
+            'action': 'filter',
+            'canvas': self.adapter.canvas.id,
+            'show': delta['show'],
+            'hide': delta['hide']
+        })
+        return delta
+
+    def restyle(self, nodes, **options):
+        r"""
+        Change options of some nodes (color, size, type ..),
+        and send the new nodes to the frontend.
+
+        Input:
+
+        * nodes -- a list of node identifiers
+        * options -- node options
+
+        Output:
+
+        A dictionary: node identifier -> new node.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> w = FrancyWidget(path_graph(3), base_id='mycanvas')
+        >>> w.make_json()
+        >>> w.restyle(['mycanvas_node3'], color='red')['mycanvas_node3']['color']
+        'red'
+        >>> w.json_data.count('"color": "red"')
+        1
+        >>> w.restyle(['mycanvas_node3'], type='hexagon')
+        Traceback (most recent call last):
+        ...
+        TypeError: Node type must be one of: circle, diamond, square
+        """
+        if 'type' in options and options['type'] not in FRANCY_NODE_TYPES:
+            raise TypeError("Node type must be one of: %s" % ', '.join(FRANCY_NODE_TYPES))
+        graph = self.canvas().graph
+        res = {}
+        for ident in nodes:
+            # A new record: the former one may be held by history snapshots
+            res[ident] = graph.nodes[ident] = GraphNode(**dict(graph.nodes[ident], **options))
+        graph._query = None
+        self._invalidate()
+        self._registry.update(self)
+        self._record('restyle', list(res), [])
+        self.send({
+            'action': 'restyle',
+            'canvas': self.adapter.canvas.id,
+            'nodes': res
+        })
+        return res
+
+    def _record(self, label, nodes=None, links=None):
+        r"""
+        Record the state of the canvas, with history.
+        """
+        if self._history is not None:
+            self._history.record(self.adapter.canvas.graph, nodes, links, self._visible, label)
+
+    def snapshots(self):
+        r"""
+        The labels of the recorded snapshots, and the index of the current one.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> w = FrancyWidget(path_graph(10), base_id='mycanvas', focus=0, radius=1, history=True)
+        >>> w.make_json()
+        >>> _ = w.expand(1)
+        >>> _ = w.restyle(['mycanvas_node3'], color='red')
+        >>> _ = w.filter(('color', '==', 'red'))
+        >>> w.snapshots()
+        (['render', 'expand', 'restyle', 'filter'], 3)
+        >>> sorted(w.undo().items())
+        [('hide', []), ('links', {}), ('nodes', {}), ('remove_links', []), ('remove_nodes', []), ('show', ['mycanvas_node4', 'mycanvas_node6'])]
+        >>> diff = w.restore(0)
+        >>> diff['nodes']['mycanvas_node3']['color'], diff['remove_nodes']
+        ('', ['mycanvas_node6'])
+        >>> w.json_data.count('"title"')  # the canvas, and two nodes
+        3
+        >>> w.redo()['remove_nodes'], w.snapshots()[1]
+        ([], 1)
+        >>> w.release()
+        >>> len(w.canvas().graph.nodes)  # computed again, as recorded
+        3
+        >>> _ = w.expand(2)
+        >>> w.snapshots()
+        (['render', 'expand', 'expand'], 2)
+        """
+        if self._history is None:
+            return [], None
+        return [snap.label for snap in self._history.snapshots], self._history.current
+
+    def restore(self, index):
+        r"""
+        Bring the canvas back to a recorded snapshot.
+        Only the difference with the current display is sent to the frontend.
+
+        Input:
+
+        * index -- the index of a snapshot (see `snapshots`)
+
+        Output:
+
+        The changes (see `francy_history.History.diff`).
+        """
+        canvas = self.canvas()
+        history = self._history
+        if history is None or not 0 <= index < len(history):
+            raise IndexError("No such snapshot: %s" % index)
+        diff = history.restore(canvas.graph, index)
+        visible = history.snapshots[index].visible
+        self._visible = None if visible is None else sorted(visible)
+        canvas._spatial = None
+        if self._sent is not None:
+            self._sent['nodes'].update(diff['nodes'])
+            self._sent['nodes'].difference_update(diff['remove_nodes'])
+            self._sent['links'].update(diff['links'])
+            self._sent['links'].difference_update(diff['remove_links'])
+        self._invalidate()
+        self._registry.update(self)
+        content = {'action': 'restore', 'canvas': canvas.id}
+        content.update(diff)
+        self.send(content)
+        return diff
+
+    def undo(self):
+        r"""
+        Restore the previous snapshot.
+        """
+        if self._history is None or not self._history.current:
+            raise IndexError("Nothing to undo")
+        return self.restore(self._history.current - 1)
+
+    def redo(self):
+        r"""
+        Restore the next snapshot, after an undo.
+        """
+        if self._history is None or self._history.current is None \
+           or self._history.current + 1 >= len(self._history):
+            raise IndexError("Nothing to redo")
+        return self.restore(self._history.current + 1)
+
+    def labels(self, nodes):
+        r"""
+        Send the full titles of some nodes to the frontend, with lazy labels
+        (for the nodes that are shown or hovered).
+        The frontend asks for them with a 'labels' action, listing the 'nodes';
+        the stock Francy frontend does not, and only displays the shortened titles.
+
+        Input:
+
+        * nodes -- a list of node identifiers
+
+        Output:
+
+        A dictionary: node identifier -> title.
+
+        Test:
+
+        >>> from networkx import path_graph
+        >>> def node_options(n):
+        ...   return {'title': "Subgroup number %d" % n}
+        >>> w = FrancyWidget(path_graph(1000), base_id='mycanvas', node_options=node_options,
+        ...                  lazy_labels=True)
+        >>> w.make_json()
+        >>> w.json_data.count('"title": "Subgroup ..."')  # all nodes
+        1000
+        >>> w.labels(['mycanvas_node3', 'mycanvas_node4'])
+        {'mycanvas_node3': 'Subgroup number 0', 'mycanvas_node4': 'Subgroup number 1'}
+        """
+        graph = self.canvas().graph
+        res = dict((ident, graph.label(ident)) for ident in nodes if ident in graph.nodes)
+        self.send({
+            'action': 'labels',
+            'canvas': self.adapter.canvas.id,
+            'labels': res
+        })
+        return res
+
+    def callback(self, node, funcname, knownArgs=[], requiredArgs={}):
+        r"""
+        Run a callback triggered from a node menu.
+        Its progress and result are pushed to the canvas as messages.
+        When the widget has a callback executor, the callback runs on a worker pool,
+        and does not block the kernel.
+
+        Input:
+
+        * node -- a node identifier
+        * funcname -- a string
+        * knownArgs -- a list of arguments, where "<object>" stands for the node object
+        * requiredArgs -- a dictionary of keyword arguments
+
+        Output:
+
+        A task identifier.
+
+        Test:
+
+        >>> from networkx import Graph
+        >>> w = FrancyWidget(Graph([(1, 2)]), base_id='mycanvas', namespace={'double': lambda x: 2 * x})
+        >>> w.make_json()
+        >>> task = w.callback('mycanvas_node4', 'double', ['<object>'])
+        >>> w.dispatcher.status(task)
+        {'id': 1, 'node': 'mycanvas_node4', 'funcname': 'double', 'status': 'done', 'result': 4}
+        >>> [m.to_dict() for m in w.adapter.canvas.messages.values()]
+        [{'id': 'mycanvas_message3', 'type': 'success', 'title': 'double', 'text': '4'}]
+        """
+        self.canvas()  # Resolve nodes
+        return self.dispatcher.submit(node, funcname, knownArgs, requiredArgs,
+                                      notify=self._notify_callback)
+
+    def cancel(self, task_id):
+        r"""
+        Cancel a running callback.
+
+        Input:
+
+        * task_id -- a task identifier
+        """
+        return self.dispatcher.cancel(task_id)
+
+    def _notify_callback(self, task):
+        r"""
+        Push the progress or the result of a callback to the canvas, as a message.
+        In a notebook, this runs on the kernel thread, not on the workers
+        (see `CallbackDispatcher.submit`).
+        """
+        status = task['status']
+        if status == 'running':
+            msgType, text = 'info', "Running ..."
+        elif status == 'done':
+            msgType, text = 'success', str(task['result'])
+        elif status == 'error':
+            msgType, text = 'error', repr(task['error'])
+        else:
+            msgType, text = 'warning', status.capitalize()
+        self.add_message(text, msgType, task['funcname'], task=task['id'], status=status)
+
+    def add_message(self, text, msgType="default", title="", **kws):
+        r"""
+        Add a message to the canvas, and push it to the frontend.
+
+        Input:
+
+        * text -- a string
+        * msgType -- message type
+        * title -- a string
+        * kws -- other entries for the frontend
+        """
+        canvas = self.canvas()
+        msg = canvas.add_message(text, msgType, title)
+        self._invalidate()
+        self._registry.update(self)
+        content = {'action': 'message', 'canvas': canvas.id, 'message': msg.to_dict()}
+        content.update(kws)
+        self.send(content)
+        return msg
+
+    def _handle_francy_msg(self, widget, content, buffers=None):
+        r"""
+        Handle a custom message from the frontend.
+        Such messages are dictionaries, with an 'action' key.
+        """
+        action = content.get('action')
+        if action == 'expand':
+            self.expand(content['node'])
+        elif action == 'callback':
+            self.callback(content['node'], content['funcname'],
+                          content.get('knownArgs', []), content.get('requiredArgs', {}))
+        elif action == 'cancel':
+            self.cancel(content['task'])
+        elif action == 'labels':
+            self.labels(content['nodes'])
+        elif action == 'viewport':
+            self.pan(*content['window'])
 
     def _ipython_display_(self, **kws):
         """Called when `IPython.display.display` is called on the widget."""
@@ -140,17 +932,32 @@ class FrancyWidget(Text):
             plaintext = repr(self)
             if len(plaintext) > 110:
                 plaintext = plaintext[:110] + '…'
-            if not self.json_data:
-                self.make_json()
+            released = self._json_data is None and not self._json_stale
+            if self.mimetype == SVG_MIMETYPE:
+                self.canvas()  # Computed without its JSON payload
+            elif released and self._history is not None and len(self._history):
+                self.canvas()  # Computed again as recorded, after a release
+            elif released:
+                self.make_json()  # Computed again, after a release
+            elif self.viewport is not None:
+                self._sent = None  # A new view, with the first tiles only
+                self._invalidate()
+            self._registry.touch(self)
             # The 'application/vnd.francy+json' mimetype has not been registered yet.
             # See the registration process and naming convention at
             # http://tools.ietf.org/html/rfc6838
             # and the currently registered mimetypes at
             # http://www.iana.org/assignments/media-types/media-types.xhtml.
-            data = {
-                'text/plain': plaintext,
-                'application/vnd.francy+json': self.json_data
-            }
+            if self.mimetype == SVG_MIMETYPE:
+                data = {
+                    'text/plain': plaintext,
+                    SVG_MIMETYPE: self.to_svg()
+                }
+            else:
+                data = {
+                    'text/plain': plaintext,
+                    FRANCY_MIMETYPE: self.json_data
+                }
 
             display(data, raw=True)  # noqa
 
@@ -35,7 +35,11 @@ setup_args = {
     'keywords': ['jupyter', 'widget', 'graph', 'francy'],
     'packages': ['francy_widget'],
     'zip_safe': False,
-    'install_requires': ['pip', 'ipywidgets>=7.0.0', 'networkx', 'jupyter-francy', 'Sphinx']
+    'entry_points': {
+        'console_scripts': ['francy-export = francy_widget.francy_export:main'],
+    },
+    'install_requires': ['pip', 'ipywidgets>=7.0.0', 'networkx', 'jupyter-francy', 'Sphinx'],
+    'extras_require': {'styles': ['numpy', 'pandas']},
 }
 
 setup(**setup_args)